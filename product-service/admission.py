@@ -0,0 +1,221 @@
+import asyncio
+import os
+import re
+import time
+from collections import deque
+from typing import Dict, Optional
+
+from starlette.responses import JSONResponse
+
+from metrics import REJECTED_CLASS, Histogram
+
+# ==================== Admission Control ====================
+# Under overload, every route competes for the same threadpool and connection
+# pool, so a burst of search scans can hold up stock decrements until both time
+# out. Each request is classed by method and path before it reaches a route:
+#
+#   stock    stock mutations, reservations and availability (checkout path)
+#   write    other catalog writes (create, update, delete, import, bulk updates)
+#   detail   single-product/category reads, batch lookups and typeahead
+#   listing  listings, search, filters, export, the change feed and stats
+#
+# A class runs at most `limit` requests at once, and all classes together at most
+# ADMISSION_MAX_CONCURRENCY (the threadpool size by default). A request that
+# cannot start waits in its class queue; freed slots go to the queues in priority
+# order (stock first). A full queue, or a wait longer than the class timeout, is
+# answered at once with 503 and Retry-After instead of adding to the latency.
+# /, /health, /metrics and the docs are never held back.
+#
+# The controller lives on the event loop, so it needs no locks; each worker
+# process admits its own requests.
+
+PRIORITY = ("stock", "write", "detail", "listing")
+
+# Per class: (concurrent requests, waiting requests, longest wait in ms), each
+# overridable with ADMISSION_<CLASS>_LIMIT / _QUEUE / _TIMEOUT_MS
+DEFAULTS = {
+    "stock": (40, 200, 5000),
+    "write": (8, 32, 2000),
+    "detail": (32, 100, 1000),
+    "listing": (12, 24, 500),
+}
+
+MAX_CONCURRENCY = int(os.getenv("ADMISSION_MAX_CONCURRENCY", "40"))  # 0 turns admission control off
+RETRY_AFTER_SECONDS = int(os.getenv("ADMISSION_RETRY_AFTER", "1"))
+
+_EXEMPT = {"/", "/health", "/metrics", "/cache/stats", "/docs", "/redoc", "/openapi.json", "/docs/oauth2-redirect"}
+_READ_METHODS = {"GET", "HEAD"}
+_STOCK = (
+    (None, re.compile(r"^/reservations(/[^/]+)?$")),
+    ({"PATCH"}, re.compile(r"^/products/[^/]+/stock(/decrease)?$")),
+    ({"POST"}, re.compile(r"^/products/stock/decrease$")),
+    (_READ_METHODS, re.compile(r"^/products/[^/]+/availability$")),
+)
+_DETAIL = re.compile(r"^/(products|categories)/\d+$|^/products/(batch|suggest)$")
+
+def classify(method: str, path: str) -> Optional[str]:
+    """Admission class of a request, or None for requests that are never held back"""
+    if path in _EXEMPT:
+        return None
+    for methods, pattern in _STOCK:
+        if (methods is None or method in methods) and pattern.match(path):
+            return "stock"
+    if path == "/products/batch":
+        return "detail"
+    if method not in _READ_METHODS:
+        return "write"
+    return "detail" if _DETAIL.match(path) else "listing"
+
+class RequestClass:
+    """Limits, queue and counters of one admission class"""
+
+    def __init__(self, name: str, limit: int, queue: int, timeout: float):
+        self.name = name
+        self.limit = limit
+        self.queue = queue
+        self.timeout = timeout
+        self.active = 0
+        self.waiters: deque = deque()
+        self.admitted = 0
+        self.queued = 0
+        self.rejected = {"queue_full": 0, "timeout": 0}
+        self.wait = Histogram()
+
+    @classmethod
+    def from_env(cls, name: str) -> "RequestClass":
+        limit, queue, timeout_ms = DEFAULTS[name]
+        prefix = f"ADMISSION_{name.upper()}_"
+        return cls(name, int(os.getenv(prefix + "LIMIT", limit)), int(os.getenv(prefix + "QUEUE", queue)),
+                   float(os.getenv(prefix + "TIMEOUT_MS", timeout_ms)) / 1000)
+
+class AdmissionController:
+    """Per-class concurrency limits with bounded, priority-ordered wait queues"""
+
+    def __init__(self, max_concurrency: int, classes: Dict[str, RequestClass]):
+        self.max_concurrency = max_concurrency
+        self.classes = classes
+        self.active = 0
+
+    @classmethod
+    def from_env(cls) -> "AdmissionController":
+        return cls(MAX_CONCURRENCY, {name: RequestClass.from_env(name) for name in PRIORITY})
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_concurrency > 0
+
+    async def acquire(self, name: str) -> Optional[str]:
+        """Take a slot in class `name`, waiting if need be. Returns None once admitted, or why the
+        request is rejected ("queue_full" or "timeout")."""
+        request_class = self.classes[name]
+        # Waiters go first, so a newcomer never overtakes its own class queue
+        if not request_class.waiters and self._has_room(request_class):
+            self._admit(request_class)
+            return None
+        if len(request_class.waiters) >= request_class.queue:
+            request_class.rejected["queue_full"] += 1
+            return "queue_full"
+
+        loop = asyncio.get_running_loop()
+        waiter = loop.create_future()
+        request_class.waiters.append(waiter)
+        request_class.queued += 1
+        started = time.perf_counter()
+        timer = loop.call_later(request_class.timeout, self._expire, request_class, waiter)
+        try:
+            admitted = await waiter
+        except asyncio.CancelledError:
+            # The client went away (or the server is stopping) while waiting
+            if waiter.done() and not waiter.cancelled() and waiter.result():
+                self.release(name)
+            else:
+                self._forget(request_class, waiter)
+            raise
+        finally:
+            timer.cancel()
+        request_class.wait.observe(time.perf_counter() - started)
+        if not admitted:
+            request_class.rejected["timeout"] += 1
+            return "timeout"
+        return None
+
+    def release(self, name: str):
+        request_class = self.classes[name]
+        request_class.active -= 1
+        self.active -= 1
+        self._dispatch()
+
+    def _has_room(self, request_class: RequestClass) -> bool:
+        return self.active < self.max_concurrency and request_class.active < request_class.limit
+
+    def _admit(self, request_class: RequestClass):
+        request_class.active += 1
+        request_class.admitted += 1
+        self.active += 1
+
+    def _dispatch(self):
+        """Hand free slots to waiting requests, highest priority class first"""
+        for name in PRIORITY:
+            request_class = self.classes[name]
+            while request_class.waiters and self._has_room(request_class):
+                waiter = request_class.waiters.popleft()
+                if waiter.done():
+                    continue
+                self._admit(request_class)
+                waiter.set_result(True)
+            if self.active >= self.max_concurrency:
+                return
+
+    def _expire(self, request_class: RequestClass, waiter: asyncio.Future):
+        if not waiter.done():
+            self._forget(request_class, waiter)
+            waiter.set_result(False)
+
+    @staticmethod
+    def _forget(request_class: RequestClass, waiter: asyncio.Future):
+        try:
+            request_class.waiters.remove(waiter)
+        except ValueError:
+            pass
+
+    def stats(self) -> Dict[str, dict]:
+        """Limits, gauges and counters per class, for /metrics"""
+        return {
+            name: {"limit": request_class.limit, "active": request_class.active,
+                   "waiting": len(request_class.waiters), "admitted": request_class.admitted,
+                   "queued": request_class.queued, "rejected": dict(request_class.rejected),
+                   "wait": request_class.wait}
+            for name, request_class in self.classes.items()
+        }
+
+controller = AdmissionController.from_env()
+
+class AdmissionMiddleware:
+    """Pure ASGI middleware admitting each request through `controller`"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        # Looked up per request, so the controller can be replaced (tests, benchmarks)
+        admission = controller
+        name = classify(scope["method"], scope["path"]) if scope["type"] == "http" else None
+        if name is None or not admission.enabled:
+            await self.app(scope, receive, send)
+            return
+
+        reason = await admission.acquire(name)
+        if reason is not None:
+            # Labels the rejection in the request metrics, as no route will match it
+            scope[REJECTED_CLASS] = name
+            response = JSONResponse(
+                {"detail": "Service is overloaded, retry later"},
+                status_code=503,
+                headers={"Retry-After": str(RETRY_AFTER_SECONDS)},
+            )
+            await response(scope, receive, send)
+            return
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            admission.release(name)
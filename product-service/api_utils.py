@@ -0,0 +1,165 @@
+import hashlib
+import os
+from typing import Dict, List, Optional, Tuple
+
+from fastapi import HTTPException, Request, Response
+
+import filtering
+import schemas
+import serializers
+from pagination import decode_cursor, encode_cursor, next_cursor
+
+# ==================== Request/Response Helpers ====================
+# Shared by the sync routes in main.py and the async routes in async_api.py.
+
+PRODUCT_FIELDS = list(schemas.Product.model_fields)
+
+# Shared caches may keep a product response this long before revalidating (0: always revalidate)
+HTTP_CACHE_MAX_AGE = int(os.getenv("HTTP_CACHE_MAX_AGE", "0"))
+CACHE_CONTROL = f"public, max-age={HTTP_CACHE_MAX_AGE}, must-revalidate"
+
+def after_id(cursor: Optional[str]) -> Optional[int]:
+    """Decode a listing cursor into the id of the last row already returned"""
+    if cursor is None:
+        return None
+    try:
+        (last_id,) = decode_cursor(cursor)
+        return int(last_id)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def change_position(cursor: str) -> Tuple[int, int]:
+    """Decode a change feed cursor into the (txid, seq) position it stands for"""
+    try:
+        txid, seq = decode_cursor(cursor, 2)
+        return int(txid), int(seq)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def search_after(cursor: Optional[str]) -> Optional[List]:
+    """Decode a search cursor into the (score, id) of the last result already returned"""
+    if cursor is None:
+        return None
+    try:
+        score, last_id = decode_cursor(cursor, size=2)
+        return [float(score), int(last_id)]
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def filter_after(cursor: Optional[str], sort: str) -> Optional[List]:
+    """Decode a filter cursor into the sort key of the last product already returned"""
+    if cursor is None:
+        return None
+    try:
+        return filtering.parse_after(decode_cursor(cursor, size=len(filtering.SORTS[sort][0])), sort)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def parse_specs(request: Request) -> Dict[str, List[str]]:
+    """Collect ?spec.RAM=16GB&spec.RAM=32GB&spec.Storage=512GB into {key: [values]}"""
+    filters: Dict[str, List[str]] = {}
+    for name, value in request.query_params.multi_items():
+        if name.startswith("spec."):
+            key = name[len("spec."):]
+            if not key:
+                raise HTTPException(status_code=400, detail="Specification filters look like spec.<key>=<value>")
+            filters.setdefault(key, []).append(value)
+    return filters
+
+def set_next_cursor(response: Response, items: list, limit: int, key=lambda item: [item.id]):
+    """Expose the cursor of the following page in the X-Next-Cursor header"""
+    cursor = next_cursor(items, limit, key=key)
+    if cursor:
+        response.headers["X-Next-Cursor"] = cursor
+
+def parse_fields(fields: Optional[str]) -> Optional[List[str]]:
+    """Parse ?fields=id,name,price into schema-ordered field names (id is always included)"""
+    if fields is None:
+        return None
+    requested = {field.strip() for field in fields.split(",") if field.strip()}
+    unknown = requested - set(PRODUCT_FIELDS)
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(sorted(unknown))}")
+    requested.add("id")
+    return [field for field in PRODUCT_FIELDS if field in requested]
+
+# ==================== Conditional GET (ETag / If-None-Match) ====================
+# Product ETags come from id + updated_at; list ETags from max(updated_at) and count
+# of the whole filtered set plus the path and query string, so they are computed
+# with one aggregate query before any row is loaded. A matching If-None-Match gets
+# a bodiless 304. Every product write bumps updated_at (category renames bump it on
+# the category's products), and deletes lower the count.
+
+def _etag(*parts) -> str:
+    return '"' + hashlib.sha1("|".join(str(part) for part in parts).encode()).hexdigest() + '"'
+
+def product_etag(product) -> str:
+    """Strong ETag of a single product response"""
+    return _etag("product", product.id, product.updated_at.isoformat())
+
+def list_etag(request: Request, version: Tuple) -> str:
+    """Strong ETag of a list response from (max updated_at, count) of the matching products"""
+    max_updated, count = version
+    params = sorted(request.query_params.multi_items())
+    return _etag(request.url.path, params, max_updated.isoformat() if max_updated else "", count)
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """True if If-None-Match lists the ETag (weak comparison: W/"x" matches "x")"""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    return any(tag.strip().removeprefix("W/") == etag for tag in header.split(","))
+
+def conditional(request: Request, response: Response, etag: str) -> Optional[Response]:
+    """Set ETag and Cache-Control; return a 304 to send instead when the client's copy is current"""
+    headers = {"ETag": etag, "Cache-Control": CACHE_CONTROL}
+    if etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+    return None
+
+def product_page(products: list, response: Response, fields: Optional[List[str]] = None) -> Response:
+    """Serialize a page of products (optionally only the requested fields) on the fast path"""
+    return serializers.json_response(serializers.product_dicts(products, fields), response)
+
+def change_feed(changes: list, position: Tuple[int, int], has_more: bool) -> Response:
+    """Serialize a change feed page; an upsert whose product is gone by now is reported as a delete"""
+    return serializers.FastJSONResponse({
+        "changes": [
+            {"seq": entry.seq, "product_id": entry.product_id,
+             "op": "upsert" if product is not None else "delete", "changed_at": entry.changed_at,
+             "product": serializers.product_dict(product) if product is not None else None}
+            for entry, product in changes
+        ],
+        "cursor": encode_cursor(list(position)),
+        "has_more": has_more,
+    })
+
+def parse_ids(ids: str) -> List[int]:
+    """Parse ?ids=1,2,3 for the batch lookup"""
+    try:
+        product_ids = [int(part) for part in ids.split(",") if part.strip()]
+    except ValueError:
+        raise HTTPException(status_code=400, detail="ids must be a comma-separated list of integers")
+    if not product_ids or len(product_ids) > schemas.MAX_BATCH_IDS:
+        raise HTTPException(status_code=400, detail=f"Provide between 1 and {schemas.MAX_BATCH_IDS} ids")
+    return product_ids
+
+def product_batch(ids: List[int], products: list) -> Response:
+    """Products in request order (duplicates collapsed) plus the IDs that do not exist"""
+    found = {product.id: product for product in products}
+    ids = list(dict.fromkeys(ids))
+    return serializers.FastJSONResponse({
+        "products": serializers.product_dicts(found[product_id] for product_id in ids if product_id in found),
+        "missing": [product_id for product_id in ids if product_id not in found],
+    })
+
+def below_reserved(exc: Exception) -> HTTPException:
+    """409 for a reservations.StockBelowReserved: the stock is held by open reservations"""
+    return HTTPException(
+        status_code=409,
+        detail={"message": "Stock cannot be set below the quantity held by open reservations",
+                "product_ids": exc.product_ids},
+    )
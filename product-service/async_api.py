@@ -0,0 +1,148 @@
+import asyncio
+from typing import List, Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, status
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import async_crud
+import coalescer
+import filtering
+import schemas
+from api_utils import (after_id, conditional, list_etag, parse_fields, parse_ids, product_batch, product_etag,
+                       product_page, set_next_cursor)
+from database import get_async_db
+
+# ==================== Async Routes (DB_ASYNC mode) ====================
+# main.py includes this router ahead of its own routes when DB_ASYNC is on, so
+# these handlers win for the hot read paths and stock decrements. They run on the
+# event loop instead of Starlette's threadpool, so concurrency is bounded by the
+# database pool. Numeric path parameters use the :int convertor so that static
+# routes such as /products/export still fall through to main.py.
+
+router = APIRouter()
+
+# ==================== Category Endpoints ====================
+
+@router.get("/categories/", response_model=List[schemas.Category])
+async def read_categories(response: Response, skip: int = 0, limit: int = 100, cursor: Optional[str] = None,
+                          db: AsyncSession = Depends(get_async_db)):
+    """Get all categories"""
+    categories = await async_crud.get_categories(db, skip=skip, limit=limit, after_id=after_id(cursor))
+    set_next_cursor(response, categories, limit)
+    return categories
+
+@router.get("/categories/{category_id:int}", response_model=schemas.Category)
+async def read_category(category_id: int, db: AsyncSession = Depends(get_async_db)):
+    """Get a specific category by ID"""
+    db_category = await async_crud.get_category_cached(db, category_id=category_id)
+    if db_category is None:
+        raise HTTPException(status_code=404, detail="Category not found")
+    return db_category
+
+# ==================== Product Endpoints ====================
+
+@router.get("/products/", response_model=List[schemas.Product])
+async def read_products(request: Request, response: Response, skip: int = 0, limit: int = 100,
+                        cursor: Optional[str] = None, fields: Optional[str] = None,
+                        db: AsyncSession = Depends(get_async_db)):
+    """Get all products (optionally only some fields, e.g. ?fields=id,name,price,stock_quantity)"""
+    selected = parse_fields(fields)
+    version = await async_crud.get_products_version(db, filtering.ProductFilter())
+    not_modified = conditional(request, response, list_etag(request, version))
+    if not_modified:
+        return not_modified
+    products = await async_crud.get_products(db, skip=skip, limit=limit, after_id=after_id(cursor),
+                                             fields=selected)
+    set_next_cursor(response, products, limit)
+    return product_page(products, response, selected)
+
+@router.get("/products/batch", response_model=schemas.ProductBatch)
+async def read_products_batch(ids: str, db: AsyncSession = Depends(get_async_db)):
+    """Get many products in one request, e.g. /products/batch?ids=1,2,3"""
+    product_ids = parse_ids(ids)
+    return product_batch(product_ids, await async_crud.get_products_by_ids(db, product_ids))
+
+@router.get("/products/{product_id:int}", response_model=schemas.Product)
+async def read_product(product_id: int, request: Request, response: Response,
+                       db: AsyncSession = Depends(get_async_db)):
+    """Get a specific product by ID"""
+    db_product = await async_crud.get_product_cached(db, product_id=product_id)
+    if db_product is None:
+        raise HTTPException(status_code=404, detail="Product not found")
+    return conditional(request, response, product_etag(db_product)) or db_product
+
+@router.get("/products/category/{category_id:int}", response_model=List[schemas.Product])
+async def read_products_by_category(category_id: int, request: Request, response: Response, skip: int = 0,
+                                    limit: int = 100, cursor: Optional[str] = None, fields: Optional[str] = None,
+                                    db: AsyncSession = Depends(get_async_db)):
+    """Get all products in a specific category (e.g., all Laptops)"""
+    selected = parse_fields(fields)
+    version = await async_crud.get_products_version(db, filtering.ProductFilter(category_ids=[category_id]))
+    not_modified = conditional(request, response, list_etag(request, version))
+    if not_modified:
+        return not_modified
+    products = await async_crud.get_products_by_category(db, category_id=category_id, skip=skip, limit=limit,
+                                                         after_id=after_id(cursor), fields=selected)
+    set_next_cursor(response, products, limit)
+    return product_page(products, response, selected)
+
+@router.get("/products/brand/{brand}", response_model=List[schemas.Product])
+async def read_products_by_brand(brand: str, request: Request, response: Response, skip: int = 0,
+                                 limit: int = 100, cursor: Optional[str] = None, fields: Optional[str] = None,
+                                 db: AsyncSession = Depends(get_async_db)):
+    """Get all products by brand (e.g., Apple, Samsung, Dell)"""
+    selected = parse_fields(fields)
+    version = await async_crud.get_products_version(db, filtering.ProductFilter(brands=[brand]))
+    not_modified = conditional(request, response, list_etag(request, version))
+    if not_modified:
+        return not_modified
+    products = await async_crud.get_products_by_brand(db, brand=brand, skip=skip, limit=limit,
+                                                      after_id=after_id(cursor), fields=selected)
+    set_next_cursor(response, products, limit)
+    return product_page(products, response, selected)
+
+@router.get("/products/stock/available", response_model=List[schemas.Product])
+async def read_available_products(request: Request, response: Response, skip: int = 0, limit: int = 100,
+                                  cursor: Optional[str] = None, fields: Optional[str] = None,
+                                  db: AsyncSession = Depends(get_async_db)):
+    """Get only products that are in stock"""
+    selected = parse_fields(fields)
+    version = await async_crud.get_products_version(db, filtering.ProductFilter(in_stock=True))
+    not_modified = conditional(request, response, list_etag(request, version))
+    if not_modified:
+        return not_modified
+    products = await async_crud.get_products_in_stock(db, skip=skip, limit=limit, after_id=after_id(cursor),
+                                                      fields=selected)
+    set_next_cursor(response, products, limit)
+    return product_page(products, response, selected)
+
+@router.patch("/products/{product_id:int}/stock/decrease")
+async def decrease_product_stock(product_id: int, qty: int = Query(..., gt=0),
+                                 db: AsyncSession = Depends(get_async_db)):
+    """Decrease product stock quantity (for order processing)"""
+    stock_coalescer = coalescer.get()
+    if stock_coalescer is not None:
+        new_quantity = await asyncio.wrap_future(stock_coalescer.submit(product_id, coalescer.DECREASE, qty))
+    else:
+        new_quantity = await async_crud.decrease_product_stock(db, product_id=product_id, quantity=qty)
+    if new_quantity is None:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Insufficient stock or product not found"
+        )
+    return {"message": "Stock decreased successfully", "product_id": product_id, "new_quantity": new_quantity}
+
+@router.post("/products/stock/decrease")
+async def decrease_stock_batch(order: schemas.StockDecreaseBatch, db: AsyncSession = Depends(get_async_db)):
+    """Decrease stock for every line of an order in one all-or-nothing transaction"""
+    lines = [(item.product_id, item.quantity) for item in order.items]
+    new_quantities, failed = await async_crud.decrease_stock_batch(db, lines)
+    if failed:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail={"message": "Insufficient stock or product not found", "product_ids": failed}
+        )
+    return {
+        "message": "Stock decreased successfully",
+        "items": [{"product_id": pid, "new_quantity": qty} for pid, qty in new_quantities.items()]
+    }
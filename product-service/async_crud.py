@@ -0,0 +1,121 @@
+from typing import List, Optional, Sequence, Tuple
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import joinedload
+
+import cache
+import crud
+import database
+import filtering
+import models
+import schemas
+from pagination import paginate
+
+# ==================== Async CRUD Operations ====================
+# Async counterparts of the hot read paths in crud.py, for DB_ASYNC mode.
+# Writes run the sync crud functions through AsyncSession.run_sync, which drives
+# them on the async driver without a thread, so cache invalidation and every
+# other side effect of a write stays defined in one place.
+
+def _after(after_id: Optional[int]):
+    return None if after_id is None else [after_id]
+
+async def _all(db: AsyncSession, statement):
+    return (await db.execute(statement)).scalars().all()
+
+# ==================== Categories ====================
+
+async def get_category(db: AsyncSession, category_id: int):
+    """Get a single category by ID"""
+    return await db.get(models.Category, category_id)
+
+async def get_category_cached(db: AsyncSession, category_id: int):
+    """Get a category snapshot (schemas.Category) through the read-through cache"""
+    cached = cache.category_cache.get(category_id)
+    if cached is not None:
+        return cached
+    version = cache.category_cache.version
+    # Filled from the primary, as in crud
+    with database.primary_reads(db):
+        db_category = await get_category(db, category_id)
+    if db_category is None:
+        return None
+    snapshot = schemas.Category.model_validate(db_category)
+    cache.category_cache.set(category_id, snapshot, version)
+    return snapshot
+
+async def get_categories(db: AsyncSession, skip: int = 0, limit: int = 100, after_id: Optional[int] = None):
+    """Get all categories with pagination (offset via skip, or keyset via after_id)"""
+    statement = select(models.Category)
+    return await _all(db, paginate(statement, [models.Category.id], skip, limit, _after(after_id)))
+
+# ==================== Products ====================
+
+async def get_product(db: AsyncSession, product_id: int):
+    """Get a single product by ID, with its category"""
+    statement = select(models.Product).options(
+        joinedload(models.Product.category)
+    ).where(models.Product.id == product_id)
+    return (await db.execute(statement)).scalars().first()
+
+async def get_product_cached(db: AsyncSession, product_id: int):
+    """Get a product snapshot (schemas.Product) through the read-through cache"""
+    cached = cache.product_cache.get(product_id)
+    if cached is not None:
+        return cached
+    version = cache.product_cache.version
+    # Filled from the primary, as in crud
+    with database.primary_reads(db):
+        db_product = await get_product(db, product_id)
+    if db_product is None:
+        return None
+    snapshot = schemas.Product.model_validate(db_product)
+    cache.product_cache.set(product_id, snapshot, version)
+    return snapshot
+
+async def get_products_by_ids(db: AsyncSession, product_ids: List[int]):
+    """Get many products by ID with a single IN query"""
+    if not product_ids:
+        return []
+    statement = select(models.Product).options(*crud.product_options()).where(models.Product.id.in_(product_ids))
+    return await _all(db, statement)
+
+async def _list(db: AsyncSession, criteria, skip: int, limit: int, after_id: Optional[int],
+                fields: Optional[Sequence[str]]):
+    statement = select(models.Product).options(*crud.product_options(fields)).where(*criteria)
+    return await _all(db, paginate(statement, [models.Product.id], skip, limit, _after(after_id)))
+
+async def get_products(db: AsyncSession, skip: int = 0, limit: int = 100, after_id: Optional[int] = None,
+                       fields: Optional[Sequence[str]] = None):
+    """Get all products with pagination"""
+    return await _list(db, [], skip, limit, after_id, fields)
+
+async def get_products_by_category(db: AsyncSession, category_id: int, skip: int = 0, limit: int = 100,
+                                   after_id: Optional[int] = None, fields: Optional[Sequence[str]] = None):
+    """Get products filtered by category"""
+    return await _list(db, [models.Product.category_id == category_id], skip, limit, after_id, fields)
+
+async def get_products_by_brand(db: AsyncSession, brand: str, skip: int = 0, limit: int = 100,
+                                after_id: Optional[int] = None, fields: Optional[Sequence[str]] = None):
+    """Get products filtered by brand"""
+    return await _list(db, [models.Product.brand == brand], skip, limit, after_id, fields)
+
+async def get_products_in_stock(db: AsyncSession, skip: int = 0, limit: int = 100,
+                                after_id: Optional[int] = None, fields: Optional[Sequence[str]] = None):
+    """Get products that are in stock (quantity > 0)"""
+    return await _list(db, [models.Product.stock_quantity > 0], skip, limit, after_id, fields)
+
+async def get_products_version(db: AsyncSession, criteria: filtering.ProductFilter):
+    """(max updated_at, count) of the products matching the criteria, for list ETags"""
+    return tuple((await db.execute(filtering.version_statement(criteria))).one())
+
+# ==================== Stock ====================
+
+async def decrease_product_stock(db: AsyncSession, product_id: int, quantity: int):
+    """Async crud.decrease_product_stock: returns the new quantity or None"""
+    return await db.run_sync(crud.decrease_product_stock, product_id, quantity)
+
+async def decrease_stock_batch(db: AsyncSession, lines: List[Tuple[int, int]]):
+    """Async crud.decrease_stock_batch: all-or-nothing multi-line decrement"""
+    return await db.run_sync(crud.decrease_stock_batch, lines)
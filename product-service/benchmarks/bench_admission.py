@@ -0,0 +1,94 @@
+"""Stock decrements during a search flood, with and without admission control.
+
+    python -m benchmarks.bench_admission --products 20000 --searchers 200 --buyers 10 [--database-url postgresql://... --destroy]
+
+Searchers and buyers loop for --seconds against the app through httpx's in-process
+ASGI transport. The report gives each side's throughput, p50/p99 latency and 503s.
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import time
+
+from benchmarks.scratch import add_database_args, scratch_url
+
+QUERIES = ["laptop", "pro", "wireless gaming", "samsung", "ultra"]
+
+def _summary(latencies, shed: int, elapsed: float) -> dict:
+    latencies.sort()
+    return {
+        "served": len(latencies),
+        "shed": shed,
+        "rps": round(len(latencies) / elapsed, 1),
+        "p50_ms": round(statistics.median(latencies), 2) if latencies else None,
+        "p99_ms": round(latencies[max(0, int(len(latencies) * 0.99) - 1)], 2) if latencies else None,
+    }
+
+async def _drive(app, seconds: float, searchers: int, buyers: int, max_id: int) -> dict:
+    import httpx
+
+    results = {"search": ([], [0]), "stock": ([], [0])}
+    deadline = time.perf_counter() + seconds
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=60) as client:
+        async def loop(kind: str, worker: int):
+            latencies, shed = results[kind]
+            i = worker
+            while time.perf_counter() < deadline:
+                if kind == "search":
+                    request = client.get("/products/search/", params={"q": QUERIES[i % len(QUERIES)], "limit": 50})
+                else:
+                    request = client.patch(f"/products/{1 + i % max_id}/stock/decrease", params={"qty": 1})
+                started = time.perf_counter()
+                response = await request
+                if response.status_code == 503:
+                    shed[0] += 1
+                    await asyncio.sleep(0.01)
+                else:
+                    latencies.append((time.perf_counter() - started) * 1000)
+                i += 7
+
+        started = time.perf_counter()
+        await asyncio.gather(*[loop("search", n) for n in range(searchers)],
+                             *[loop("stock", n) for n in range(buyers)])
+        elapsed = time.perf_counter() - started
+    return {kind: _summary(latencies, shed[0], elapsed) for kind, (latencies, shed) in results.items()}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--products", type=int, default=20_000)
+    parser.add_argument("--searchers", type=int, default=200)
+    parser.add_argument("--buyers", type=int, default=10)
+    parser.add_argument("--seconds", type=float, default=10)
+    add_database_args(parser)
+    args = parser.parse_args()
+
+    # Buyers decrement stock, so a real database needs --destroy too
+    os.environ["DATABASE_URL"] = scratch_url(args, "bench_admission")
+    os.environ.setdefault("PRODUCT_CACHE_SIZE", "0")
+    import admission
+    import database
+    import models
+    from benchmarks.catalog import seed
+    from sqlalchemy import func
+    from main import app
+
+    database.init_db()
+    db = database.SessionLocal()
+    if db.query(func.count(models.Product.id)).scalar() == 0:
+        seed(db, args.products)
+    max_id = db.query(func.max(models.Product.id)).scalar()
+    db.close()
+
+    report = {"database": database.get_engine().dialect.name, "searchers": args.searchers,
+              "buyers": args.buyers, "modes": {}}
+    for mode, max_concurrency in (("unlimited", 0), ("admission", admission.MAX_CONCURRENCY)):
+        admission.controller = admission.AdmissionController(
+            max_concurrency, {name: admission.RequestClass.from_env(name) for name in admission.PRIORITY})
+        report["modes"][mode] = asyncio.run(_drive(app, args.seconds, args.searchers, args.buyers, max_id))
+    print(json.dumps(report, indent=2))
+
+if __name__ == "__main__":
+    main()
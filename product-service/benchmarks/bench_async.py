@@ -0,0 +1,102 @@
+"""Throughput of the sync (threadpool) and async (DB_ASYNC) database paths under high concurrency.
+
+    python -m benchmarks.bench_async --products 5000 --concurrency 10 50 100 [--database-url postgresql://...]
+
+Each mode runs in its own process because DB_ASYNC is read at import time. Requests
+go through httpx's in-process ASGI transport, so the numbers measure the service and
+its database, not the network.
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROUTES = ["/products/?limit=20", "/products/{id}", "/products/category/1?limit=20", "/products/stock/available?limit=20"]
+
+async def _drive(app, total: int, concurrency: int, max_id: int):
+    import httpx
+
+    latencies = []
+    semaphore = asyncio.Semaphore(concurrency)
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        async def one(i: int):
+            path = ROUTES[i % len(ROUTES)].replace("{id}", str(1 + i % max_id))
+            async with semaphore:
+                started = time.perf_counter()
+                response = await client.get(path)
+                latencies.append((time.perf_counter() - started) * 1000)
+                assert response.status_code == 200, (path, response.status_code)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(one(i) for i in range(total)))
+        elapsed = time.perf_counter() - started
+    latencies.sort()
+    return {
+        "concurrency": concurrency,
+        "requests": total,
+        "rps": round(total / elapsed, 1),
+        "p50_ms": round(statistics.median(latencies), 2),
+        "p99_ms": round(latencies[int(len(latencies) * 0.99) - 1], 2),
+    }
+
+def worker(args):
+    """Runs inside the child process with DATABASE_URL / DB_ASYNC already set"""
+    import database
+    from benchmarks.catalog import seed
+    from sqlalchemy import func
+    import models
+
+    database.init_db()
+    db = database.SessionLocal()
+    if db.query(func.count(models.Product.id)).scalar() == 0:
+        seed(db, args.products)
+    max_id = db.query(func.max(models.Product.id)).scalar()
+    db.close()
+
+    from main import app
+
+    async def run(concurrency: int):
+        try:
+            return await _drive(app, args.requests, concurrency, max_id)
+        finally:
+            # Pooled async connections are bound to this event loop; asyncio.run() makes a new one per level
+            await database.dispose_async()
+
+    results = [asyncio.run(run(c)) for c in args.concurrency]
+    print(json.dumps(results))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--products", type=int, default=5000)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[10, 50, 100])
+    parser.add_argument("--pool-size", type=int, default=None, help="defaults to the highest concurrency")
+    parser.add_argument("--database-url", default=None, help="defaults to a temporary SQLite file")
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.worker:
+        return worker(args)
+
+    url = args.database_url or f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench_async.db')}"
+    report = {"database_url": url.split("@")[-1], "modes": {}}
+    for mode, flag in (("sync", "0"), ("async", "1")):
+        # Same pool for both modes. It must cover the highest concurrency: in sync mode,
+        # sessions whose teardown is waiting for a free worker thread still hold their
+        # connections, so a smaller pool can starve the threadpool until checkout times out.
+        env = dict(os.environ, DATABASE_URL=url, DB_ASYNC=flag, PRODUCT_CACHE_SIZE="0",
+                   DB_POOL_SIZE=str(args.pool_size or max(args.concurrency)), DB_MAX_OVERFLOW="0")
+        command = [sys.executable, "-m", "benchmarks.bench_async", "--worker",
+                   "--products", str(args.products), "--requests", str(args.requests),
+                   "--concurrency", *[str(c) for c in args.concurrency]]
+        output = subprocess.run(command, env=env, check=True, capture_output=True, text=True).stdout
+        report["modes"][mode] = json.loads(output.strip().splitlines()[-1])
+    print(json.dumps(report, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+"""Reprice a whole category: one crud.update_product per product against one set-based crud.reprice_products.
+
+    python -m benchmarks.bench_bulk --products 100000 [--sample 500] [--database-url postgresql://... --destroy]
+
+The per-product path is timed on --sample products and extrapolated to the category.
+"""
+import argparse
+import json
+import time
+
+from sqlalchemy import func, select
+from sqlalchemy.orm import sessionmaker
+
+from database import Base
+import crud
+import filtering
+import models
+import schemas
+from benchmarks.catalog import seed
+from benchmarks.scratch import add_database_args, scratch_engine
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--products", type=int, default=100_000)
+    parser.add_argument("--sample", type=int, default=500)
+    add_database_args(parser)
+    args = parser.parse_args()
+
+    engine = scratch_engine(args, "bench_bulk")
+    db = sessionmaker(bind=engine)()
+    seed(db, args.products)
+
+    Product = models.Product
+    category_id, count = db.execute(
+        select(Product.category_id, func.count(Product.id)).group_by(Product.category_id)
+        .order_by(func.count(Product.id).desc()).limit(1)
+    ).one()
+    sample = db.execute(
+        select(Product.id, Product.price).where(Product.category_id == category_id).limit(args.sample)
+    ).all()
+
+    started = time.perf_counter()
+    for product_id, price in sample:
+        crud.update_product(db, product_id, schemas.ProductUpdate(price=round(price * 1.05, 2)))
+    per_product = (time.perf_counter() - started) / len(sample)
+
+    started = time.perf_counter()
+    updated, _ = crud.reprice_products(db, filtering.ProductFilter(category_ids=[category_id]), percent=5)
+    bulk_seconds = time.perf_counter() - started
+
+    print(json.dumps({
+        "database": engine.dialect.name,
+        "category_products": count,
+        "per_product": {"ms_each": round(per_product * 1000, 3),
+                        "estimated_seconds": round(per_product * count, 2)},
+        "bulk": {"updated": updated, "seconds": round(bulk_seconds, 3)},
+    }, indent=2))
+
+    db.close()
+    Base.metadata.drop_all(bind=engine)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+"""Compare indexed full-text search against the legacy ILIKE scan.
+
+    python -m benchmarks.bench_search --products 100000 [--database-url postgresql://... --destroy]
+"""
+import argparse
+import json
+import statistics
+import time
+
+from sqlalchemy.orm import sessionmaker
+
+from database import Base
+import search
+from benchmarks.catalog import seed
+from benchmarks.scratch import add_database_args, scratch_engine
+
+QUERIES = ["apple", "pro max", "gaming lap", "samsung ultra", "wireless", "dell xps", "sony", "nothing-matches-this"]
+
+def _time(fn, repeat: int):
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - started) * 1000)
+    return {"p50_ms": round(statistics.median(samples), 3), "max_ms": round(max(samples), 3)}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--products", type=int, default=100_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--limit", type=int, default=20)
+    add_database_args(parser)
+    args = parser.parse_args()
+
+    engine = scratch_engine(args, "bench_search")
+    db = sessionmaker(bind=engine)()
+    started = time.perf_counter()
+    seed(db, args.products)
+    seeded_in = time.perf_counter() - started
+
+    results = {"database": engine.dialect.name, "products": args.products, "seed_seconds": round(seeded_in, 2),
+               "queries": {}}
+    for query in QUERIES:
+        results["queries"][query] = {
+            "ilike": _time(lambda: search.ilike_search(db, query, limit=args.limit), args.repeat),
+            "indexed": _time(lambda: search.search(db, query, limit=args.limit), args.repeat),
+        }
+    print(json.dumps(results, indent=2))
+
+    db.close()
+    Base.metadata.drop_all(bind=engine)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""Compare the fast product-list serializer against FastAPI's response_model path.
+
+    python -m benchmarks.bench_serialization --products 1000 --page 100
+"""
+import argparse
+import json
+import os
+import statistics
+import tempfile
+import time
+from typing import List
+
+from fastapi.responses import JSONResponse
+from pydantic import TypeAdapter
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from database import Base
+import crud
+import schemas
+import serializers
+from benchmarks.catalog import seed
+
+PRODUCT_LIST = TypeAdapter(List[schemas.Product])
+
+def reference(products) -> bytes:
+    """What FastAPI does for response_model=List[schemas.Product]: validate, dump, JSONResponse"""
+    validated = PRODUCT_LIST.validate_python(products, from_attributes=True)
+    return JSONResponse(PRODUCT_LIST.dump_python(validated, mode="json")).body
+
+def fast(products) -> bytes:
+    return serializers.FastJSONResponse(serializers.product_dicts(products)).body
+
+def _time(fn, repeat: int):
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - started) * 1000)
+    return {"p50_ms": round(statistics.median(samples), 3), "max_ms": round(max(samples), 3)}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--products", type=int, default=1000)
+    parser.add_argument("--page", type=int, default=100)
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    # Always a temporary SQLite file: there is no --database-url to point at a real database
+    engine = create_engine(f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench_serialization.db')}")
+    Base.metadata.create_all(bind=engine)
+    db = sessionmaker(bind=engine)()
+    seed(db, args.products)
+    products = crud.get_products(db, limit=args.page)
+
+    # Same bytes or the comparison is meaningless
+    assert fast(products) == reference(products), "fast path output differs from the response_model path"
+    results = {
+        "page": len(products),
+        "bytes": len(fast(products)),
+        "orjson": serializers.orjson is not None,
+        "reference": _time(lambda: reference(products), args.repeat),
+        "fast": _time(lambda: fast(products), args.repeat),
+    }
+    results["speedup"] = round(results["reference"]["p50_ms"] / max(results["fast"]["p50_ms"], 1e-6), 2)
+    print(json.dumps(results, indent=2))
+
+    db.close()
+    Base.metadata.drop_all(bind=engine)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""Cold-start cost: `import main`, app startup and time to first request, each in a fresh interpreter.
+
+    python -m benchmarks.bench_startup --repeat 10 [--prewarm 5] [--database-url postgresql://...]
+
+"lazy" is the service as it runs today: importing main touches no database and the
+first request (or the lifespan, with --prewarm) connects. "eager" adds the schema
+check that importing main used to run (create_all against the database), for
+comparison.
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+MODES = ("lazy", "eager")
+
+def child(mode: str):
+    """Runs in a fresh interpreter with DATABASE_URL / DB_POOL_PREWARM set; prints its timings as JSON"""
+    timings = {}
+    started = time.perf_counter()
+    import main
+    timings["import"] = time.perf_counter() - started
+    if mode == "eager":
+        mark = time.perf_counter()
+        import database
+        database.init_db()
+        timings["schema"] = time.perf_counter() - mark
+    import httpx
+
+    async def first_request():
+        # ASGITransport does not run the lifespan, so drive it by hand like a server would
+        mark = time.perf_counter()
+        async with main.app.router.lifespan_context(main.app):
+            timings["startup"] = time.perf_counter() - mark
+            mark = time.perf_counter()
+            transport = httpx.ASGITransport(app=main.app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+                response = await client.get("/products/?limit=20")
+                assert response.status_code == 200, response.text
+            timings["first_request"] = time.perf_counter() - mark
+
+    asyncio.run(first_request())
+    timings["total"] = time.perf_counter() - started
+    print(json.dumps(timings))
+
+def _summary(samples: list) -> dict:
+    """Median milliseconds per phase"""
+    return {key: round(statistics.median(sample[key] for sample in samples) * 1000, 2) for key in samples[0]}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--prewarm", type=int, default=0, help="DB_POOL_PREWARM for the measured processes")
+    parser.add_argument("--products", type=int, default=1000)
+    parser.add_argument("--database-url", default=None, help="defaults to a temporary SQLite file")
+    parser.add_argument("--child", choices=MODES, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        child(args.child)
+        return
+
+    url = args.database_url or f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench_startup.db')}"
+    env = dict(os.environ, DATABASE_URL=url, DB_POOL_PREWARM=str(args.prewarm))
+    # Schema and catalog are set up once, outside the measured processes
+    subprocess.run([sys.executable, "-c", (
+        "import database, models\n"
+        "from benchmarks.catalog import seed\n"
+        "database.init_db()\n"
+        "db = database.SessionLocal()\n"
+        f"seed(db, {args.products}) if db.query(models.Product.id).first() is None else None\n"
+        "db.close()\n"
+    )], env=env, check=True)
+
+    report = {"database": url.split("://")[0], "prewarm": args.prewarm, "repeat": args.repeat, "modes": {}}
+    for mode in MODES:
+        samples = []
+        for _ in range(args.repeat):
+            started = time.perf_counter()
+            output = subprocess.run([sys.executable, "-m", "benchmarks.bench_startup", "--child", mode],
+                                    env=env, check=True, capture_output=True, text=True).stdout
+            sample = json.loads(output.strip().splitlines()[-1])
+            # Includes interpreter start-up: what a restarting worker really waits
+            sample["process"] = time.perf_counter() - started
+            samples.append(sample)
+        report["modes"][mode] = {"median_ms": _summary(samples)}
+    print(json.dumps(report, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+"""Time typeahead from the in-memory index against running the search query on every keystroke.
+
+    python -m benchmarks.bench_suggest --products 100000 [--database-url postgresql://... --destroy]
+"""
+import argparse
+import json
+import statistics
+import time
+
+from sqlalchemy.orm import sessionmaker
+
+from database import Base
+import search
+import suggest
+from benchmarks.catalog import seed
+from benchmarks.scratch import add_database_args, scratch_engine
+
+# Each prefix of these, as a user types them
+TYPED = ["apple mac", "gaming", "samsung ultra", "s", "xps", "nothing-matches"]
+
+def _time(fn, repeat: int):
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - started) * 1000)
+    return {"p50_ms": round(statistics.median(samples), 3), "max_ms": round(max(samples), 3)}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--products", type=int, default=100_000)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--limit", type=int, default=suggest.DEFAULT_LIMIT)
+    add_database_args(parser)
+    args = parser.parse_args()
+
+    engine = scratch_engine(args, "bench_suggest")
+    db = sessionmaker(bind=engine)()
+    seed(db, args.products)
+
+    index = suggest.SuggestIndex()
+    started = time.perf_counter()
+    suggest.load(db, index)
+    built_in = time.perf_counter() - started
+    # Every lookup ranks its matches, as right after a write cleared the memoized answers
+    uncached = suggest.SuggestIndex(result_cache_size=0)
+    suggest.load(db, uncached)
+
+    results = {"database": engine.dialect.name, "products": args.products,
+               "index_build_seconds": round(built_in, 2), "typed": {}}
+    for typed in TYPED:
+        keystrokes = [typed[:end] for end in range(1, len(typed) + 1)]
+        results["typed"][typed] = {
+            "search": _time(lambda: [search.search(db, prefix, limit=args.limit) for prefix in keystrokes],
+                            max(1, args.repeat // 10)),
+            "suggest": _time(lambda: [index.suggest(prefix, args.limit) for prefix in keystrokes], args.repeat),
+            "suggest_uncached": _time(lambda: [uncached.suggest(prefix, args.limit) for prefix in keystrokes],
+                                      args.repeat),
+            "keystrokes": len(keystrokes),
+        }
+    print(json.dumps(results, indent=2))
+
+    db.close()
+    Base.metadata.drop_all(bind=engine)
+
+if __name__ == "__main__":
+    main()
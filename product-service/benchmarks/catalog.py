@@ -0,0 +1,77 @@
+"""Synthetic electronics catalog used by the benchmarks"""
+import random
+from datetime import datetime, timedelta
+
+from sqlalchemy import insert
+
+import models
+from specs import rebuild as rebuild_specs
+from stats import recompute as recompute_stats
+
+CATEGORIES = ["Laptops", "Phones", "Tablets", "Headphones", "Watches", "Cameras", "Monitors", "Accessories"]
+BRANDS = ["Apple", "Samsung", "Dell", "HP", "Lenovo", "Sony", "Asus", "Acer", "Google", "Xiaomi"]
+LINES = ["Pro", "Air", "Max", "Ultra", "Lite", "Plus", "Mini", "Edge", "Studio", "Neo"]
+ADJECTIVES = ["wireless", "portable", "lightweight", "gaming", "business", "premium", "compact", "rugged"]
+RAM = ["4GB", "8GB", "16GB", "32GB", "64GB"]
+STORAGE = ["64GB", "128GB", "256GB", "512GB", "1TB", "2TB"]
+EXTRA_SPECS = {
+    "Color": ["Black", "Silver", "White", "Blue", "Gold"],
+    "Screen": ["6.1in", "11in", "13.3in", "14in", "15.6in", "27in"],
+    "Battery": ["3000mAh", "4500mAh", "50Wh", "70Wh", "99Wh"],
+    "Weight": ["180g", "450g", "1.2kg", "1.8kg", "2.5kg"],
+    "Warranty": ["1 year", "2 years", "3 years"],
+    "Connectivity": ["WiFi 6", "WiFi 6E", "5G", "Bluetooth 5.3"],
+}
+
+def brand_names(count: int = len(BRANDS)):
+    """`count` brand names, the real ones first"""
+    return [BRANDS[i % len(BRANDS)] + ("" if i < len(BRANDS) else f" {i // len(BRANDS)}") for i in range(count)]
+
+def product_rows(count: int, category_ids, seed: int = 42, brands: int = len(BRANDS), specs: int = 2):
+    """Yield `count` product rows as dicts ready for a Core insert, each with `specs` specification keys"""
+    rng = random.Random(seed)
+    start = datetime(2025, 1, 1)
+    brand_pool = brand_names(brands)
+    extra_keys = list(EXTRA_SPECS)[:max(specs - 2, 0)]
+    for i in range(count):
+        brand = rng.choice(brand_pool)
+        category_index = rng.randrange(len(category_ids))
+        line = rng.choice(LINES)
+        name = f"{brand} {CATEGORIES[category_index % len(CATEGORIES)][:-1]} {line} {rng.randint(1, 20)}"
+        created = start + timedelta(minutes=i)
+        yield {
+            "name": name,
+            "description": f"{rng.choice(ADJECTIVES).capitalize()} {line.lower()} device by {brand} "
+                           f"with {rng.choice(ADJECTIVES)} design",
+            "price": round(rng.uniform(19, 3999), 2),
+            "stock_quantity": rng.choice([0, rng.randint(1, 500)]),
+            "brand": brand,
+            "category_id": category_ids[category_index],
+            "specifications": dict(
+                list({"RAM": rng.choice(RAM), "Storage": rng.choice(STORAGE)}.items())[:specs],
+                **{key: rng.choice(EXTRA_SPECS[key]) for key in extra_keys}
+            ),
+            "image_url": f"https://example.com/img/{i}.jpg",
+            "created_at": created,
+            "updated_at": created,
+        }
+
+def seed(db, products: int, categories: int = len(CATEGORIES), chunk_size: int = 5000, seed: int = 42,
+         brands: int = len(BRANDS), specs: int = 2):
+    """Insert `categories` categories and `products` products using multi-row inserts"""
+    names = [CATEGORIES[i % len(CATEGORIES)] + ("" if i < len(CATEGORIES) else f" {i}") for i in range(categories)]
+    db.execute(insert(models.Category), [{"name": name, "description": f"{name} category"} for name in names])
+    category_ids = [row.id for row in db.query(models.Category.id).order_by(models.Category.id)]
+    chunk = []
+    for row in product_rows(products, category_ids, seed=seed, brands=brands, specs=specs):
+        chunk.append(row)
+        if len(chunk) == chunk_size:
+            db.execute(insert(models.Product), chunk)
+            chunk = []
+    if chunk:
+        db.execute(insert(models.Product), chunk)
+    db.commit()
+    # Core inserts bypass crud, so index the specifications and compute the stats in one pass afterwards
+    rebuild_specs(db)
+    recompute_stats(db)
+    return category_ids
@@ -0,0 +1,357 @@
+"""Load and latency benchmark for every route of the product service.
+
+    python -m benchmarks.run --products 10000 --concurrency 1 10 50 --output results.json
+    python -m benchmarks.run --products 10000 --output new.json --baseline baseline.json
+    python -m benchmarks.run --compare baseline.json new.json [--threshold 0.2]
+
+A synthetic catalog (categories, brands and specification keys are configurable) is
+seeded into a fresh SQLite file, or into --database-url (seeded only if it has no
+products; its rows are written to, so it must be confirmed with --destroy). Every route in main.py is then driven through httpx's in-process ASGI
+transport at each concurrency level, and throughput plus p50/p99 latency per route are
+written as JSON. Request choices come from a seeded RNG, so two runs of the same
+commit issue the same requests.
+
+With --baseline (or --compare for two stored files), a route regresses when its
+throughput drops, or its p50/p99 latency grows, by more than --threshold; the exit
+status is then 1 so CI can fail on it.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+from benchmarks.scratch import add_database_args, scratch_url
+
+SEARCH_TERMS = ["apple", "pro max", "gaming", "samsung ultra", "wireless", "dell", "sony lite"]
+IMPORT_ROWS = 50
+
+class Scenario:
+    """One route under load: `build(i, rng, ctx)` returns (method, url, request kwargs)"""
+
+    def __init__(self, name: str, build, ok=(200,), share: float = 1.0, disposable: str = None):
+        self.name = name
+        self.build = build
+        self.ok = ok
+        # Fraction of --requests to issue (whole-catalog exports are expensive)
+        self.share = share
+        # "products" / "categories": the scenario consumes rows created for it beforehand
+        self.disposable = disposable
+
+def _product(rng, ctx):
+    return rng.randint(ctx["min_id"], ctx["max_id"])
+
+def _new_product(i, rng, ctx):
+    return {"name": f"Bench Product {ctx['run']}-{i}", "price": round(rng.uniform(19, 3999), 2),
+            "stock_quantity": 100, "brand": rng.choice(ctx["brands"]), "category_id": rng.choice(ctx["categories"]),
+            "specifications": {"RAM": "16GB"}}
+
+def _import_body(i, rng, ctx):
+    return "\n".join(json.dumps(_new_product(f"{i}-{row}", rng, ctx)) for row in range(IMPORT_ROWS))
+
+SCENARIOS = [
+    # Reads
+    Scenario("GET /", lambda i, rng, ctx: ("GET", "/", {})),
+    Scenario("GET /health", lambda i, rng, ctx: ("GET", "/health", {})),
+    Scenario("GET /cache/stats", lambda i, rng, ctx: ("GET", "/cache/stats", {})),
+    Scenario("GET /metrics", lambda i, rng, ctx: ("GET", "/metrics", {})),
+    Scenario("GET /stats", lambda i, rng, ctx: ("GET", "/stats", {})),
+    Scenario("GET /categories/", lambda i, rng, ctx: ("GET", "/categories/?limit=50", {})),
+    Scenario("GET /categories/{id}",
+             lambda i, rng, ctx: ("GET", f"/categories/{rng.choice(ctx['categories'])}", {})),
+    Scenario("GET /products/", lambda i, rng, ctx: ("GET", f"/products/?limit=20&skip={rng.randrange(0, 200)}", {})),
+    Scenario("GET /products/ (deep cursor)",
+             lambda i, rng, ctx: ("GET", f"/products/?limit=20&cursor={ctx['deep_cursor']}", {})),
+    Scenario("GET /products/ (fields)",
+             lambda i, rng, ctx: ("GET", "/products/?limit=100&fields=id,name,price,stock_quantity", {})),
+    Scenario("GET /products/batch",
+             lambda i, rng, ctx: ("GET", "/products/batch?ids=" + ",".join(str(_product(rng, ctx)) for _ in range(50)),
+                                  {})),
+    Scenario("POST /products/batch",
+             lambda i, rng, ctx: ("POST", "/products/batch", {"json": {"ids": [_product(rng, ctx) for _ in range(50)]}})),
+    Scenario("GET /products/{id}", lambda i, rng, ctx: ("GET", f"/products/{_product(rng, ctx)}", {})),
+    Scenario("GET /products/category/{id}",
+             lambda i, rng, ctx: ("GET", f"/products/category/{rng.choice(ctx['categories'])}?limit=20", {})),
+    Scenario("GET /products/brand/{brand}",
+             lambda i, rng, ctx: ("GET", f"/products/brand/{rng.choice(ctx['brands'])}?limit=20", {})),
+    Scenario("GET /products/search/",
+             lambda i, rng, ctx: ("GET", f"/products/search/?q={rng.choice(SEARCH_TERMS)}&limit=20", {})),
+    Scenario("GET /products/suggest",
+             lambda i, rng, ctx: ("GET", f"/products/suggest?prefix={rng.choice(SEARCH_TERMS)[:rng.randint(1, 5)]}",
+                                  {})),
+    Scenario("GET /products/filter",
+             lambda i, rng, ctx: ("GET", f"/products/filter?category_id={rng.choice(ctx['categories'])}"
+                                         f"&brand={rng.choice(ctx['brands'])}&brand={rng.choice(ctx['brands'])}"
+                                         f"&min_price=100&max_price=2000&in_stock=true&sort=price_asc&limit=20", {})),
+    Scenario("GET /products/filter (specs)",
+             lambda i, rng, ctx: ("GET", f"/products/filter?spec.RAM={rng.choice(['8GB', '16GB', '32GB'])}"
+                                         f"&spec.Storage={rng.choice(['256GB', '512GB', '1TB'])}&limit=20", {})),
+    Scenario("GET /products/stock/available", lambda i, rng, ctx: ("GET", "/products/stock/available?limit=20", {})),
+    Scenario("GET /products/changes",
+             lambda i, rng, ctx: ("GET", f"/products/changes?since={ctx['changes_cursor']}&limit=100", {})),
+    Scenario("GET /products/export", lambda i, rng, ctx: ("GET", "/products/export", {}), share=0.01),
+    # Writes
+    Scenario("POST /categories/",
+             lambda i, rng, ctx: ("POST", "/categories/", {"json": {"name": f"Bench Category {ctx['run']}-{i}"}}),
+             ok=(201,)),
+    Scenario("PUT /categories/{id}",
+             lambda i, rng, ctx: ("PUT", f"/categories/{ctx['disposable'][i]}", {"json": {"description": f"v{i}"}}),
+             disposable="categories"),
+    Scenario("DELETE /categories/{id}",
+             lambda i, rng, ctx: ("DELETE", f"/categories/{ctx['disposable'][i]}", {}),
+             ok=(204,), disposable="categories"),
+    Scenario("POST /products/", lambda i, rng, ctx: ("POST", "/products/", {"json": _new_product(i, rng, ctx)}),
+             ok=(201,)),
+    Scenario("POST /products/import",
+             lambda i, rng, ctx: ("POST", "/products/import",
+                                  {"content": _import_body(i, rng, ctx),
+                                   "headers": {"Content-Type": "application/x-ndjson"}}),
+             share=0.1),
+    Scenario("PUT /products/{id}",
+             lambda i, rng, ctx: ("PUT", f"/products/{ctx['disposable'][i]}",
+                                  {"json": {"price": round(rng.uniform(19, 3999), 2)}}),
+             disposable="products"),
+    Scenario("PATCH /products/{id}/stock",
+             lambda i, rng, ctx: ("PATCH", f"/products/{ctx['disposable'][i]}/stock?quantity={rng.randint(0, 500)}", {}),
+             disposable="products"),
+    # 400 (insufficient stock) is a valid outcome once a hot product runs out
+    Scenario("PATCH /products/{id}/stock/decrease",
+             lambda i, rng, ctx: ("PATCH", f"/products/{_product(rng, ctx)}/stock/decrease?qty=1", {}),
+             ok=(200, 400)),
+    Scenario("POST /products/stock/decrease",
+             lambda i, rng, ctx: ("POST", "/products/stock/decrease",
+                                  {"json": {"items": [{"product_id": _product(rng, ctx), "quantity": 1}
+                                                      for _ in range(3)]}}),
+             ok=(200, 400)),
+    # Every cart reserves the same product: the contended checkout path
+    Scenario("POST /reservations (hot SKU)",
+             lambda i, rng, ctx: ("POST", "/reservations",
+                                  {"json": {"items": [{"product_id": ctx["min_id"], "quantity": 1}],
+                                            "ttl_seconds": 60}}),
+             ok=(201, 400)),
+    Scenario("DELETE /products/{id}",
+             lambda i, rng, ctx: ("DELETE", f"/products/{ctx['disposable'][i]}", {}),
+             ok=(204,), disposable="products"),
+]
+
+# ==================== Running ====================
+
+def _percentile(samples, q: float) -> float:
+    return samples[min(len(samples) - 1, max(0, int(round(q * len(samples))) - 1))]
+
+async def _drive(client, scenario: Scenario, total: int, concurrency: int, rng_seed: int, ctx: dict):
+    rng = random.Random(rng_seed)
+    requests = [scenario.build(i, rng, ctx) for i in range(total)]
+    latencies = []
+    errors = {}
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(method, url, kwargs):
+        async with semaphore:
+            started = time.perf_counter()
+            response = await client.request(method, url, **kwargs)
+            # Read the whole body so streamed responses are timed to the last byte
+            await response.aread()
+            latencies.append((time.perf_counter() - started) * 1000)
+            if response.status_code not in scenario.ok:
+                errors[response.status_code] = errors.get(response.status_code, 0) + 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(*request) for request in requests))
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    return {
+        "requests": total,
+        "rps": round(total / elapsed, 1),
+        "p50_ms": round(statistics.median(latencies), 3),
+        "p99_ms": round(_percentile(latencies, 0.99), 3),
+        "errors": {str(code): count for code, count in sorted(errors.items())},
+    }
+
+def _disposable(db, kind: str, count: int, ctx: dict):
+    """Rows a destructive scenario may update or delete, created outside the timed section"""
+    from sqlalchemy import insert
+    import models
+
+    if kind == "categories":
+        rows = [{"name": f"Bench Disposable {ctx['run']}-{i}"} for i in range(count)]
+        ids = db.execute(insert(models.Category).returning(models.Category.id), rows).scalars().all()
+    else:
+        now = datetime.utcnow()
+        rows = [dict(_new_product(i, random.Random(i), ctx), created_at=now, updated_at=now) for i in range(count)]
+        ids = db.execute(insert(models.Product).returning(models.Product.id), rows).scalars().all()
+    db.commit()
+    return list(ids)
+
+def _context(db, brands: int):
+    from sqlalchemy import func
+    import models
+    from benchmarks.catalog import brand_names
+    from pagination import encode_cursor
+
+    min_id, max_id, count = db.query(func.min(models.Product.id), func.max(models.Product.id),
+                                      func.count(models.Product.id)).one()
+    categories = [row.id for row in db.query(models.Category.id).order_by(models.Category.id)]
+    # A cursor three quarters of the way through the catalog
+    deep = db.query(models.Product.id).order_by(models.Product.id).offset(count * 3 // 4).limit(1).scalar()
+    return {"min_id": min_id, "max_id": max_id, "products": count, "categories": categories,
+            "brands": brand_names(brands), "deep_cursor": encode_cursor([deep or 0]),
+            "changes_cursor": encode_cursor([0]), "run": 0}
+
+async def _run_all(app, db, args, ctx):
+    import httpx
+
+    results = {}
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        for index, scenario in enumerate(SCENARIOS):
+            if args.routes and not any(pattern in scenario.name for pattern in args.routes):
+                continue
+            results[scenario.name] = {}
+            for concurrency in args.concurrency:
+                total = max(1, int(args.requests * scenario.share))
+                # Warm up connections and caches outside the measurement
+                for count, rng_seed in ((min(total, concurrency), args.seed - index), (total, args.seed + index)):
+                    # Every pass gets fresh names (ctx["run"]) and, if it needs them, fresh rows
+                    ctx["run"] += 1
+                    if scenario.disposable:
+                        ctx["disposable"] = _disposable(db, scenario.disposable, count, ctx)
+                    result = await _drive(client, scenario, count, concurrency, rng_seed, ctx)
+                results[scenario.name][str(concurrency)] = result
+                print(f"{scenario.name:<40} c={concurrency:<4} {results[scenario.name][str(concurrency)]}",
+                      file=sys.stderr)
+    return results
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def run(args) -> dict:
+    # The write scenarios update and delete rows, so a real database needs --destroy
+    url = scratch_url(args, "bench")
+    # database.py reads these at import time. The pool must cover the highest concurrency,
+    # or requests queue on connection checkout instead of exercising the route.
+    os.environ["DATABASE_URL"] = url
+    os.environ.setdefault("DB_POOL_SIZE", str(max(args.concurrency)))
+    os.environ.setdefault("DB_MAX_OVERFLOW", "0")
+
+    import database
+    import models
+    from benchmarks.catalog import seed
+    from main import app
+
+    database.init_db()
+    db = database.SessionLocal()
+    seeded_in = None
+    if db.query(models.Product.id).first() is None:
+        started = time.perf_counter()
+        seed(db, args.products, categories=args.categories, brands=args.brands, specs=args.specs, seed=args.seed)
+        seeded_in = round(time.perf_counter() - started, 2)
+    ctx = _context(db, args.brands)
+    # End the read transaction so the pool is all the app's during the load
+    db.commit()
+    try:
+        results = asyncio.run(_run_all(app, db, args, ctx))
+    finally:
+        db.close()
+    return {
+        "meta": {
+            "timestamp": datetime.utcnow().isoformat(timespec="seconds") + "Z",
+            "commit": _git_commit(),
+            "database": database.get_engine().dialect.name,
+            "async": database.DB_ASYNC,
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "products": ctx["products"],
+            "categories": len(ctx["categories"]),
+            "brands": args.brands,
+            "specs": args.specs,
+            "seed": args.seed,
+            "seed_seconds": seeded_in,
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+        },
+        "results": results,
+    }
+
+# ==================== Comparing ====================
+
+def compare(baseline: dict, current: dict, threshold: float):
+    """Per-route regressions of the current run against the baseline (routes missing from either are skipped)"""
+    regressions = []
+    for route, levels in current["results"].items():
+        for concurrency, now in levels.items():
+            before = baseline.get("results", {}).get(route, {}).get(concurrency)
+            if before is None:
+                continue
+            checks = [("rps", before["rps"], now["rps"], now["rps"] < before["rps"] * (1 - threshold))]
+            for metric in ("p50_ms", "p99_ms"):
+                checks.append((metric, before[metric], now[metric], now[metric] > before[metric] * (1 + threshold)))
+            for metric, old, new, regressed in checks:
+                if regressed:
+                    change = (new - old) / old * 100 if old else float("inf")
+                    regressions.append({"route": route, "concurrency": int(concurrency), "metric": metric,
+                                        "baseline": old, "current": new, "change_pct": round(change, 1)})
+            if now["errors"] and not before["errors"]:
+                regressions.append({"route": route, "concurrency": int(concurrency), "metric": "errors",
+                                    "baseline": before["errors"], "current": now["errors"], "change_pct": None})
+    return regressions
+
+def _report(regressions, threshold: float):
+    if not regressions:
+        print(f"No regressions beyond {threshold:.0%}", file=sys.stderr)
+        return 0
+    print(f"{len(regressions)} regression(s) beyond {threshold:.0%}:", file=sys.stderr)
+    for item in regressions:
+        print(f"  {item['route']} c={item['concurrency']} {item['metric']}: "
+              f"{item['baseline']} -> {item['current']} ({item['change_pct']}%)", file=sys.stderr)
+    return 1
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--products", type=int, default=10_000)
+    parser.add_argument("--categories", type=int, default=8)
+    parser.add_argument("--brands", type=int, default=10)
+    parser.add_argument("--specs", type=int, default=4, help="specification keys per product (up to 8)")
+    parser.add_argument("--requests", type=int, default=500, help="requests per route and concurrency level")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 10, 50])
+    parser.add_argument("--routes", nargs="*", help="only run routes whose name contains one of these")
+    parser.add_argument("--seed", type=int, default=42)
+    add_database_args(parser)
+    parser.add_argument("--output", default=None, help="write the JSON report here (default: stdout)")
+    parser.add_argument("--baseline", default=None, help="compare this run against a stored report")
+    parser.add_argument("--compare", nargs=2, metavar=("BASELINE", "CURRENT"), help="compare two stored reports")
+    parser.add_argument("--threshold", type=float, default=0.2, help="allowed relative change (default 0.2 = 20%%)")
+    args = parser.parse_args()
+
+    if args.compare:
+        with open(args.compare[0]) as f:
+            baseline = json.load(f)
+        with open(args.compare[1]) as f:
+            current = json.load(f)
+        sys.exit(_report(compare(baseline, current, args.threshold), args.threshold))
+
+    report = run(args)
+    if args.baseline:
+        with open(args.baseline) as f:
+            report["regressions"] = compare(json.load(f), report, args.threshold)
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+    if args.baseline:
+        sys.exit(_report(report["regressions"], args.threshold))
+
+if __name__ == "__main__":
+    main()
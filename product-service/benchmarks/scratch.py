@@ -0,0 +1,32 @@
+"""Scratch databases for the benchmarks that drop tables or write to the catalog"""
+import os
+import tempfile
+
+# Benchmarks that drop the tables, or write to the catalog, run on a temporary SQLite
+# file unless given --database-url, which must then be confirmed with --destroy:
+# pointing one at a real database would otherwise wipe it. No application imports at
+# module level: bench_admission sets DATABASE_URL from here before importing the app.
+
+def add_database_args(parser):
+    parser.add_argument("--database-url", default=None, help="defaults to a temporary SQLite file")
+    parser.add_argument("--destroy", action="store_true",
+                        help="confirm that every table at --database-url may be dropped and rewritten")
+
+def scratch_url(args, name: str) -> str:
+    """--database-url once confirmed with --destroy, else a new temporary SQLite file"""
+    if args.database_url is None:
+        return f"sqlite:///{os.path.join(tempfile.mkdtemp(), name + '.db')}"
+    if not args.destroy:
+        raise SystemExit(f"{name}: refusing to overwrite the database at --database-url without --destroy")
+    return args.database_url
+
+def scratch_engine(args, name: str):
+    """Engine on scratch_url() with the tables dropped and created again; drop them with Base.metadata
+    .drop_all(bind=engine) afterwards"""
+    from sqlalchemy import create_engine
+    from database import Base
+
+    engine = create_engine(scratch_url(args, name))
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    return engine
@@ -0,0 +1,108 @@
+from datetime import datetime
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import Numeric, Row, cast, func, select, update
+from sqlalchemy.orm import Session
+
+import database
+import filtering
+import models
+import stats
+
+# ==================== Bulk Updates ====================
+# Repricing a category or brand, or patching a list of products, without one
+# request (and one transaction) per product. A repricing is a single UPDATE over
+# the filtered rows; a batch of patches is one executemany UPDATE per set of
+# fields being changed. Both set updated_at, so list ETags and the change feed see
+# every product that moved.
+#
+# A repricing checks for prices that would not stay positive first, then takes
+# each row's previous price from a locking subquery of the UPDATE itself, so one
+# statement both writes the rows and returns their before and after state (SQLite's
+# RETURNING cannot see the subquery; there the prices are read just before). A batch
+# of patches locks its rows first, in id order, and reads their previous values.
+# Either way crud.py can keep catalog stats, specs, the change feed, the caches and
+# the typeahead index in step with the rows that actually changed.
+
+Product = models.Product
+
+# Columns a bulk patch may set (everything in schemas.ProductUpdate)
+PATCH_FIELDS = ("name", "description", "price", "stock_quantity", "brand", "category_id", "specifications",
+                "image_url")
+
+def lock_rows(db: Session, conditions: list, columns: Sequence) -> Dict[int, Row]:
+    """Lock the products matching `conditions` (in id order) and read `columns`, which start with Product.id"""
+    if db.get_bind().dialect.name == "sqlite":
+        # No SELECT ... FOR UPDATE: a no-op UPDATE takes the write lock before anything is read
+        statement = (update(Product).where(*conditions)
+                     .values(updated_at=Product.updated_at)
+                     .returning(*columns))
+    else:
+        statement = select(*columns).where(*conditions).order_by(Product.id).with_for_update()
+    return {row[0]: row for row in sorted(db.execute(statement), key=lambda row: row[0])}
+
+def _new_price(percent: Optional[float], amount: Optional[float]):
+    change = Product.price * (1 + percent / 100) if percent is not None else Product.price + amount
+    return func.round(cast(change, Numeric(14, 4)), 2)
+
+def reprice(db: Session, criteria: filtering.ProductFilter, percent: Optional[float] = None,
+            amount: Optional[float] = None) -> Tuple[Optional[List[tuple]], List[int]]:
+    """Raise or lower the price of every product matching `criteria` by `percent` or by `amount`, rounded to
+    cents, in one UPDATE, without committing. Returns ([(product_id, before state, after state)], []) or, if
+    some prices would drop to zero or below, (None, their product ids) with nothing written. The products
+    table's price CHECK rejects a price a concurrent write pushed to zero after the check."""
+    conditions = criteria.conditions()
+    new_price = _new_price(percent, amount)
+    statement = update(Product).values(price=new_price, updated_at=datetime.utcnow())
+
+    if db.get_bind().dialect.name == "sqlite":
+        # RETURNING sees only the new row (and not UPDATE ... FROM tables), so the previous prices are read
+        # first, holding the write lock so that no other writer commits in between
+        database.lock_table(db, Product.__table__)
+        prices = {product_id: (price, new) for product_id, price, new in
+                  db.execute(select(Product.id, Product.price, new_price).where(*conditions))}
+        failed = sorted(product_id for product_id, (_, new) in prices.items() if new <= 0)
+        if failed:
+            return None, failed
+        rows = [(product_id, category_id, brand, prices[product_id][0], price, stock)
+                for product_id, category_id, brand, price, stock in
+                db.execute(statement.where(*conditions).returning(
+                    Product.id, Product.category_id, Product.brand, Product.price, Product.stock_quantity))]
+    else:
+        failed = db.execute(
+            select(Product.id).where(*conditions, new_price <= 0).order_by(Product.id)
+        ).scalars().all()
+        if failed:
+            return None, failed
+        # The previous price comes from a locking subquery of the same statement; FOR UPDATE makes it the
+        # latest committed price of a row another writer held
+        previous = (select(Product.id, Product.price).where(*conditions)
+                    .order_by(Product.id).with_for_update().subquery())
+        rows = db.execute(statement.where(Product.id == previous.c.id).returning(
+            Product.id, Product.category_id, Product.brand, previous.c.price, Product.price, Product.stock_quantity
+        )).all()
+    transitions = [
+        (product_id, (category_id, brand, old_price, stock or 0), (category_id, brand, float(price), stock or 0))
+        for product_id, category_id, brand, old_price, price, stock in sorted(rows)
+    ]
+    return transitions, []
+
+def state(values: dict) -> stats.State:
+    """Catalog stats state of a product given as a dict of its columns"""
+    return values["category_id"], values["brand"], values["price"], values["stock_quantity"] or 0
+
+def patch(db: Session, patches: Dict[int, dict]) -> List[Tuple[dict, dict]]:
+    """Apply {product_id: {field: value}} patches, without committing. Returns (before, after) column dicts
+    (id plus PATCH_FIELDS) of the products that exist, in id order; ids that do not exist are left out."""
+    columns = [Product.id] + [getattr(Product, field) for field in PATCH_FIELDS]
+    found = [dict(row._mapping) for row in lock_rows(db, [Product.id.in_(patches)], columns).values()]
+    now = datetime.utcnow()
+    groups: Dict[tuple, List[dict]] = {}
+    for row in found:
+        values = patches[row["id"]]
+        if values:
+            groups.setdefault(tuple(sorted(values)), []).append(dict(values, id=row["id"], updated_at=now))
+    # ORM bulk UPDATE by primary key: one executemany per set of fields
+    for rows in groups.values():
+        db.execute(update(Product), rows)
+    return [(row, dict(row, **patches[row["id"]])) for row in found]
@@ -0,0 +1,90 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, Optional
+
+# ==================== In-Process Read-Through Cache ====================
+# Holds Pydantic snapshots (never ORM objects, which are tied to a session).
+# Every write path in crud.py invalidates the entries it touches after commit.
+# Each worker process has its own cache, so the TTL bounds how long another
+# worker's write can go unnoticed.
+
+class TTLCache:
+    """Thread-safe LRU cache whose entries also expire after `ttl` seconds"""
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._version = 0
+
+    @property
+    def version(self) -> int:
+        """Bumped by every invalidation; pass it to set() to drop fills that raced a write"""
+        return self._version
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or entry[1] < time.monotonic():
+                if entry is not None:
+                    del self._data[key]
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def set(self, key: Hashable, value: Any, version: Optional[int] = None):
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            if version is not None and version != self._version:
+                return
+            self._data[key] = (value, time.monotonic() + self.ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def invalidate(self, key: Hashable):
+        with self._lock:
+            self._version += 1
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._version += 1
+            self._data.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "ttl_seconds": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+product_cache = TTLCache(
+    maxsize=int(os.getenv("PRODUCT_CACHE_SIZE", "10000")),
+    ttl=float(os.getenv("PRODUCT_CACHE_TTL", "30")),
+)
+category_cache = TTLCache(
+    maxsize=int(os.getenv("CATEGORY_CACHE_SIZE", "1000")),
+    ttl=float(os.getenv("CATEGORY_CACHE_TTL", "300")),
+)
+
+def clear_all():
+    """Drop every cached entry (tests, or after out-of-band database changes)"""
+    product_cache.clear()
+    category_cache.clear()
+
+def stats() -> dict:
+    return {"products": product_cache.stats(), "categories": category_cache.stats()}
@@ -0,0 +1,134 @@
+from datetime import datetime, timedelta
+from typing import Iterable, List, Tuple
+
+from sqlalchemy import delete, func, insert, literal, select, tuple_
+from sqlalchemy.orm import Session
+
+import models
+
+# ==================== Product Change Feed ====================
+# Every product write appends (seq, product_id, op) to product_changes in the same
+# transaction, so the log and the products table never disagree. Replicas keep a
+# local copy current by asking for the entries after the last position they applied:
+# O(changes) per poll instead of re-reading the catalog. Deletes leave a tombstone.
+#
+# A page collapses repeated entries for a product into its latest one and carries
+# the product's current state, so replaying pages in order converges on the catalog.
+#
+# Sequence numbers are handed out at INSERT but become visible at COMMIT, so on a
+# database with concurrent writers (PostgreSQL) a lower seq can appear after a
+# higher one was served. Each entry therefore also records the id of the writing
+# transaction (txid_current()), and the feed is read in (txid, seq) order up to
+# the snapshot's xmin: every transaction below it has finished, so no entry can
+# later appear before the cursor. A long-running write transaction holds the feed
+# back until it ends. SQLite serializes writers; its txid is always 0.
+
+ProductChange = models.ProductChange
+
+UPSERT = "upsert"
+DELETE = "delete"
+
+RETENTION_DAYS = 30
+
+# A position in the feed: (txid, seq) of an entry, (0, 0) before the first one
+Position = Tuple[int, int]
+
+class CursorExpired(Exception):
+    """The entries after the consumer's cursor have been pruned; it must resync from the full list"""
+
+def _txid(db: Session):
+    """Id of the current transaction (PostgreSQL), or None where writers are serialized"""
+    return func.txid_current() if db.get_bind().dialect.name == "postgresql" else None
+
+def _visible(db: Session, query):
+    """Restrict a query to entries of transactions that have finished for every snapshot"""
+    if db.get_bind().dialect.name != "postgresql":
+        return query
+    horizon = select(func.txid_snapshot_xmin(func.txid_current_snapshot())).scalar_subquery()
+    return query.where(ProductChange.txid < horizon)
+
+def record(db: Session, product_ids: Iterable[int], op: str = UPSERT):
+    """Append change entries for products, without committing"""
+    now = datetime.utcnow()
+    rows = [{"product_id": product_id, "op": op, "changed_at": now} for product_id in product_ids]
+    if rows:
+        statement = insert(ProductChange)
+        txid = _txid(db)
+        if txid is not None:
+            statement = statement.values(txid=txid)
+        db.execute(statement, rows)
+
+def record_category(db: Session, category_id: int):
+    """Append an upsert for every product of a category (they embed it), without committing"""
+    txid = _txid(db)
+    db.execute(insert(ProductChange).from_select(
+        ["product_id", "op", "changed_at", "txid"],
+        select(models.Product.id, literal(UPSERT), literal(datetime.utcnow()),
+               txid if txid is not None else literal(0))
+        .where(models.Product.category_id == category_id)
+        .order_by(models.Product.id)
+    ))
+
+def head(db: Session) -> Position:
+    """Position of the latest entry that can be served ((0, 0) when there is none)"""
+    query = select(ProductChange.txid, ProductChange.seq)
+    latest = db.execute(_visible(db, query).order_by(ProductChange.txid.desc(), ProductChange.seq.desc())
+                        .limit(1)).first()
+    return (latest.txid, latest.seq) if latest else (0, 0)
+
+def _check_retained(db: Session, since: Position):
+    """Raise CursorExpired if entries after `since` may have been pruned. Pruning drops a prefix of the
+    feed, so a cursor is still good while it is not below the oldest entry left."""
+    if since == (0, 0):
+        # Nothing read yet: sequence numbers start at 1, so a later oldest one means pruned entries
+        # (a rolled-back INSERT can leave a harmless gap; the consumer then resyncs needlessly)
+        oldest = db.execute(select(func.min(ProductChange.seq))).scalar()
+        if oldest is not None and oldest > 1:
+            raise CursorExpired()
+        return
+    oldest = db.execute(select(ProductChange.txid, ProductChange.seq)
+                        .order_by(ProductChange.txid, ProductChange.seq).limit(1)).first()
+    if oldest is not None and since < tuple(oldest):
+        raise CursorExpired()
+
+def changes_since(db: Session, since: Position, limit: int = 1000,
+                  options=()) -> Tuple[List[tuple], Position, bool]:
+    """Entries after the `since` position: ([(change, product or None)], next position, has_more).
+    Raises CursorExpired if entries after `since` were pruned."""
+    _check_retained(db, since)
+    query = select(ProductChange).where(tuple_(ProductChange.txid, ProductChange.seq) > since)
+    entries = db.execute(_visible(db, query).order_by(ProductChange.txid, ProductChange.seq)
+                         .limit(limit + 1)).scalars().all()
+    has_more = len(entries) > limit
+    entries = entries[:limit]
+    if not entries:
+        return [], since, False
+
+    latest = {}
+    for entry in entries:
+        latest.pop(entry.product_id, None)
+        latest[entry.product_id] = entry
+    upserted = [product_id for product_id, entry in latest.items() if entry.op == UPSERT]
+    products = {}
+    if upserted:
+        products = {
+            product.id: product for product in
+            db.query(models.Product).options(*options).filter(models.Product.id.in_(upserted))
+        }
+    # A product deleted after its upsert was logged is reported as deleted right away
+    changes = [(entry, products.get(product_id)) for product_id, entry in latest.items()]
+    return changes, (entries[-1].txid, entries[-1].seq), has_more
+
+def prune(db: Session, days: int = RETENTION_DAYS) -> int:
+    """Drop the entries before the first one younger than `days`, in feed order (always keeping the head);
+    returns how many went. An old entry that sorts after a young one stays, so no consumer misses it."""
+    newest = head(db)
+    young = db.execute(
+        select(ProductChange.txid, ProductChange.seq)
+        .where(ProductChange.changed_at >= datetime.utcnow() - timedelta(days=days))
+        .order_by(ProductChange.txid, ProductChange.seq).limit(1)
+    ).first()
+    boundary = min(newest, tuple(young)) if young is not None else newest
+    result = db.execute(delete(ProductChange).where(tuple_(ProductChange.txid, ProductChange.seq) < boundary))
+    db.commit()
+    return result.rowcount
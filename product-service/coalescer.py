@@ -0,0 +1,124 @@
+import os
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, Dict, List, Optional, Tuple
+
+import crud
+import database
+
+# ==================== Stock Update Coalescing (group commit) ====================
+# With STOCK_COALESCE_WINDOW_MS > 0, PATCH /products/{id}/stock and /stock/decrease
+# do not each run their own transaction. They queue their adjustment and wait; a
+# flusher thread collects everything queued within the window and applies it with
+# crud.apply_stock_adjustments: per product, the adjustments are replayed in
+# arrival order against the locked row (so each caller still gets its own accepted
+# quantity or rejection, and a decrease never takes stock below the reserved
+# quantity), then written as one net UPDATE, all in one commit.
+#
+# A hot SKU then costs one row lock and one fsync per window instead of one per
+# request. The price is up to one window of added latency per adjustment.
+
+WINDOW_MS = float(os.getenv("STOCK_COALESCE_WINDOW_MS", "0"))
+
+DECREASE = "decrease"
+SET = "set"
+
+class StockCoalescer:
+    """Queues stock adjustments and applies each window's worth in a single transaction"""
+
+    def __init__(self, session_factory: Callable, window_ms: float = WINDOW_MS):
+        self.session_factory = session_factory
+        self.window = window_ms / 1000
+        self.batches = 0
+        self.adjustments = 0
+        self._pending: Dict[int, List[Tuple[str, int, Future]]] = {}
+        self._condition = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+        self._stopping = False
+
+    def submit(self, product_id: int, op: str, quantity: int) -> Future:
+        """Queue an adjustment; the future resolves to the new quantity, or None if it was rejected"""
+        future: Future = Future()
+        with self._condition:
+            if self._stopping:
+                raise RuntimeError("Stock coalescer is shut down")
+            self._pending.setdefault(product_id, []).append((op, quantity, future))
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="stock-coalescer", daemon=True)
+                self._thread.start()
+            self._condition.notify()
+        return future
+
+    def decrease(self, product_id: int, quantity: int) -> Optional[int]:
+        """Blocking decrease: the new quantity, or None for insufficient stock or a missing product"""
+        return self.submit(product_id, DECREASE, quantity).result()
+
+    def set(self, product_id: int, quantity: int) -> Optional[int]:
+        """Blocking overwrite: the new quantity, or None for a missing product"""
+        return self.submit(product_id, SET, quantity).result()
+
+    def shutdown(self):
+        """Apply what is still queued and stop the flusher thread"""
+        with self._condition:
+            self._stopping = True
+            self._condition.notify()
+            thread = self._thread
+        if thread is not None:
+            thread.join()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._pending and not self._stopping:
+                    self._condition.wait()
+                if not self._pending:
+                    return
+                stopping = self._stopping
+            if not stopping:
+                # The first adjustment opens the window; everything queued until it closes goes together
+                time.sleep(self.window)
+            with self._condition:
+                batch, self._pending = self._pending, {}
+            self._flush(batch)
+
+    def _flush(self, batch: Dict[int, List[Tuple[str, int, Future]]]):
+        adjustments = {product_id: [(op, quantity) for op, quantity, _ in queued]
+                       for product_id, queued in batch.items()}
+        db = self.session_factory()
+        try:
+            results = crud.apply_stock_adjustments(db, adjustments)
+        except Exception as exc:
+            db.rollback()
+            for queued in batch.values():
+                for _, _, future in queued:
+                    future.set_exception(exc)
+            return
+        finally:
+            db.close()
+        self.batches += 1
+        for product_id, queued in batch.items():
+            self.adjustments += len(queued)
+            for (_, _, future), result in zip(queued, results[product_id]):
+                future.set_result(result)
+
+_coalescer: Optional[StockCoalescer] = None
+_lock = threading.Lock()
+
+def get() -> Optional[StockCoalescer]:
+    """The process-wide coalescer when STOCK_COALESCE_WINDOW_MS is set, else None"""
+    global _coalescer
+    if WINDOW_MS <= 0:
+        return None
+    if _coalescer is None:
+        with _lock:
+            if _coalescer is None:
+                _coalescer = StockCoalescer(database.SessionLocal, WINDOW_MS)
+    return _coalescer
+
+def shutdown():
+    global _coalescer
+    with _lock:
+        if _coalescer is not None:
+            _coalescer.shutdown()
+            _coalescer = None
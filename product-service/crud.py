@@ -1,7 +1,41 @@
-from sqlalchemy.orm import Session
-from typing import List, Optional
+from sqlalchemy import update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session, joinedload, load_only, noload, selectinload
+from typing import Dict, List, Optional, Sequence, Tuple
+from datetime import datetime
 import models
 import schemas
+import bulk
+import cache
+import changes
+import database
+from pagination import paginate
+import filtering
+import reservations
+import search
+import specs
+import stats
+import suggest
+
+def _after(after_id: Optional[int]):
+    """Keyset bound for listings sorted by id"""
+    return None if after_id is None else [after_id]
+
+def product_options(fields: Optional[Sequence[str]] = None):
+    """Loader options for product reads.
+
+    By default the category is eager-loaded with one extra SELECT ... IN per page
+    instead of one lazy SELECT per product. With `fields`, only those columns are
+    loaded and the category is skipped unless "category" is one of them."""
+    if fields is None:
+        return [selectinload(models.Product.category)]
+    columns = [getattr(models.Product, field) for field in fields if field != "category"]
+    options = [load_only(*columns)] if columns else []
+    if "category" in fields:
+        options.append(selectinload(models.Product.category))
+    else:
+        options.append(noload(models.Product.category))
+    return options
 
 # ==================== Category CRUD Operations ====================
 
@@ -9,13 +43,29 @@ def get_category(db: Session, category_id: int):
     """Get a single category by ID"""
     return db.query(models.Category).filter(models.Category.id == category_id).first()
 
+def get_category_cached(db: Session, category_id: int):
+    """Get a category snapshot (schemas.Category) through the read-through cache"""
+    cached = cache.category_cache.get(category_id)
+    if cached is not None:
+        return cached
+    version = cache.category_cache.version
+    # Entries live for a TTL, so fill them from the primary, never from a lagging replica
+    with database.primary_reads(db):
+        db_category = get_category(db, category_id)
+    if db_category is None:
+        return None
+    snapshot = schemas.Category.model_validate(db_category)
+    cache.category_cache.set(category_id, snapshot, version)
+    return snapshot
+
 def get_category_by_name(db: Session, name: str):
     """Get a category by name"""
     return db.query(models.Category).filter(models.Category.name == name).first()
 
-def get_categories(db: Session, skip: int = 0, limit: int = 100):
-    """Get all categories with pagination"""
-    return db.query(models.Category).offset(skip).limit(limit).all()
+def get_categories(db: Session, skip: int = 0, limit: int = 100, after_id: Optional[int] = None):
+    """Get all categories with pagination (offset via skip, or keyset via after_id)"""
+    query = db.query(models.Category)
+    return paginate(query, [models.Category.id], skip, limit, _after(after_id)).all()
 
 def create_category(db: Session, category: schemas.CategoryCreate):
     """Create a new category"""
@@ -35,8 +85,14 @@ def update_category(db: Session, category_id: int, category: schemas.CategoryUpd
         update_data = category.dict(exclude_unset=True)
         for key, value in update_data.items():
             setattr(db_category, key, value)
+        # Product responses embed their category, so its products count as changed too (ETags)
+        db.query(models.Product).filter(models.Product.category_id == category_id).update(
+            {models.Product.updated_at: datetime.utcnow()}, synchronize_session=False
+        )
+        changes.record_category(db, category_id)
         db.commit()
         db.refresh(db_category)
+        _invalidate_category(category_id)
     return db_category
 
 def delete_category(db: Session, category_id: int):
@@ -45,44 +101,116 @@ def delete_category(db: Session, category_id: int):
     if db_category:
         db.delete(db_category)
         db.commit()
+        _invalidate_category(category_id)
         return True
     return False
 
+def _invalidate_category(category_id: int):
+    """Cached products embed their category, so they go too"""
+    cache.category_cache.invalidate(category_id)
+    cache.product_cache.clear()
+
 # ==================== Product CRUD Operations ====================
 
 def get_product(db: Session, product_id: int):
     """Get a single product by ID"""
-    return db.query(models.Product).filter(models.Product.id == product_id).first()
+    return db.query(models.Product).options(
+        joinedload(models.Product.category)
+    ).filter(models.Product.id == product_id).first()
+
+def get_product_cached(db: Session, product_id: int):
+    """Get a product snapshot (schemas.Product) through the read-through cache"""
+    cached = cache.product_cache.get(product_id)
+    if cached is not None:
+        return cached
+    version = cache.product_cache.version
+    # From the primary too, like categories
+    with database.primary_reads(db):
+        db_product = get_product(db, product_id)
+    if db_product is None:
+        return None
+    snapshot = schemas.Product.model_validate(db_product)
+    cache.product_cache.set(product_id, snapshot, version)
+    return snapshot
 
-def get_products(db: Session, skip: int = 0, limit: int = 100):
-    """Get all products with pagination"""
-    return db.query(models.Product).offset(skip).limit(limit).all()
+def get_products_by_ids(db: Session, product_ids: List[int]):
+    """Get many products by ID with a single IN query"""
+    if not product_ids:
+        return []
+    return db.query(models.Product).options(*product_options()).filter(
+        models.Product.id.in_(product_ids)
+    ).all()
 
-def get_products_by_category(db: Session, category_id: int, skip: int = 0, limit: int = 100):
+def get_products(db: Session, skip: int = 0, limit: int = 100, after_id: Optional[int] = None,
+                 fields: Optional[Sequence[str]] = None):
+    """Get all products with pagination (offset via skip, or keyset via after_id)"""
+    query = db.query(models.Product).options(*product_options(fields))
+    return paginate(query, [models.Product.id], skip, limit, _after(after_id)).all()
+
+def get_products_by_category(db: Session, category_id: int, skip: int = 0, limit: int = 100,
+                             after_id: Optional[int] = None, fields: Optional[Sequence[str]] = None):
     """Get products filtered by category"""
-    return db.query(models.Product).filter(
+    query = db.query(models.Product).options(*product_options(fields)).filter(
         models.Product.category_id == category_id
-    ).offset(skip).limit(limit).all()
+    )
+    return paginate(query, [models.Product.id], skip, limit, _after(after_id)).all()
 
-def get_products_by_brand(db: Session, brand: str, skip: int = 0, limit: int = 100):
+def get_products_by_brand(db: Session, brand: str, skip: int = 0, limit: int = 100,
+                          after_id: Optional[int] = None, fields: Optional[Sequence[str]] = None):
     """Get products filtered by brand (for ElectroZone: Apple, Samsung, Dell, etc.)"""
-    return db.query(models.Product).filter(
+    query = db.query(models.Product).options(*product_options(fields)).filter(
         models.Product.brand == brand
-    ).offset(skip).limit(limit).all()
+    )
+    return paginate(query, [models.Product.id], skip, limit, _after(after_id)).all()
+
+def search_products(db: Session, search_term: str, skip: int = 0, limit: int = 100,
+                    after: Optional[Sequence] = None):
+    """Search products by name, brand or description, best matches first"""
+    return [product for product, _ in search_products_ranked(db, search_term, skip=skip, limit=limit, after=after)]
+
+def search_products_ranked(db: Session, search_term: str, skip: int = 0, limit: int = 100,
+                           after: Optional[Sequence] = None, fields: Optional[Sequence[str]] = None):
+    """Search products, returning (product, score) pairs so callers can build keyset cursors"""
+    return search.search(db, search_term, skip=skip, limit=limit, after=after,
+                         options=product_options(fields))
+
+def filter_products(db: Session, criteria: filtering.ProductFilter, sort: str = "id", skip: int = 0,
+                    limit: int = 100, after: Optional[Sequence] = None):
+    """Get products matching any mix of category, brand, price range and stock filters"""
+    return filtering.filter_products(db, criteria, sort=sort, skip=skip, limit=limit, after=after,
+                                     options=product_options())
 
-def search_products(db: Session, search_term: str, skip: int = 0, limit: int = 100):
-    """Search products by name or description"""
-    search_pattern = f"%{search_term}%"
-    return db.query(models.Product).filter(
-        (models.Product.name.ilike(search_pattern)) |
-        (models.Product.description.ilike(search_pattern))
-    ).offset(skip).limit(limit).all()
+def count_filtered_products(db: Session, criteria: filtering.ProductFilter) -> int:
+    """Count all products matching the filter criteria"""
+    return filtering.count_products(db, criteria)
 
-def get_products_in_stock(db: Session, skip: int = 0, limit: int = 100):
+def get_products_version(db: Session, criteria: filtering.ProductFilter):
+    """(max updated_at, count) of the products matching the criteria, for list ETags"""
+    return filtering.version(db, criteria)
+
+def get_product_facets(db: Session, criteria: filtering.ProductFilter) -> dict:
+    """Brand, category and price-bucket counts for the filter criteria"""
+    return filtering.facets(db, criteria)
+
+def get_product_changes(db: Session, since, limit: int = 1000):
+    """Product changes after the `since` (txid, seq) position, each with the product's current state"""
+    return changes.changes_since(db, since, limit=limit, options=product_options())
+
+def get_changes_head(db: Session):
+    """Position of the latest product change that can be served"""
+    return changes.head(db)
+
+def get_catalog_stats(db: Session) -> dict:
+    """Catalog, per-category and per-brand totals from the incrementally maintained stats"""
+    return stats.summary(db)
+
+def get_products_in_stock(db: Session, skip: int = 0, limit: int = 100, after_id: Optional[int] = None,
+                          fields: Optional[Sequence[str]] = None):
     """Get products that are in stock (quantity > 0)"""
-    return db.query(models.Product).filter(
+    query = db.query(models.Product).options(*product_options(fields)).filter(
         models.Product.stock_quantity > 0
-    ).offset(skip).limit(limit).all()
+    )
+    return paginate(query, [models.Product.id], skip, limit, _after(after_id)).all()
 
 def create_product(db: Session, product: schemas.ProductCreate):
     """Create a new product"""
@@ -97,45 +225,275 @@ def create_product(db: Session, product: schemas.ProductCreate):
         image_url=product.image_url
     )
     db.add(db_product)
+    db.flush()
+    specs.sync_specs(db, db_product.id, product.specifications)
+    stats.apply(db, [(None, stats.state(db_product))])
+    changes.record(db, [db_product.id])
     db.commit()
     db.refresh(db_product)
+    suggest.index.put(db_product.id, db_product.name, db_product.brand, db_product.stock_quantity)
     return db_product
 
 def update_product(db: Session, product_id: int, product: schemas.ProductUpdate):
-    """Update an existing product"""
+    """Update an existing product. Raises reservations.StockBelowReserved if the new stock_quantity is
+    below the reserved quantity."""
+    update_data = product.dict(exclude_unset=True)
+    if "stock_quantity" in update_data:
+        _guard_reserved(db, {product_id: update_data["stock_quantity"]})
     db_product = get_product(db, product_id)
     if db_product:
-        update_data = product.dict(exclude_unset=True)
+        before = stats.state(db_product)
         for key, value in update_data.items():
             setattr(db_product, key, value)
+        if "specifications" in update_data:
+            specs.sync_specs(db, product_id, update_data["specifications"])
+        db.flush()
+        stats.apply(db, [(before, stats.state(db_product))])
+        changes.record(db, [product_id])
         db.commit()
         db.refresh(db_product)
+        cache.product_cache.invalidate(product_id)
+        suggest.index.put(product_id, db_product.name, db_product.brand, db_product.stock_quantity)
     return db_product
 
 def update_product_stock(db: Session, product_id: int, quantity: int):
-    """Update product stock quantity (useful for order processing)"""
+    """Update product stock quantity (useful for order processing).
+    Raises reservations.StockBelowReserved if `quantity` is below the reserved quantity."""
+    _guard_reserved(db, {product_id: quantity})
     db_product = get_product(db, product_id)
     if db_product:
+        before = stats.state(db_product)
         db_product.stock_quantity = quantity
+        db.flush()
+        stats.apply(db, [(before, stats.state(db_product))])
+        changes.record(db, [product_id])
         db.commit()
         db.refresh(db_product)
+        cache.product_cache.invalidate(product_id)
     return db_product
 
 def decrease_product_stock(db: Session, product_id: int, quantity: int):
-    """Decrease product stock quantity (for order processing). Returns None if insufficient stock."""
-    db_product = get_product(db, product_id)
-    if db_product and db_product.stock_quantity >= quantity:
-        db_product.stock_quantity -= quantity
-        db.commit()
-        db.refresh(db_product)
-        return db_product
-    return None
+    """Decrease product stock quantity (for order processing) in one conditional UPDATE.
+    Returns the new quantity, or None if the product is missing or has insufficient stock."""
+    after = _decrement_stock(db, product_id, quantity)
+    new_quantity = None
+    if after is not None:
+        new_quantity = after[3]
+        stats.apply(db, [(_restocked(after, quantity), after)])
+        changes.record(db, [product_id])
+    db.commit()
+    if new_quantity is not None:
+        cache.product_cache.invalidate(product_id)
+    return new_quantity
+
+def decrease_stock_batch(db: Session, lines: List[Tuple[int, int]]):
+    """Decrease stock for every (product_id, quantity) line of an order, all or nothing.
+    Returns ({product_id: new_quantity}, []) on success, or (None, failed_product_ids)."""
+    totals: Dict[int, int] = {}
+    for product_id, quantity in lines:
+        totals[product_id] = totals.get(product_id, 0) + quantity
+
+    new_quantities, failed, transitions = {}, [], []
+    # A fixed lock order keeps two overlapping orders from deadlocking each other
+    for product_id in sorted(totals):
+        after = _decrement_stock(db, product_id, totals[product_id])
+        if after is None:
+            failed.append(product_id)
+        else:
+            new_quantities[product_id] = after[3]
+            transitions.append((_restocked(after, totals[product_id]), after))
+    if failed:
+        db.rollback()
+        return None, failed
+    stats.apply(db, transitions)
+    changes.record(db, new_quantities)
+    db.commit()
+    for product_id in new_quantities:
+        cache.product_cache.invalidate(product_id)
+    return new_quantities, []
+
+def _decrement_stock(db: Session, product_id: int, quantity: int) -> Optional[stats.State]:
+    """UPDATE ... WHERE available >= :qty RETURNING the product's new stats.State, without committing.
+    Reserved stock is not available to direct sales."""
+    row = db.execute(
+        update(models.Product)
+        .where(models.Product.id == product_id,
+               models.Product.stock_quantity - models.Product.reserved_quantity >= quantity)
+        .values(stock_quantity=models.Product.stock_quantity - quantity, updated_at=datetime.utcnow())
+        .returning(models.Product.category_id, models.Product.brand, models.Product.price,
+                   models.Product.stock_quantity)
+    ).one_or_none()
+    return None if row is None else tuple(row)
+
+def _restocked(state: stats.State, quantity: int) -> stats.State:
+    """The state a decrement of `quantity` started from"""
+    category_id, brand, price, stock = state
+    return category_id, brand, price, stock + quantity
+
+def _guard_reserved(db: Session, stock_levels: Dict[int, int]):
+    """Lock the products whose stock is about to be overwritten with {product_id: new stock}. If a new
+    level is below what open reservations hold, roll back and raise reservations.StockBelowReserved."""
+    rows = _lock_stock(db, sorted(stock_levels))
+    conflicts = [product_id for product_id, row in rows.items()
+                 if stock_levels[product_id] < row.reserved_quantity]
+    if conflicts:
+        db.rollback()
+        raise reservations.StockBelowReserved(conflicts)
+
+def _lock_stock(db: Session, product_ids: List[int]) -> dict:
+    """Lock products (in id order) and read what stock adjustments need; {id: row}"""
+    Product = models.Product
+    columns = (Product.id, Product.category_id, Product.brand, Product.price, Product.stock_quantity,
+               Product.reserved_quantity)
+    return bulk.lock_rows(db, [Product.id.in_(product_ids)], columns)
+
+def apply_stock_adjustments(db: Session, adjustments: Dict[int, List[Tuple[str, int]]]):
+    """Apply queued ("decrease" | "set", quantity) adjustments per product, in order, as one net UPDATE per
+    product and one commit. Returns {product_id: [new quantity, or None where rejected]} (a decrease is
+    rejected for insufficient available stock, a set below the reserved quantity, any adjustment for a
+    missing product)."""
+    rows = _lock_stock(db, sorted(adjustments))
+    results, transitions = {}, []
+    for product_id in sorted(adjustments):
+        row = rows.get(product_id)
+        if row is None:
+            results[product_id] = [None] * len(adjustments[product_id])
+            continue
+        stock, outcomes = row.stock_quantity or 0, []
+        for op, quantity in adjustments[product_id]:
+            if op == "set" and quantity >= row.reserved_quantity:
+                stock = quantity
+            elif op != "set" and stock - row.reserved_quantity >= quantity:
+                stock -= quantity
+            else:
+                outcomes.append(None)
+                continue
+            outcomes.append(stock)
+        results[product_id] = outcomes
+        if any(outcome is not None for outcome in outcomes):
+            db.execute(update(models.Product).where(models.Product.id == product_id)
+                       .values(stock_quantity=stock, updated_at=datetime.utcnow()))
+            before = (row.category_id, row.brand, row.price, row.stock_quantity or 0)
+            transitions.append((product_id, before, before[:3] + (stock,)))
+    stats.apply(db, [(before, after) for _, before, after in transitions])
+    changes.record(db, [product_id for product_id, _, _ in transitions])
+    db.commit()
+    for product_id, _, _ in transitions:
+        cache.product_cache.invalidate(product_id)
+    return results
 
 def delete_product(db: Session, product_id: int):
     """Delete a product"""
     db_product = get_product(db, product_id)
     if db_product:
+        specs.delete_specs(db, [product_id])
+        before = stats.state(db_product)
         db.delete(db_product)
+        db.flush()
+        stats.apply(db, [(before, None)])
+        changes.record(db, [product_id], op=changes.DELETE)
         db.commit()
+        cache.product_cache.invalidate(product_id)
+        suggest.index.remove(product_id)
         return True
     return False
+
+# ==================== Bulk Updates ====================
+
+def reprice_products(db: Session, criteria: filtering.ProductFilter, percent: Optional[float] = None,
+                     amount: Optional[float] = None) -> Tuple[Optional[int], List[int]]:
+    """Change the price of every product matching `criteria` by a percentage or an amount, in one UPDATE.
+    Returns (number of products repriced, []) or (None, ids whose price would not stay positive)."""
+    try:
+        transitions, failed = bulk.reprice(db, criteria, percent=percent, amount=amount)
+    except IntegrityError:
+        # A concurrent write lowered a price between the check and the UPDATE; check again
+        db.rollback()
+        transitions, failed = bulk.reprice(db, criteria, percent=percent, amount=amount)
+    if failed:
+        db.rollback()
+        return None, failed
+    product_ids = [product_id for product_id, _, _ in transitions]
+    stats.apply(db, [(before, after) for _, before, after in transitions])
+    changes.record(db, product_ids)
+    db.commit()
+    for product_id in product_ids:
+        cache.product_cache.invalidate(product_id)
+    return len(product_ids), []
+
+def update_products(db: Session, patches: Dict[int, dict]) -> Tuple[int, List[int]]:
+    """Apply partial updates, {product_id: {field: value}}, with one UPDATE per set of fields changed.
+    Returns (number of products updated, ids that do not exist). Raises reservations.StockBelowReserved,
+    updating nothing, if a new stock_quantity is below the reserved quantity."""
+    stock_levels = {product_id: values["stock_quantity"] for product_id, values in patches.items()
+                    if values.get("stock_quantity") is not None}
+    if stock_levels:
+        _guard_reserved(db, stock_levels)
+    found = bulk.patch(db, patches)
+    updated = [(before, after) for before, after in found if patches[after["id"]]]
+    specified = [(after["id"], after["specifications"]) for _, after in updated
+                 if "specifications" in patches[after["id"]]]
+    if specified:
+        specs.delete_specs(db, [product_id for product_id, _ in specified])
+        specs.insert_specs(db, specified)
+    stats.apply(db, [(bulk.state(before), bulk.state(after)) for before, after in updated])
+    changes.record(db, [after["id"] for _, after in updated])
+    db.commit()
+    for _, after in updated:
+        cache.product_cache.invalidate(after["id"])
+        suggest.index.put(after["id"], after["name"], after["brand"], after["stock_quantity"])
+    return len(updated), sorted(set(patches) - {after["id"] for _, after in found})
+
+# ==================== Stock Reservations ====================
+
+def get_product_availability(db: Session, product_id: int) -> Optional[dict]:
+    """Stock, reserved and available-to-sell quantities of a product"""
+    product = db.query(models.Product.id, models.Product.stock_quantity, models.Product.reserved_quantity).filter(
+        models.Product.id == product_id
+    ).first()
+    if product is None:
+        return None
+    return {"product_id": product.id, "stock_quantity": product.stock_quantity,
+            "reserved_quantity": product.reserved_quantity, "available": reservations.available(product)}
+
+def reserve_stock(db: Session, lines: List[Tuple[int, int]], ttl_seconds: Optional[int] = None):
+    """Hold stock for every (product_id, quantity) line of a checkout, all or nothing.
+    Returns (reservation, []) on success, or (None, failed_product_ids)."""
+    reservation, failed = reservations.hold(db, lines, ttl_seconds or reservations.DEFAULT_TTL_SECONDS)
+    if failed:
+        db.rollback()
+        return None, failed
+    db.commit()
+    return reservation, []
+
+def confirm_reservation(db: Session, reservation_id: str) -> Optional[Dict[int, int]]:
+    """Sell the stock held by an unexpired reservation. Returns {product_id: new_quantity}, or None."""
+    held = reservations.take(db, reservation_id, unexpired=True)
+    if not held:
+        db.rollback()
+        return None
+    after = reservations.unreserve(db, held, sell=True)
+    stats.apply(db, [(_restocked(state, held[product_id]), state) for product_id, state in after.items()])
+    changes.record(db, after)
+    db.commit()
+    for product_id in after:
+        cache.product_cache.invalidate(product_id)
+    return {product_id: state[3] for product_id, state in after.items()}
+
+def release_reservation(db: Session, reservation_id: str) -> bool:
+    """Give the stock held by a reservation back; False if it does not exist (any more)"""
+    held = reservations.take(db, reservation_id, unexpired=False)
+    if not held:
+        db.rollback()
+        return False
+    reservations.unreserve(db, held, sell=False)
+    db.commit()
+    return True
+
+def expire_reservations(db: Session, batch_size: int = reservations.SWEEP_BATCH_SIZE) -> int:
+    """Release one batch of expired holds; returns how many there were"""
+    rows = reservations.take_expired(db, batch_size)
+    if rows:
+        reservations.unreserve(db, reservations.totals(rows), sell=False)
+    db.commit()
+    return len(rows)
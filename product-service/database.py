@@ -1,8 +1,19 @@
+import itertools
+from contextlib import contextmanager, nullcontext
 import os
-from sqlalchemy import create_engine
+import threading
+from typing import List
+from fastapi import Request
+from sqlalchemy import CheckConstraint, create_engine, inspect, text
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.sql import Select
+from sqlalchemy.sql.elements import TextClause
+from sqlalchemy.sql.dml import UpdateBase
+from sqlalchemy.schema import AddConstraint, CreateColumn
 from dotenv import load_dotenv
+from metrics import TimedAsyncQueuePool, TimedQueuePool
+import profiling  # noqa: F401 (registers the statement listeners on every engine)
 
 # Load environment variables from .env file
 load_dotenv()
@@ -14,22 +25,358 @@ POSTGRES_HOST = os.getenv("POSTGRES_HOST", "localhost")
 POSTGRES_PORT = os.getenv("POSTGRES_PORT", "5432")
 POSTGRES_DB = os.getenv("POSTGRES_DB")
 
-# Create database URL
-DATABASE_URL = f"postgresql://{POSTGRES_USER}:{POSTGRES_PASSWORD}@{POSTGRES_HOST}:{POSTGRES_PORT}/{POSTGRES_DB}"
+# Create database URL (DATABASE_URL overrides the POSTGRES_* settings, e.g. sqlite:///./local.db)
+DATABASE_URL = os.getenv("DATABASE_URL") or (
+    f"postgresql://{POSTGRES_USER}:{POSTGRES_PASSWORD}@{POSTGRES_HOST}:{POSTGRES_PORT}/{POSTGRES_DB}"
+)
 
-# Create SQLAlchemy engine
-engine = create_engine(DATABASE_URL)
+# Async mode: the hot read routes and stock decrements run on an async engine
+DB_ASYNC = os.getenv("DB_ASYNC", "false").lower() in ("1", "true", "yes")
 
-# Create SessionLocal class for database sessions
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+def _async_url(url: str) -> str:
+    """Swap the sync driver for its async counterpart (asyncpg / aiosqlite)"""
+    scheme, rest = url.split("://", 1)
+    if scheme.startswith("postgresql"):
+        return f"postgresql+asyncpg://{rest}"
+    if scheme.startswith("sqlite"):
+        return f"sqlite+aiosqlite://{rest}"
+    return url
+
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL") or _async_url(DATABASE_URL)
+
+# Read replicas, comma-separated (e.g. a second SQLite file or Postgres instance locally); empty: none
+READ_DATABASE_URLS = [url.strip() for url in os.getenv("READ_DATABASE_URL", "").split(",") if url.strip()]
+
+# A read session that writes sends its later reads to the primary too, so it sees its own writes
+DB_READ_YOUR_WRITES = os.getenv("DB_READ_YOUR_WRITES", "true").lower() in ("1", "true", "yes")
+
+def _connect_args(url: str) -> dict:
+    # SQLite connections are shared across the threadpool that runs sync routes
+    return {"check_same_thread": False} if url.startswith("sqlite") else {}
+
+# Connection pool sizing (SQLAlchemy defaults: 5 + 10 overflow)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+
+# Connections opened at startup, so the first requests do not pay for connecting (0: none)
+DB_POOL_PREWARM = int(os.getenv("DB_POOL_PREWARM", "0"))
+
+# ==================== Lazy Engines ====================
+# Nothing connects, or even loads a database driver, when this module is imported.
+# The engines are built on first use (normally in the FastAPI lifespan, see
+# main.py), and the schema is created by an explicit step: `python manage.py
+# init-db`, or init_db() in tests and benchmarks.
+
+_engine = None
+_async_engine = None
+_read_engines = None
+_async_read_engines = None
+_engine_lock = threading.Lock()
+_session_factory = sessionmaker(autocommit=False, autoflush=False)
+_async_session_factory = None
+_async_read_session_factory = None
+
+def get_engine():
+    """The sync engine, created on first call (the timed pool feeds the checkout wait histogram on /metrics)"""
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                _engine = create_engine(
+                    DATABASE_URL, connect_args=_connect_args(DATABASE_URL), poolclass=TimedQueuePool,
+                    pool_size=DB_POOL_SIZE, max_overflow=DB_MAX_OVERFLOW,
+                )
+                _session_factory.configure(bind=_engine)
+                _read_session_factory.configure(bind=_engine)
+    return _engine
+
+def get_async_engine():
+    """The async engine in async mode (needs asyncpg or aiosqlite), created on first call; else None"""
+    global _async_engine, _async_session_factory, _async_read_session_factory
+    if not DB_ASYNC:
+        return None
+    if _async_engine is None:
+        with _engine_lock:
+            if _async_engine is None:
+                from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+                _async_engine = create_async_engine(ASYNC_DATABASE_URL, poolclass=TimedAsyncQueuePool,
+                                                    pool_size=DB_POOL_SIZE, max_overflow=DB_MAX_OVERFLOW)
+                _async_session_factory = async_sessionmaker(_async_engine, autoflush=False,
+                                                            expire_on_commit=False)
+                _async_read_session_factory = async_sessionmaker(_async_engine, autoflush=False,
+                                                                 expire_on_commit=False,
+                                                                 sync_session_class=RoutingSession)
+    return _async_engine
+
+def SessionLocal(**kwargs):
+    """A new database session on the (lazily created) sync engine"""
+    get_engine()
+    return _session_factory(**kwargs)
+
+def AsyncSessionLocal(**kwargs):
+    """A new async database session (async mode only)"""
+    get_async_engine()
+    return _async_session_factory(**kwargs)
+
+def prewarm(connections: int = DB_POOL_PREWARM):
+    """Open `connections` pooled connections up front (capped by the pool size) and return them to the pool,
+    on the primary and on every replica"""
+    opened = []
+    try:
+        for engine in [get_engine()] + get_read_engines():
+            for _ in range(min(connections, DB_POOL_SIZE)):
+                opened.append(engine.connect())
+    finally:
+        for connection in opened:
+            connection.close()
+
+async def prewarm_async(connections: int = DB_POOL_PREWARM):
+    """prewarm() for the async engines"""
+    engine = get_async_engine()
+    if engine is None:
+        return
+    opened = []
+    try:
+        for engine in [engine] + get_async_read_engines():
+            for _ in range(min(connections, DB_POOL_SIZE)):
+                opened.append(await engine.connect())
+    finally:
+        for connection in opened:
+            await connection.close()
+
+def dispose():
+    """Close every pooled connection (at shutdown); the engines are rebuilt if used again"""
+    global _engine, _read_engines
+    with _engine_lock:
+        for engine in [_engine] + (_read_engines or []):
+            if engine is not None:
+                engine.dispose()
+        _engine, _read_engines = None, None
+
+async def dispose_async():
+    """dispose() for the async engines"""
+    global _async_engine, _async_read_engines
+    engines = [_async_engine] + (_async_read_engines or [])
+    _async_engine, _async_read_engines = None, None
+    for engine in engines:
+        if engine is not None:
+            await engine.dispose()
+
+# ==================== Read Replicas ====================
+# With READ_DATABASE_URL set, safe requests (GET/HEAD) get a RoutingSession: its
+# reads go to one replica (round-robin per session), while anything that writes or
+# locks (flushes, INSERT/UPDATE/DELETE, SELECT ... FOR UPDATE, raw SQL) goes to the
+# primary. Every other session (writes, stock operations, background jobs) uses
+# the primary only. A replica may lag: once a read session has written, its later
+# reads go to the primary too (DB_READ_YOUR_WRITES), so it never reads behind its
+# own writes. The product and category caches are filled inside primary_reads(),
+# or a lagging replica could put stale stock in them for a whole TTL. The schema
+# is created on the primary; replication copies it.
+
+def _writes(clause) -> bool:
+    if isinstance(clause, (UpdateBase, TextClause)):
+        return True
+    return isinstance(clause, Select) and clause._for_update_arg is not None
+
+class RoutingSession(Session):
+    """Reads from `replica`, writes (and locking reads) to the session's bind, the primary"""
+
+    def __init__(self, *args, replica=None, read_your_writes: bool = DB_READ_YOUR_WRITES, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.replica = replica
+        self.read_your_writes = read_your_writes
+        self.wrote = False
+        self.reading_primary = False
+
+    @contextmanager
+    def primary_reads(self):
+        """Read from the primary inside the block"""
+        previous, self.reading_primary = self.reading_primary, True
+        try:
+            yield self
+        finally:
+            self.reading_primary = previous
+
+    def get_bind(self, mapper=None, *, clause=None, **kwargs):
+        primary = super().get_bind(mapper, clause=clause, **kwargs)
+        if self.replica is None:
+            return primary
+        if self._flushing or _writes(clause):
+            self.wrote = self.wrote or self.read_your_writes
+            return primary
+        return primary if self.wrote or self.reading_primary else self.replica
+
+def primary_reads(db):
+    """Context in which `db` (sync or async) reads from the primary; a no-op without a replica"""
+    session = getattr(db, "sync_session", db)
+    if isinstance(session, RoutingSession):
+        return session.primary_reads()
+    return nullcontext()
+
+def lock_table(db: Session, table):
+    """Keep other writers out of `table` until the transaction ends. SQLite has one writer at a time, so
+    there the write transaction starts now (BEGIN IMMEDIATE) instead of at its first write."""
+    if db.get_bind().dialect.name == "postgresql":
+        db.execute(text(f"LOCK TABLE {table.name} IN SHARE ROW EXCLUSIVE MODE"))
+        return
+    statement = text("BEGIN IMMEDIATE")
+    connection = db.connection(bind_arguments={"clause": statement})
+    # pysqlite only opens a transaction at the first write; one already open holds the lock
+    if connection.dialect.name == "sqlite" and not connection.connection.dbapi_connection.in_transaction:
+        connection.execute(statement)
+
+_read_session_factory = sessionmaker(class_=RoutingSession, autocommit=False, autoflush=False)
+
+def get_read_engines() -> list:
+    """One engine per READ_DATABASE_URL replica, created on first call (empty without replicas)"""
+    global _read_engines
+    if _read_engines is None:
+        with _engine_lock:
+            if _read_engines is None:
+                _read_engines = [
+                    create_engine(url, connect_args=_connect_args(url), poolclass=TimedQueuePool,
+                                  pool_size=DB_POOL_SIZE, max_overflow=DB_MAX_OVERFLOW)
+                    for url in READ_DATABASE_URLS
+                ]
+    return _read_engines
+
+def get_async_read_engines() -> list:
+    """get_read_engines() for the async engine (async mode only)"""
+    global _async_read_engines
+    if not DB_ASYNC:
+        return []
+    if _async_read_engines is None:
+        with _engine_lock:
+            if _async_read_engines is None:
+                from sqlalchemy.ext.asyncio import create_async_engine
+                _async_read_engines = [
+                    create_async_engine(_async_url(url), poolclass=TimedAsyncQueuePool,
+                                        pool_size=DB_POOL_SIZE, max_overflow=DB_MAX_OVERFLOW)
+                    for url in READ_DATABASE_URLS
+                ]
+    return _async_read_engines
+
+_next_replica = itertools.count()
+
+def _replica(engines: list):
+    return engines[next(_next_replica) % len(engines)] if engines else None
+
+def ReadSessionLocal(**kwargs):
+    """A session that reads from a replica and writes to the primary (SessionLocal() without replicas)"""
+    get_engine()
+    replica = _replica(get_read_engines())
+    if replica is None:
+        return _session_factory(**kwargs)
+    return _read_session_factory(replica=replica, **kwargs)
+
+def AsyncReadSessionLocal(**kwargs):
+    """ReadSessionLocal() for async mode"""
+    get_async_engine()
+    replica = _replica(get_async_read_engines())
+    if replica is None:
+        return _async_session_factory(**kwargs)
+    return _async_read_session_factory(replica=replica.sync_engine, **kwargs)
+
+def read_pools() -> dict:
+    """Connection pools of the replica engines that exist, for /metrics"""
+    pools = {f"read{index}": engine.pool for index, engine in enumerate(_read_engines or [])}
+    pools.update({f"async_read{index}": engine.pool for index, engine in enumerate(_async_read_engines or [])})
+    return pools
 
 # Create Base class for models
 Base = declarative_base()
 
+def _add_missing_columns(connection) -> List[str]:
+    """create_all() skips existing tables; add the columns introduced since (each has a server default)"""
+    inspector = inspect(connection)
+    added = []
+    for table in Base.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {column["name"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name not in existing:
+                definition = CreateColumn(column).compile(dialect=connection.dialect)
+                connection.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {definition}"))
+                added.append(f"{table.name}.{column.name}")
+    return added
+
+def _add_missing_indexes(connection) -> List[str]:
+    """create_all() skips the indexes of existing tables; create the ones introduced since"""
+    inspector = inspect(connection)
+    existing = {index["name"] for table in inspector.get_table_names() for index in inspector.get_indexes(table)}
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            # checkfirst skips the ones that exist; ddl_if skips other dialects' indexes
+            index.create(bind=connection, checkfirst=True)
+    inspector = inspect(connection)
+    return sorted({index["name"] for table in Base.metadata.sorted_tables
+                   for index in inspector.get_indexes(table.name)} - existing)
+
+def _add_missing_checks(connection) -> List[str]:
+    """Add the named CHECK constraints introduced since. SQLite cannot add constraints to an existing
+    table, so there they only apply to databases created since."""
+    if connection.dialect.name == "sqlite":
+        return []
+    inspector = inspect(connection)
+    added = []
+    for table in Base.metadata.sorted_tables:
+        existing = {check["name"] for check in inspector.get_check_constraints(table.name)}
+        for constraint in table.constraints:
+            if isinstance(constraint, CheckConstraint) and constraint.name not in existing:
+                connection.execute(AddConstraint(constraint))
+                added.append(constraint.name)
+    return added
+
+def upgrade_schema(connection) -> List[str]:
+    """Bring the schema on `connection` up to date; returns the tables, columns and indexes it created"""
+    import models  # noqa: F401 (registers the tables)
+    import search
+    existing = set(inspect(connection).get_table_names())
+    Base.metadata.create_all(bind=connection)
+    created = [table.name for table in Base.metadata.sorted_tables if table.name not in existing]
+    created += _add_missing_columns(connection)
+    created += _add_missing_indexes(connection)
+    created += _add_missing_checks(connection)
+    # Full-text search on SQLite lives outside the metadata (virtual table and triggers)
+    created += search.ensure_index(connection)
+    return created
+
+def init_db() -> List[str]:
+    """Create missing tables, columns and indexes: the explicit schema step, run before the service starts.
+    Safe to run on every deploy; returns what it created."""
+    with get_engine().begin() as connection:
+        return upgrade_schema(connection)
+
+# Safe methods read from a replica (when configured); everything else uses the primary
+READ_METHODS = ("GET", "HEAD")
+
 # Dependency to get database session
-def get_db():
+def get_db(request: Request):
+    db = ReadSessionLocal() if request.method in READ_METHODS else SessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+# Dependency for read-only routes that are not GETs (e.g. POST /products/batch)
+def get_read_db():
+    db = ReadSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+# Dependency for GETs that must not lag behind the primary (stock availability)
+def get_primary_db():
     db = SessionLocal()
     try:
         yield db
     finally:
         db.close()
+
+# Dependency to get an async database session (async mode only)
+async def get_async_db(request: Request):
+    session_factory = AsyncReadSessionLocal if request.method in READ_METHODS else AsyncSessionLocal
+    async with session_factory() as db:
+        yield db
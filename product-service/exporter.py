@@ -0,0 +1,94 @@
+import csv
+import io
+import json
+import os
+from typing import Iterator
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+import models
+
+# ==================== Streaming Catalog Export ====================
+# Rows are read from a server-side cursor (yield_per -> stream_results) as plain
+# column tuples, so no ORM objects or Pydantic models are built, and they are
+# written out one batch at a time. Memory stays flat for any catalog size.
+
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "1000"))
+
+CSV_COLUMNS = [
+    "id", "name", "description", "price", "stock_quantity", "brand", "category_id",
+    "category_name", "specifications", "image_url", "created_at", "updated_at",
+]
+
+def _rows(db: Session, batch_size: int):
+    """Stream every product joined with its category, in id order"""
+    product, category = models.Product, models.Category
+    statement = (
+        select(
+            product.id, product.name, product.description, product.price, product.stock_quantity,
+            product.brand, product.category_id, product.specifications, product.image_url,
+            product.created_at, product.updated_at,
+            category.id.label("category_pk"), category.name.label("category_name"),
+            category.description.label("category_description"),
+        )
+        .outerjoin(category, category.id == product.category_id)
+        .order_by(product.id)
+        .execution_options(yield_per=batch_size)
+    )
+    return db.execute(statement)
+
+def _isoformat(value):
+    return value.isoformat() if value is not None else None
+
+def _product_dict(row) -> dict:
+    """Same fields and key order as schemas.Product"""
+    category = None
+    if row.category_pk is not None:
+        category = {"name": row.category_name, "description": row.category_description, "id": row.category_pk}
+    return {
+        "name": row.name,
+        "description": row.description,
+        "price": row.price,
+        "stock_quantity": row.stock_quantity,
+        "brand": row.brand,
+        "category_id": row.category_id,
+        "specifications": row.specifications,
+        "image_url": row.image_url,
+        "id": row.id,
+        "created_at": _isoformat(row.created_at),
+        "updated_at": _isoformat(row.updated_at),
+        "category": category,
+    }
+
+def iter_ndjson(db: Session, batch_size: int = EXPORT_BATCH_SIZE) -> Iterator[bytes]:
+    """One JSON object per line, flushed once per batch"""
+    lines = []
+    for row in _rows(db, batch_size):
+        lines.append(json.dumps(_product_dict(row), ensure_ascii=False, separators=(",", ":")))
+        if len(lines) >= batch_size:
+            yield ("\n".join(lines) + "\n").encode()
+            lines = []
+    if lines:
+        yield ("\n".join(lines) + "\n").encode()
+
+def iter_csv(db: Session, batch_size: int = EXPORT_BATCH_SIZE) -> Iterator[bytes]:
+    """Header row plus one row per product; the format /products/import accepts"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(CSV_COLUMNS)
+    pending = 0
+    for row in _rows(db, batch_size):
+        specifications = json.dumps(row.specifications) if row.specifications is not None else None
+        writer.writerow([
+            row.id, row.name, row.description, row.price, row.stock_quantity, row.brand, row.category_id,
+            row.category_name, specifications, row.image_url,
+            _isoformat(row.created_at), _isoformat(row.updated_at),
+        ])
+        pending += 1
+        if pending >= batch_size:
+            yield buffer.getvalue().encode()
+            buffer.seek(0)
+            buffer.truncate()
+            pending = 0
+    yield buffer.getvalue().encode()
@@ -0,0 +1,140 @@
+from datetime import datetime
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import case, func, select
+from sqlalchemy.orm import Session
+
+import models
+from pagination import paginate
+from specs import spec_conditions
+
+# ==================== Faceted Filtering ====================
+# One query shape for any mix of category, brand, price range and stock filters,
+# plus facet counts for the storefront sidebar. Facets are disjunctive: the brand
+# counts ignore the brand filter (so picking "Apple" still shows how many Dell
+# products match), and likewise for categories and the price range.
+#
+# Indexes on models.Product: (category_id, price, id), (brand, price, id) and
+# (category_id, created_at, id) serve the filtered, sorted and keyset-paged pages.
+# Specification filters (?spec.RAM=16GB) go through the product_specs side table.
+
+Product = models.Product
+
+# Sort name -> (key columns, descending); every key ends with id so it is unique
+SORTS = {
+    "id": ([Product.id], False),
+    "price_asc": ([Product.price, Product.id], False),
+    "price_desc": ([Product.price, Product.id], True),
+    "newest": ([Product.created_at, Product.id], True),
+}
+
+# Upper bounds of the price facet buckets; the last bucket is open-ended
+PRICE_BUCKETS = (100, 250, 500, 1000, 2000)
+MAX_BRAND_FACETS = 50
+
+class ProductFilter:
+    """Filter criteria; every criterion given must match (brands/categories/spec values match any of theirs)"""
+
+    def __init__(self, category_ids: Optional[Sequence[int]] = None, brands: Optional[Sequence[str]] = None,
+                 min_price: Optional[float] = None, max_price: Optional[float] = None, in_stock: bool = False,
+                 specs: Optional[Dict[str, List[str]]] = None):
+        self.category_ids = list(category_ids or [])
+        self.brands = list(brands or [])
+        self.min_price = min_price
+        self.max_price = max_price
+        self.in_stock = in_stock
+        self.specs = dict(specs or {})
+
+    def conditions(self, exclude: Optional[str] = None) -> list:
+        """WHERE clauses, optionally leaving out one dimension ("category", "brand" or "price") for its facet"""
+        clauses = []
+        if self.category_ids and exclude != "category":
+            clauses.append(Product.category_id.in_(self.category_ids))
+        if self.brands and exclude != "brand":
+            clauses.append(Product.brand.in_(self.brands))
+        if exclude != "price":
+            if self.min_price is not None:
+                clauses.append(Product.price >= self.min_price)
+            if self.max_price is not None:
+                clauses.append(Product.price <= self.max_price)
+        if self.in_stock:
+            clauses.append(Product.stock_quantity > 0)
+        clauses.extend(spec_conditions(self.specs))
+        return clauses
+
+def sort_key(product, sort: str) -> list:
+    """Cursor values of a product for the given sort"""
+    columns, _ = SORTS[sort]
+    return [getattr(product, column.key) for column in columns]
+
+def parse_after(values: list, sort: str) -> list:
+    """Turn decoded cursor values back into column values (datetimes travel as strings)"""
+    if sort == "newest":
+        return [datetime.fromisoformat(values[0]), int(values[1])]
+    if sort == "id":
+        return [int(values[0])]
+    return [float(values[0]), int(values[1])]
+
+def filter_products(db: Session, criteria: ProductFilter, sort: str = "id", skip: int = 0, limit: int = 100,
+                    after: Optional[Sequence] = None, options: Sequence = ()):
+    """One page of the products matching `criteria`, in `sort` order"""
+    columns, descending = SORTS[sort]
+    query = db.query(Product).options(*options).filter(*criteria.conditions())
+    return paginate(query, columns, skip, limit, after, descending=descending).all()
+
+def count_products(db: Session, criteria: ProductFilter) -> int:
+    return db.query(func.count(Product.id)).filter(*criteria.conditions()).scalar()
+
+def version_statement(criteria: ProductFilter):
+    """SELECT max(updated_at), count(id) over the matching products: changes whenever the result can"""
+    return select(func.max(Product.updated_at), func.count(Product.id)).where(*criteria.conditions())
+
+def version(db: Session, criteria: ProductFilter) -> Tuple[Optional[datetime], int]:
+    return tuple(db.execute(version_statement(criteria)).one())
+
+def _price_bucket():
+    return case(*[(Product.price < bound, index) for index, bound in enumerate(PRICE_BUCKETS)],
+                else_=len(PRICE_BUCKETS))
+
+def facets(db: Session, criteria: ProductFilter) -> dict:
+    """Brand, category and price-bucket counts, each ignoring its own filter"""
+    brand_count = func.count(Product.id).label("count")
+    brands = (
+        db.query(Product.brand, brand_count)
+        .filter(Product.brand.isnot(None), *criteria.conditions(exclude="brand"))
+        .group_by(Product.brand)
+        .order_by(brand_count.desc(), Product.brand)
+        .limit(MAX_BRAND_FACETS)
+        .all()
+    )
+
+    category_count = func.count(Product.id).label("count")
+    categories = (
+        db.query(models.Category.id, models.Category.name, category_count)
+        .join(Product, Product.category_id == models.Category.id)
+        .filter(*criteria.conditions(exclude="category"))
+        .group_by(models.Category.id, models.Category.name)
+        .order_by(category_count.desc(), models.Category.id)
+        .all()
+    )
+
+    bucket = _price_bucket().label("bucket")
+    counts = dict(
+        db.query(bucket, func.count(Product.id))
+        .filter(*criteria.conditions(exclude="price"))
+        .group_by(bucket)
+        .all()
+    )
+    bounds = (0,) + PRICE_BUCKETS
+    price: List[dict] = [
+        {"min": float(bounds[index]),
+         "max": float(PRICE_BUCKETS[index]) if index < len(PRICE_BUCKETS) else None,
+         "count": counts.get(index, 0)}
+        for index in range(len(bounds))
+    ]
+
+    return {
+        "brands": [{"value": brand, "count": count} for brand, count in brands],
+        "categories": [{"id": category_id, "name": name, "count": count} for category_id, name, count in categories],
+        "price": price,
+    }
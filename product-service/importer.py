@@ -0,0 +1,256 @@
+import codecs
+import csv
+import io
+import json
+import os
+from datetime import datetime
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+from pydantic import ValidationError
+from starlette.concurrency import run_in_threadpool
+from sqlalchemy import insert, text
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session
+
+import changes
+import models
+import schemas
+import specs
+import stats
+import suggest
+
+# ==================== Streaming Bulk Import ====================
+# The request body is consumed line by line and handled in fixed-size batches:
+# each batch is validated against schemas.ProductCreate, its category IDs are
+# checked with one query, and valid rows go in with one multi-row INSERT (COPY on
+# PostgreSQL), together with their product_specs rows, catalog stats deltas and
+# change feed entries, and one commit. Memory stays bounded by the batch size
+# and IMPORT_MAX_LINE_LENGTH: a longer line (or CSV record) ends the import.
+
+IMPORT_BATCH_SIZE = int(os.getenv("IMPORT_BATCH_SIZE", "1000"))
+MAX_LINE_LENGTH = int(os.getenv("IMPORT_MAX_LINE_LENGTH", str(1024 * 1024)))  # characters
+MAX_REPORTED_ERRORS = 1000
+
+PRODUCT_COLUMNS = [
+    "name", "description", "price", "stock_quantity", "brand",
+    "category_id", "specifications", "image_url",
+]
+
+class LineTooLong(Exception):
+    """A line of the body exceeds MAX_LINE_LENGTH; `report` holds what was imported before it"""
+
+    def __init__(self):
+        super().__init__(f"A line is longer than {MAX_LINE_LENGTH} characters")
+        self.report: Optional["ImportReport"] = None
+
+class ImportReport:
+    """Running totals and per-row errors for one import"""
+
+    def __init__(self):
+        self.imported = 0
+        self.failed = 0
+        self.errors: List[Dict] = []
+        self.errors_truncated = False
+
+    def add_error(self, row: int, error: str):
+        self.failed += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({"row": row, "error": error})
+        else:
+            self.errors_truncated = True
+
+    def as_dict(self):
+        return {
+            "imported": self.imported,
+            "failed": self.failed,
+            "errors": self.errors,
+            "errors_truncated": self.errors_truncated,
+        }
+
+# ==================== Parsing ====================
+
+async def iter_lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[str]:
+    """Split a byte stream into text lines without buffering the whole body. Only the new chunk
+    is split; the unfinished line is kept as a list of fragments and joined once it ends.
+    Raises LineTooLong as soon as a line exceeds MAX_LINE_LENGTH."""
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    fragments: List[str] = []
+    length = 0
+    async for chunk in chunks:
+        *ends, tail = decoder.decode(chunk).split("\n")
+        for end in ends:
+            fragments.append(end)
+            length += len(end)
+            if length > MAX_LINE_LENGTH:
+                raise LineTooLong()
+            yield "".join(fragments).rstrip("\r")
+            fragments, length = [], 0
+        if tail:
+            fragments.append(tail)
+            length += len(tail)
+            if length > MAX_LINE_LENGTH:
+                raise LineTooLong()
+    fragments.append(decoder.decode(b"", final=True))
+    last = "".join(fragments)
+    if last:
+        yield last.rstrip("\r")
+
+async def iter_ndjson_records(lines: AsyncIterator[str]) -> AsyncIterator[Tuple[int, object]]:
+    """Yield (row_number, parsed object or error message) for each non-blank line"""
+    row = 0
+    async for line in lines:
+        if not line.strip():
+            continue
+        row += 1
+        try:
+            yield row, json.loads(line)
+        except ValueError as exc:
+            yield row, f"Invalid JSON: {exc}"
+
+async def iter_csv_records(lines: AsyncIterator[str]) -> AsyncIterator[Tuple[int, object]]:
+    """Yield (row_number, dict or error message) for each CSV record after the header.
+
+    A quoted field may span lines, so physical lines are collected until the
+    record holds an even number of quote characters; a record longer than
+    MAX_LINE_LENGTH raises LineTooLong."""
+    header: Optional[List[str]] = None
+    row = 0
+    record: List[str] = []
+    quotes = length = 0
+    async for line in lines:
+        record.append(line)
+        quotes += line.count('"')
+        length += len(line) + 1
+        if quotes % 2:
+            if length > MAX_LINE_LENGTH:
+                raise LineTooLong()
+            continue
+        text = "\n".join(record)
+        record, quotes, length = [], 0, 0
+        if not text.strip():
+            continue
+        values = next(csv.reader([text]))
+        if header is None:
+            header = [name.strip() for name in values]
+            continue
+        row += 1
+        if len(values) != len(header):
+            yield row, f"Expected {len(header)} columns, got {len(values)}"
+            continue
+        data = {name: (value if value != "" else None) for name, value in zip(header, values)}
+        if data.get("specifications") is not None:
+            try:
+                data["specifications"] = json.loads(data["specifications"])
+            except ValueError:
+                yield row, "Invalid JSON in specifications"
+                continue
+        yield row, data
+    if "".join(record).strip():
+        yield row + 1, "Unterminated quoted field"
+
+# ==================== Loading ====================
+
+def _format_validation_error(exc: ValidationError) -> str:
+    return "; ".join(
+        f"{'.'.join(str(part) for part in error['loc'])}: {error['msg']}" for error in exc.errors()
+    )
+
+def import_batch(db: Session, records: List[Tuple[int, object]], report: ImportReport):
+    """Validate one batch of parsed records and insert the valid rows"""
+    candidates: List[Tuple[int, schemas.ProductCreate]] = []
+    for row, data in records:
+        if isinstance(data, str):
+            report.add_error(row, data)
+            continue
+        if not isinstance(data, dict):
+            report.add_error(row, "Expected an object")
+            continue
+        try:
+            candidates.append((row, schemas.ProductCreate(**data)))
+        except ValidationError as exc:
+            report.add_error(row, _format_validation_error(exc))
+
+    category_ids = {product.category_id for _, product in candidates}
+    existing = set()
+    if category_ids:
+        existing = {
+            category_id for (category_id,) in
+            db.query(models.Category.id).filter(models.Category.id.in_(category_ids))
+        }
+
+    valid = []
+    for row, product in candidates:
+        if product.category_id in existing:
+            valid.append((row, product))
+        else:
+            report.add_error(row, "Category does not exist")
+    if not valid:
+        return
+
+    products = [product for _, product in valid]
+    try:
+        if db.get_bind().dialect.name == "postgresql":
+            product_ids = _copy_products(db, products)
+        else:
+            now = datetime.utcnow()
+            product_ids = db.execute(
+                insert(models.Product).returning(models.Product.id, sort_by_parameter_order=True),
+                [dict(product.dict(), created_at=now, updated_at=now) for product in products]
+            ).scalars().all()
+        specs.insert_specs(db, zip(product_ids, [product.specifications for product in products]))
+        stats.apply(db, [(None, stats.state(product)) for product in products])
+        changes.record(db, product_ids)
+        db.commit()
+    except SQLAlchemyError as exc:
+        db.rollback()
+        for row, _ in valid:
+            report.add_error(row, f"Database error: {exc.__class__.__name__}")
+        return
+    for product_id, product in zip(product_ids, products):
+        suggest.index.put(product_id, product.name, product.brand, product.stock_quantity)
+    report.imported += len(valid)
+
+def _copy_products(db: Session, products: List[schemas.ProductCreate]) -> List[int]:
+    """Load rows with COPY ... FROM STDIN, the fastest insert path on PostgreSQL.
+    COPY cannot return generated keys, so the ids are drawn from the sequence up front."""
+    product_ids = db.execute(
+        text("SELECT nextval(pg_get_serial_sequence('products', 'id')) FROM generate_series(1, :count)"),
+        {"count": len(products)}
+    ).scalars().all()
+    now = datetime.utcnow().isoformat()
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for product_id, product in zip(product_ids, products):
+        row = product.dict()
+        if row["specifications"] is not None:
+            row["specifications"] = json.dumps(row["specifications"])
+        writer.writerow([product_id] + [row[column] for column in PRODUCT_COLUMNS] + [now, now])
+    buffer.seek(0)
+    columns = ", ".join(["id"] + PRODUCT_COLUMNS + ["created_at", "updated_at"])
+    cursor = db.connection().connection.cursor()
+    try:
+        cursor.copy_expert(f"COPY products ({columns}) FROM STDIN WITH (FORMAT csv)", buffer)
+    finally:
+        cursor.close()
+    return product_ids
+
+async def import_stream(db: Session, chunks: AsyncIterator[bytes], fmt: str,
+                        batch_size: int = IMPORT_BATCH_SIZE) -> ImportReport:
+    """Import an NDJSON or CSV byte stream, running each batch in the threadpool"""
+    lines = iter_lines(chunks)
+    records = iter_csv_records(lines) if fmt == "csv" else iter_ndjson_records(lines)
+    report = ImportReport()
+    batch = []
+    try:
+        async for record in records:
+            batch.append(record)
+            if len(batch) >= batch_size:
+                await run_in_threadpool(import_batch, db, batch, report)
+                batch = []
+    except LineTooLong as exc:
+        # Earlier batches are committed; the rest of the body is not read
+        exc.report = report
+        raise
+    if batch:
+        await run_in_threadpool(import_batch, db, batch, report)
+    return report
@@ -1,21 +1,123 @@
-from fastapi import FastAPI, Depends, HTTPException, status
+import asyncio
+import logging
+from fastapi import FastAPI, Depends, HTTPException, Query, Request, Response, status
 from sqlalchemy.orm import Session
-from typing import List
+from typing import List, Optional
 import models
 import schemas
+import cache
+import admission
+import changes
+import coalescer
 import crud
-from database import engine, get_db, Base
+import exporter
+import filtering
+import importer
+import metrics
+import profiling
+import reservations
+import serializers
+import stats
+import suggest
+from api_utils import (after_id, below_reserved, change_feed, change_position, conditional, filter_after, list_etag,
+                       parse_fields, parse_ids, parse_specs, product_batch, product_etag, product_page, search_after,
+                       set_next_cursor)
+import database
+from database import get_db, get_primary_db, get_read_db, DB_ASYNC
+from contextlib import asynccontextmanager
 from fastapi.middleware.cors import CORSMiddleware 
+from fastapi.responses import StreamingResponse
+from starlette.concurrency import run_in_threadpool
 
-# Create database tables
-Base.metadata.create_all(bind=engine)
+logger = logging.getLogger(__name__)
+
+def expire_reservations():
+    """Release every expired stock hold, one short transaction per batch"""
+    db = database.SessionLocal()
+    try:
+        while crud.expire_reservations(db) == reservations.SWEEP_BATCH_SIZE:
+            pass
+    finally:
+        db.close()
+
+async def reservation_sweeper():
+    while True:
+        await asyncio.sleep(reservations.SWEEP_INTERVAL_SECONDS)
+        try:
+            await run_in_threadpool(expire_reservations)
+        except Exception:
+            logger.exception("Expiring stock reservations failed")
+
+def compact_stats():
+    """Fold the catalog stats deltas appended by writes into the totals"""
+    db = database.SessionLocal()
+    try:
+        stats.compact(db)
+    finally:
+        db.close()
+
+async def stats_compactor():
+    while True:
+        await asyncio.sleep(stats.COMPACT_INTERVAL_SECONDS)
+        try:
+            await run_in_threadpool(compact_stats)
+        except Exception:
+            logger.exception("Compacting catalog stats failed")
+
+def refresh_suggestions():
+    """Build the typeahead index, or bring it up to date with the change feed"""
+    db = database.ReadSessionLocal()
+    try:
+        suggest.refresh(db)
+    finally:
+        db.close()
+
+async def suggestion_refresher():
+    while True:
+        await asyncio.sleep(suggest.REFRESH_INTERVAL_SECONDS)
+        try:
+            await run_in_threadpool(refresh_suggestions)
+        except Exception:
+            logger.exception("Refreshing the suggestion index failed")
+
+# The schema is created by `python manage.py init-db`, not on import. The engines (the
+# primary and any READ_DATABASE_URL replicas) are built here at startup (or on first
+# use) and pre-warmed if DB_POOL_PREWARM is set.
+# Each worker also builds its typeahead index, keeps it current from the change feed
+# and runs the sweepers that expire stock reservations and compact the catalog stats.
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    database.get_engine()
+    database.get_async_engine()
+    database.get_read_engines()
+    database.get_async_read_engines()
+    if database.DB_POOL_PREWARM:
+        await run_in_threadpool(database.prewarm, database.DB_POOL_PREWARM)
+        await database.prewarm_async(database.DB_POOL_PREWARM)
+    await run_in_threadpool(refresh_suggestions)
+    tasks = [asyncio.create_task(suggestion_refresher())] if suggest.REFRESH_INTERVAL_SECONDS > 0 else []
+    if reservations.SWEEP_INTERVAL_SECONDS > 0:
+        tasks.append(asyncio.create_task(reservation_sweeper()))
+    if stats.COMPACT_INTERVAL_SECONDS > 0:
+        tasks.append(asyncio.create_task(stats_compactor()))
+    yield
+    for task in tasks:
+        task.cancel()
+    await run_in_threadpool(coalescer.shutdown)
+    await database.dispose_async()
+    database.dispose()
 
 app = FastAPI(
     title="ElectroZone Product Service",
     description="Product management service for ElectroZone electronics store",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
+# Per-class concurrency limits and bounded queues; sheds load with 503 + Retry-After.
+# Added first so it runs inside CORS and the metrics, which then see its rejections.
+app.add_middleware(admission.AdmissionMiddleware)
+
 # Add CORS middleware for cross-service communication
 app.add_middleware(
     CORSMiddleware,
@@ -23,8 +125,19 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "ETag", "Retry-After", profiling.COUNT_HEADER, profiling.TIME_HEADER],
 )
 
+# Per-route request counts and latency histograms, served at /metrics
+app.add_middleware(metrics.MetricsMiddleware)
+# Per-request statement counts and time (headers with QUERY_DEBUG_HEADERS), slow-query log
+app.add_middleware(profiling.ProfilingMiddleware)
+
+# Async mode: the async handlers are registered first so they take precedence
+if DB_ASYNC:
+    import async_api
+    app.include_router(async_api.router)
+
 # ==================== Root & Health Endpoints ====================
 
 @app.get("/")
@@ -35,6 +148,28 @@ async def root():
 async def health_check():
     return {"status": "healthy", "service": "product-service"}
 
+@app.get("/cache/stats")
+async def cache_stats():
+    """Hit/miss counters and sizes of the in-process product and category caches"""
+    return cache.stats()
+
+@app.get("/metrics")
+async def read_metrics():
+    """Request, latency, connection pool, cache and admission metrics in the Prometheus text format"""
+    pools = {"sync": database.get_engine().pool}
+    async_engine = database.get_async_engine()
+    if async_engine is not None:
+        pools["async"] = async_engine.pool
+    pools.update(database.read_pools())
+    return Response(metrics.render(pools=pools, caches=cache.stats(), queries=profiling.routes.totals(),
+                                   admission=admission.controller.stats()),
+                    media_type=metrics.CONTENT_TYPE)
+
+@app.get("/stats", response_model=schemas.CatalogStats)
+def read_catalog_stats(db: Session = Depends(get_db)):
+    """Product count, stock units, out-of-stock count and inventory value, in total and per category/brand"""
+    return crud.get_catalog_stats(db)
+
 # ==================== Category Endpoints ====================
 
 @app.post("/categories/", response_model=schemas.Category, status_code=status.HTTP_201_CREATED)
@@ -46,15 +181,17 @@ def create_category(category: schemas.CategoryCreate, db: Session = Depends(get_
     return crud.create_category(db=db, category=category)
 
 @app.get("/categories/", response_model=List[schemas.Category])
-def read_categories(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
+def read_categories(response: Response, skip: int = 0, limit: int = 100, cursor: Optional[str] = None,
+                    db: Session = Depends(get_db)):
     """Get all categories"""
-    categories = crud.get_categories(db, skip=skip, limit=limit)
+    categories = crud.get_categories(db, skip=skip, limit=limit, after_id=after_id(cursor))
+    set_next_cursor(response, categories, limit)
     return categories
 
 @app.get("/categories/{category_id}", response_model=schemas.Category)
 def read_category(category_id: int, db: Session = Depends(get_db)):
     """Get a specific category by ID"""
-    db_category = crud.get_category(db, category_id=category_id)
+    db_category = crud.get_category_cached(db, category_id=category_id)
     if db_category is None:
         raise HTTPException(status_code=404, detail="Category not found")
     return db_category
@@ -81,53 +218,209 @@ def delete_category(category_id: int, db: Session = Depends(get_db)):
 def create_product(product: schemas.ProductCreate, db: Session = Depends(get_db)):
     """Create a new product (e.g., iPhone 15 Pro, MacBook Air)"""
     # Verify category exists
-    db_category = crud.get_category(db, category_id=product.category_id)
+    db_category = crud.get_category_cached(db, category_id=product.category_id)
     if not db_category:
         raise HTTPException(status_code=400, detail="Category does not exist")
     return crud.create_product(db=db, product=product)
 
+@app.post("/products/import")
+async def import_products(request: Request, format: Optional[str] = None, db: Session = Depends(get_db)):
+    """Bulk import products from a streamed NDJSON or CSV body (one product per line/row)"""
+    fmt = format or ("csv" if "csv" in request.headers.get("content-type", "") else "ndjson")
+    if fmt not in ("ndjson", "csv"):
+        raise HTTPException(status_code=400, detail="Format must be 'ndjson' or 'csv'")
+    try:
+        report = await importer.import_stream(db, request.stream(), fmt)
+    except importer.LineTooLong as exc:
+        raise HTTPException(status_code=413, detail={"message": str(exc), "imported": exc.report.imported})
+    return report.as_dict()
+
 @app.get("/products/", response_model=List[schemas.Product])
-def read_products(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    """Get all products"""
-    products = crud.get_products(db, skip=skip, limit=limit)
-    return products
+def read_products(request: Request, response: Response, skip: int = 0, limit: int = 100,
+                  cursor: Optional[str] = None, fields: Optional[str] = None, db: Session = Depends(get_db)):
+    """Get all products (optionally only some fields, e.g. ?fields=id,name,price,stock_quantity)"""
+    selected = parse_fields(fields)
+    version = crud.get_products_version(db, filtering.ProductFilter())
+    not_modified = conditional(request, response, list_etag(request, version))
+    if not_modified:
+        return not_modified
+    products = crud.get_products(db, skip=skip, limit=limit, after_id=after_id(cursor), fields=selected)
+    set_next_cursor(response, products, limit)
+    return product_page(products, response, selected)
+
+@app.get("/products/batch", response_model=schemas.ProductBatch)
+def read_products_batch(ids: str, db: Session = Depends(get_db)):
+    """Get many products in one request, e.g. /products/batch?ids=1,2,3"""
+    product_ids = parse_ids(ids)
+    return product_batch(product_ids, crud.get_products_by_ids(db, product_ids))
+
+@app.post("/products/batch", response_model=schemas.ProductBatch)
+def read_products_batch_post(request: schemas.ProductBatchRequest, db: Session = Depends(get_read_db)):
+    """Get many products in one request, with the IDs in the body"""
+    return product_batch(request.ids, crud.get_products_by_ids(db, request.ids))
+
+@app.get("/products/filter", response_model=schemas.ProductFilterResult)
+def filter_products(request: Request, response: Response, category_id: Optional[List[int]] = Query(None),
+                    brand: Optional[List[str]] = Query(None), min_price: Optional[float] = Query(None, ge=0),
+                    max_price: Optional[float] = Query(None, ge=0), in_stock: bool = False, sort: str = "id",
+                    skip: int = 0, limit: int = 100, cursor: Optional[str] = None, facets: bool = True,
+                    db: Session = Depends(get_db)):
+    """Filter products by any mix of category, brand, price range, stock and specifications
+    (e.g. ?spec.RAM=16GB&spec.Storage=512GB), with facet counts"""
+    if sort not in filtering.SORTS:
+        raise HTTPException(status_code=400, detail=f"Sort must be one of: {', '.join(filtering.SORTS)}")
+    criteria = filtering.ProductFilter(category_ids=category_id, brands=brand, min_price=min_price,
+                                       max_price=max_price, in_stock=in_stock, specs=parse_specs(request))
+    # Facet counts also cover products outside the category/brand/price filters
+    scope = filtering.ProductFilter(in_stock=in_stock, specs=criteria.specs) if facets else criteria
+    not_modified = conditional(request, response, list_etag(request, crud.get_products_version(db, scope)))
+    if not_modified:
+        return not_modified
+    products = crud.filter_products(db, criteria, sort=sort, skip=skip, limit=limit,
+                                    after=filter_after(cursor, sort))
+    set_next_cursor(response, products, limit, key=lambda product: filtering.sort_key(product, sort))
+    if not facets:
+        return serializers.json_response(
+            {"total": None, "products": serializers.product_dicts(products), "facets": None}, response)
+    return serializers.json_response({
+        "total": crud.count_filtered_products(db, criteria),
+        "products": serializers.product_dicts(products),
+        "facets": crud.get_product_facets(db, criteria),
+    }, response)
+
+@app.get("/products/suggest", response_model=List[schemas.Suggestion])
+async def suggest_products(prefix: str = Query(..., min_length=1, max_length=100),
+                           limit: int = Query(suggest.DEFAULT_LIMIT, ge=1, le=suggest.MAX_LIMIT)):
+    """Typeahead: brands and product names matching a prefix, from the in-memory index (no database query)"""
+    if not suggest.index.ready:
+        await run_in_threadpool(refresh_suggestions)
+    return serializers.FastJSONResponse(suggest.index.suggest(prefix, limit))
+
+@app.get("/products/changes", response_model=schemas.ProductChangeFeed)
+def read_product_changes(since: Optional[str] = None, limit: int = Query(1000, ge=1, le=10000),
+                         db: Session = Depends(get_db)):
+    """Products created, updated or deleted after the `since` cursor (omit it to get the current cursor)"""
+    if since is None:
+        return change_feed([], crud.get_changes_head(db), False)
+    try:
+        entries, position, has_more = crud.get_product_changes(db, change_position(since), limit=limit)
+    except changes.CursorExpired:
+        raise HTTPException(status_code=410, detail="Cursor expired; resync from /products/")
+    return change_feed(entries, position, has_more)
+
+@app.get("/products/export")
+def export_products(format: str = "ndjson", db: Session = Depends(get_db)):
+    """Stream the full catalog as NDJSON (default) or CSV"""
+    if format == "ndjson":
+        return StreamingResponse(exporter.iter_ndjson(db), media_type="application/x-ndjson")
+    if format == "csv":
+        return StreamingResponse(
+            exporter.iter_csv(db), media_type="text/csv",
+            headers={"Content-Disposition": 'attachment; filename="products.csv"'}
+        )
+    raise HTTPException(status_code=400, detail="Format must be 'ndjson' or 'csv'")
 
 @app.get("/products/{product_id}", response_model=schemas.Product)
-def read_product(product_id: int, db: Session = Depends(get_db)):
+def read_product(product_id: int, request: Request, response: Response, db: Session = Depends(get_db)):
     """Get a specific product by ID"""
-    db_product = crud.get_product(db, product_id=product_id)
+    db_product = crud.get_product_cached(db, product_id=product_id)
     if db_product is None:
         raise HTTPException(status_code=404, detail="Product not found")
-    return db_product
+    return conditional(request, response, product_etag(db_product)) or db_product
 
 @app.get("/products/category/{category_id}", response_model=List[schemas.Product])
-def read_products_by_category(category_id: int, skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
+def read_products_by_category(category_id: int, request: Request, response: Response, skip: int = 0,
+                              limit: int = 100, cursor: Optional[str] = None, fields: Optional[str] = None,
+                              db: Session = Depends(get_db)):
     """Get all products in a specific category (e.g., all Laptops)"""
-    products = crud.get_products_by_category(db, category_id=category_id, skip=skip, limit=limit)
-    return products
+    selected = parse_fields(fields)
+    version = crud.get_products_version(db, filtering.ProductFilter(category_ids=[category_id]))
+    not_modified = conditional(request, response, list_etag(request, version))
+    if not_modified:
+        return not_modified
+    products = crud.get_products_by_category(db, category_id=category_id, skip=skip, limit=limit,
+                                             after_id=after_id(cursor), fields=selected)
+    set_next_cursor(response, products, limit)
+    return product_page(products, response, selected)
 
 @app.get("/products/brand/{brand}", response_model=List[schemas.Product])
-def read_products_by_brand(brand: str, skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
+def read_products_by_brand(brand: str, request: Request, response: Response, skip: int = 0, limit: int = 100,
+                           cursor: Optional[str] = None, fields: Optional[str] = None,
+                           db: Session = Depends(get_db)):
     """Get all products by brand (e.g., Apple, Samsung, Dell)"""
-    products = crud.get_products_by_brand(db, brand=brand, skip=skip, limit=limit)
-    return products
+    selected = parse_fields(fields)
+    version = crud.get_products_version(db, filtering.ProductFilter(brands=[brand]))
+    not_modified = conditional(request, response, list_etag(request, version))
+    if not_modified:
+        return not_modified
+    products = crud.get_products_by_brand(db, brand=brand, skip=skip, limit=limit, after_id=after_id(cursor),
+                                          fields=selected)
+    set_next_cursor(response, products, limit)
+    return product_page(products, response, selected)
 
 @app.get("/products/search/", response_model=List[schemas.Product])
-def search_products(q: str, skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    """Search products by name or description"""
-    products = crud.search_products(db, search_term=q, skip=skip, limit=limit)
-    return products
+def search_products(q: str, response: Response, skip: int = 0, limit: int = 100, cursor: Optional[str] = None,
+                    fields: Optional[str] = None, db: Session = Depends(get_db)):
+    """Search products by name, brand or description, ranked by relevance"""
+    selected = parse_fields(fields)
+    results = crud.search_products_ranked(db, search_term=q, skip=skip, limit=limit, after=search_after(cursor),
+                                          fields=selected)
+    set_next_cursor(response, results, limit, key=lambda row: [row[1], row[0].id])
+    products = [product for product, _ in results]
+    return product_page(products, response, selected)
 
 @app.get("/products/stock/available", response_model=List[schemas.Product])
-def read_available_products(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
+def read_available_products(request: Request, response: Response, skip: int = 0, limit: int = 100,
+                            cursor: Optional[str] = None, fields: Optional[str] = None,
+                            db: Session = Depends(get_db)):
     """Get only products that are in stock"""
-    products = crud.get_products_in_stock(db, skip=skip, limit=limit)
-    return products
+    selected = parse_fields(fields)
+    version = crud.get_products_version(db, filtering.ProductFilter(in_stock=True))
+    not_modified = conditional(request, response, list_etag(request, version))
+    if not_modified:
+        return not_modified
+    products = crud.get_products_in_stock(db, skip=skip, limit=limit, after_id=after_id(cursor), fields=selected)
+    set_next_cursor(response, products, limit)
+    return product_page(products, response, selected)
+
+@app.patch("/products/bulk", response_model=schemas.BulkUpdateResult)
+def update_products(request: schemas.BulkProductUpdate, db: Session = Depends(get_db)):
+    """Partially update many products at once, e.g. {"items": [{"id": 1, "price": 899.0}, ...]}"""
+    patches = {}
+    for item in request.items:
+        values = item.dict(exclude_unset=True)
+        values.pop("id", None)
+        patches.setdefault(item.id, {}).update(values)
+    try:
+        updated, missing = crud.update_products(db, patches)
+    except reservations.StockBelowReserved as exc:
+        raise below_reserved(exc)
+    return {"updated": updated, "missing": missing}
+
+@app.post("/products/reprice", response_model=schemas.BulkUpdateResult)
+def reprice_products(change: schemas.PriceChange, db: Session = Depends(get_db)):
+    """Raise or lower the prices of a category or brand by a percentage or a fixed amount"""
+    if not change.category_ids and not change.brands:
+        raise HTTPException(status_code=400, detail="Give category_ids or brands to select the products")
+    if (change.percent is None) == (change.amount is None):
+        raise HTTPException(status_code=400, detail="Give exactly one of percent or amount")
+    criteria = filtering.ProductFilter(category_ids=change.category_ids, brands=change.brands,
+                                       min_price=change.min_price, max_price=change.max_price)
+    updated, failed = crud.reprice_products(db, criteria, percent=change.percent, amount=change.amount)
+    if updated is None:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail={"message": "Prices would drop to zero or below", "product_ids": failed},
+        )
+    return {"updated": updated}
 
 @app.put("/products/{product_id}", response_model=schemas.Product)
 def update_product(product_id: int, product: schemas.ProductUpdate, db: Session = Depends(get_db)):
     """Update a product"""
-    db_product = crud.update_product(db, product_id=product_id, product=product)
+    try:
+        db_product = crud.update_product(db, product_id=product_id, product=product)
+    except reservations.StockBelowReserved as exc:
+        raise below_reserved(exc)
     if db_product is None:
         raise HTTPException(status_code=404, detail="Product not found")
     return db_product
@@ -135,21 +428,57 @@ def update_product(product_id: int, product: schemas.ProductUpdate, db: Session
 @app.patch("/products/{product_id}/stock")
 def update_product_stock(product_id: int, quantity: int, db: Session = Depends(get_db)):
     """Update product stock quantity (for order processing)"""
-    db_product = crud.update_product_stock(db, product_id=product_id, quantity=quantity)
-    if db_product is None:
-        raise HTTPException(status_code=404, detail="Product not found")
+    stock_coalescer = coalescer.get()
+    try:
+        if stock_coalescer is not None:
+            if stock_coalescer.set(product_id, quantity) is None:
+                # Rejected: the product is missing, or holds more reserved stock than `quantity`
+                if crud.get_product_availability(db, product_id) is not None:
+                    raise reservations.StockBelowReserved([product_id])
+                raise HTTPException(status_code=404, detail="Product not found")
+        elif crud.update_product_stock(db, product_id=product_id, quantity=quantity) is None:
+            raise HTTPException(status_code=404, detail="Product not found")
+    except reservations.StockBelowReserved as exc:
+        raise below_reserved(exc)
     return {"message": "Stock updated successfully", "product_id": product_id, "new_quantity": quantity}
 
 @app.patch("/products/{product_id}/stock/decrease")
-def decrease_product_stock(product_id: int, qty: int, db: Session = Depends(get_db)):
+def decrease_product_stock(product_id: int, qty: int = Query(..., gt=0), db: Session = Depends(get_db)):
     """Decrease product stock quantity (for order processing)"""
-    db_product = crud.decrease_product_stock(db, product_id=product_id, quantity=qty)
-    if db_product is None:
+    stock_coalescer = coalescer.get()
+    if stock_coalescer is not None:
+        new_quantity = stock_coalescer.decrease(product_id, qty)
+    else:
+        new_quantity = crud.decrease_product_stock(db, product_id=product_id, quantity=qty)
+    if new_quantity is None:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST, 
             detail="Insufficient stock or product not found"
         )
-    return {"message": "Stock decreased successfully", "product_id": product_id, "new_quantity": db_product.stock_quantity}
+    return {"message": "Stock decreased successfully", "product_id": product_id, "new_quantity": new_quantity}
+
+@app.post("/products/stock/decrease")
+def decrease_stock_batch(order: schemas.StockDecreaseBatch, db: Session = Depends(get_db)):
+    """Decrease stock for every line of an order in one all-or-nothing transaction"""
+    lines = [(item.product_id, item.quantity) for item in order.items]
+    new_quantities, failed = crud.decrease_stock_batch(db, lines)
+    if failed:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail={"message": "Insufficient stock or product not found", "product_ids": failed}
+        )
+    return {
+        "message": "Stock decreased successfully",
+        "items": [{"product_id": pid, "new_quantity": qty} for pid, qty in new_quantities.items()]
+    }
+
+@app.get("/products/{product_id}/availability", response_model=schemas.ProductAvailability)
+def read_product_availability(product_id: int, db: Session = Depends(get_primary_db)):
+    """Stock, reserved and available-to-sell quantities of a product"""
+    availability = crud.get_product_availability(db, product_id)
+    if availability is None:
+        raise HTTPException(status_code=404, detail="Product not found")
+    return availability
 
 @app.delete("/products/{product_id}", status_code=status.HTTP_204_NO_CONTENT)
 def delete_product(product_id: int, db: Session = Depends(get_db)):
@@ -158,3 +487,36 @@ def delete_product(product_id: int, db: Session = Depends(get_db)):
     if not success:
         raise HTTPException(status_code=404, detail="Product not found")
     return None
+
+# ==================== Stock Reservation Endpoints ====================
+
+@app.post("/reservations", response_model=schemas.Reservation, status_code=status.HTTP_201_CREATED)
+def create_reservation(reservation: schemas.ReservationCreate, db: Session = Depends(get_db)):
+    """Hold stock for every line of a checkout until it is confirmed, released or expires (all or nothing)"""
+    lines = [(item.product_id, item.quantity) for item in reservation.items]
+    created, failed = crud.reserve_stock(db, lines, ttl_seconds=reservation.ttl_seconds)
+    if failed:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail={"message": "Insufficient available stock or product not found", "product_ids": failed}
+        )
+    return created
+
+@app.post("/reservations/{reservation_id}/confirm")
+def confirm_reservation(reservation_id: str, db: Session = Depends(get_db)):
+    """Turn a reservation into a sale: its stock is decreased and the hold removed"""
+    new_quantities = crud.confirm_reservation(db, reservation_id)
+    if new_quantities is None:
+        raise HTTPException(status_code=404, detail="Reservation not found or expired")
+    return {
+        "message": "Reservation confirmed",
+        "reservation_id": reservation_id,
+        "items": [{"product_id": pid, "new_quantity": qty} for pid, qty in new_quantities.items()]
+    }
+
+@app.delete("/reservations/{reservation_id}", status_code=status.HTTP_204_NO_CONTENT)
+def release_reservation(reservation_id: str, db: Session = Depends(get_db)):
+    """Release a reservation, making its stock available again"""
+    if not crud.release_reservation(db, reservation_id):
+        raise HTTPException(status_code=404, detail="Reservation not found or expired")
+    return None
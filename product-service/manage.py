@@ -0,0 +1,93 @@
+"""Maintenance commands for the product service.
+
+    python manage.py init-db           # create missing tables, columns and indexes (run before starting)
+    python manage.py rebuild-specs     # backfill product_specs from products.specifications
+    python manage.py rebuild-search    # rebuild the full-text search index
+    python manage.py prune-changes     # drop change feed entries older than --days (default 30)
+    python manage.py recompute-stats   # rebuild the catalog statistics behind GET /stats
+    python manage.py compact-stats     # fold pending catalog statistics deltas into the totals
+    python manage.py resync-reserved   # recompute reserved stock from the open reservations
+"""
+import argparse
+import time
+
+from database import SessionLocal, init_db
+import changes
+import reservations
+import search
+import specs
+import stats
+
+# ==================== Commands ====================
+
+def init_database(db, args):
+    """Create missing tables, columns and indexes (run before starting the service, e.g. on deploy)"""
+    created = init_db()
+    if not created:
+        return "Database schema is up to date"
+    return f"Created {', '.join(created)}"
+
+def rebuild_specs(db, args):
+    """Rebuild the product_specs attribute index (after upgrading, or after out-of-band writes)"""
+    indexed = specs.rebuild(db, batch_size=args.batch_size)
+    return f"Indexed {indexed} specification entries"
+
+def rebuild_search(db, args):
+    """Rebuild the full-text search index"""
+    search.rebuild_index(db)
+    return "Search index rebuilt"
+
+def prune_changes(db, args):
+    """Drop change feed entries older than --days; consumers further behind must resync"""
+    pruned = changes.prune(db, days=args.days)
+    return f"Pruned {pruned} change feed entries"
+
+def recompute_stats(db, args):
+    """Recompute the catalog statistics from scratch (after upgrading, or to fix drift)"""
+    written = stats.recompute(db)
+    return f"Recomputed {written} catalog statistics rows"
+
+def compact_stats(db, args):
+    """Fold pending catalog statistics deltas into the totals (each worker also does it in the background)"""
+    folded = stats.compact(db)
+    return f"Folded {folded} catalog statistics deltas"
+
+def resync_reserved(db, args):
+    """Recompute products.reserved_quantity from the open reservations (after out-of-band writes)"""
+    fixed = reservations.resync(db)
+    return f"Fixed reserved stock of {fixed} products"
+
+COMMANDS = {
+    "init-db": init_database,
+    "rebuild-specs": rebuild_specs,
+    "rebuild-search": rebuild_search,
+    "prune-changes": prune_changes,
+    "recompute-stats": recompute_stats,
+    "compact-stats": compact_stats,
+    "resync-reserved": resync_reserved,
+}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    for name, command in COMMANDS.items():
+        subparser = subparsers.add_parser(name, help=command.__doc__)
+        if name == "rebuild-specs":
+            subparser.add_argument("--batch-size", type=int, default=specs.REBUILD_BATCH_SIZE)
+        if name == "prune-changes":
+            subparser.add_argument("--days", type=int, default=changes.RETENTION_DAYS)
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    # Every other command first creates missing tables (e.g. product_specs on an existing database)
+    if args.command != "init-db":
+        init_db()
+    db = SessionLocal()
+    try:
+        message = COMMANDS[args.command](db, args)
+        print(f"{message} in {time.perf_counter() - started:.2f}s")
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    main()
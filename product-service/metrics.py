@@ -0,0 +1,269 @@
+import threading
+import time
+from bisect import bisect_left
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+
+# ==================== Request & Pool Metrics ====================
+# In-process counters rendered in the Prometheus text format at /metrics.
+# Recording is a dict lookup plus a bisect per request, so it stays on for the
+# hot read paths. Requests are labelled by route template (/products/{product_id}),
+# never by raw path, to keep the number of series bounded.
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Upper bounds in seconds, Prometheus style (an implicit +Inf bucket follows)
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUANTILES = (0.5, 0.95, 0.99)
+
+class Histogram:
+    """Fixed-bucket histogram; quantiles are interpolated within the bucket they fall in"""
+
+    def __init__(self, buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+            self.count += 1
+
+    def snapshot(self) -> Tuple[List[int], float, int]:
+        with self._lock:
+            return list(self.counts), self.sum, self.count
+
+    def quantile(self, q: float) -> float:
+        counts, _, total = self.snapshot()
+        if total == 0:
+            return 0.0
+        rank = q * total
+        seen = 0
+        for index, count in enumerate(counts):
+            if count and seen + count >= rank:
+                if index == len(self.buckets):
+                    return self.buckets[-1]
+                lower = self.buckets[index - 1] if index else 0.0
+                return lower + (self.buckets[index] - lower) * (rank - seen) / count
+            seen += count
+        return self.buckets[-1]
+
+class RequestMetrics:
+    """Per-route request counts by status, latency histograms and the in-flight gauge"""
+
+    def __init__(self):
+        self.in_flight = 0
+        self._counts: Dict[Tuple[str, str, int], int] = {}
+        self._latency: Dict[Tuple[str, str], Histogram] = {}
+        self._lock = threading.Lock()
+
+    def record(self, method: str, route: str, status_code: int, seconds: float):
+        key = (method, route)
+        histogram = self._latency.get(key)
+        if histogram is None:
+            with self._lock:
+                histogram = self._latency.setdefault(key, Histogram())
+        histogram.observe(seconds)
+        with self._lock:
+            count_key = (method, route, status_code)
+            self._counts[count_key] = self._counts.get(count_key, 0) + 1
+
+    def counts(self) -> Dict[Tuple[str, str, int], int]:
+        with self._lock:
+            return dict(self._counts)
+
+    def latencies(self) -> Dict[Tuple[str, str], Histogram]:
+        with self._lock:
+            return dict(self._latency)
+
+requests = RequestMetrics()
+pool_wait = Histogram()
+
+# ==================== Middleware ====================
+
+# Set by AdmissionMiddleware on requests it rejects, which never reach the router
+REJECTED_CLASS = "admission.rejected_class"
+
+def route_label(scope) -> str:
+    """Label of a finished request: its route template, "admission:<class>" for a request
+    admission control turned away, or "unmatched" for a path no route serves"""
+    # The router stores the matched route in the scope; path_format drops convertors
+    # ({product_id:int} -> {product_id})
+    template = getattr(scope.get("route"), "path_format", None)
+    if template:
+        return template
+    rejected = scope.get(REJECTED_CLASS)
+    return f"admission:{rejected}" if rejected else "unmatched"
+
+class MetricsMiddleware:
+    """Pure ASGI middleware (no BaseHTTPMiddleware overhead, streaming bodies untouched)"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        requests.in_flight += 1
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            requests.in_flight -= 1
+            requests.record(scope["method"], route_label(scope), status_code, time.perf_counter() - started)
+
+# ==================== Connection Pool Wait Time ====================
+
+class _TimedCheckout:
+    """Times how long a checkout waits for a connection (including opening a new one)"""
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            pool_wait.observe(time.perf_counter() - started)
+
+class TimedQueuePool(_TimedCheckout, QueuePool):
+    pass
+
+class TimedAsyncQueuePool(_TimedCheckout, AsyncAdaptedQueuePool):
+    pass
+
+# ==================== Prometheus Text Format ====================
+
+def _labels(**labels) -> str:
+    parts = []
+    for name, value in labels.items():
+        value = str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        parts.append(f'{name}="{value}"')
+    return "{" + ",".join(parts) + "}"
+
+def _number(value: float) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+def _histogram_lines(name: str, histogram: Histogram, **labels) -> Iterable[str]:
+    counts, total_sum, total = histogram.snapshot()
+    cumulative = 0
+    for bound, count in zip(histogram.buckets, counts):
+        cumulative += count
+        yield f"{name}_bucket{_labels(**labels, le=_number(bound))} {cumulative}"
+    yield f"{name}_bucket{_labels(**labels, le='+Inf')} {total}"
+    yield f"{name}_sum{_labels(**labels) if labels else ''} {_number(total_sum)}"
+    yield f"{name}_count{_labels(**labels) if labels else ''} {total}"
+
+def _pool_lines(pools: Dict[str, object]) -> Iterable[str]:
+    gauges = (
+        ("db_pool_size", "Configured pool size", lambda pool: pool.size()),
+        ("db_pool_checked_out", "Connections currently checked out", lambda pool: pool.checkedout()),
+        ("db_pool_checked_in", "Idle connections in the pool", lambda pool: pool.checkedin()),
+        ("db_pool_overflow", "Connections open beyond pool_size (negative while the pool fills)",
+         lambda pool: pool.overflow()),
+    )
+    pools = {name: pool for name, pool in pools.items() if isinstance(pool, QueuePool)}
+    for metric, help_text, read in gauges:
+        yield f"# HELP {metric} {help_text}"
+        yield f"# TYPE {metric} gauge"
+        for name, pool in pools.items():
+            yield f"{metric}{_labels(engine=name)} {read(pool)}"
+    yield "# HELP db_pool_wait_seconds Time spent waiting to check out a connection"
+    yield "# TYPE db_pool_wait_seconds histogram"
+    yield from _histogram_lines("db_pool_wait_seconds", pool_wait)
+
+def _cache_lines(caches: Dict[str, dict]) -> Iterable[str]:
+    families = (
+        ("cache_hits_total", "counter", "hits", "Lookups answered from the cache"),
+        ("cache_misses_total", "counter", "misses", "Lookups that had to read the database"),
+        ("cache_entries", "gauge", "size", "Entries currently held by the cache"),
+    )
+    for metric, kind, field, help_text in families:
+        yield f"# HELP {metric} {help_text}"
+        yield f"# TYPE {metric} {kind}"
+        for name, stats in caches.items():
+            yield f"{metric}{_labels(cache=name)} {stats[field]}"
+
+def _query_lines(queries: Dict[Tuple[str, str], tuple]) -> Iterable[str]:
+    yield "# HELP db_queries_total SQL statements run by requests, by method and route template"
+    yield "# TYPE db_queries_total counter"
+    for (method, route), (_, count, _) in sorted(queries.items()):
+        yield f"db_queries_total{_labels(method=method, route=route)} {count}"
+    yield "# HELP db_query_seconds_total Time requests spent in SQL statements, by method and route template"
+    yield "# TYPE db_query_seconds_total counter"
+    for (method, route), (_, _, seconds) in sorted(queries.items()):
+        yield f"db_query_seconds_total{_labels(method=method, route=route)} {_number(round(seconds, 6))}"
+
+def _admission_lines(classes: Dict[str, dict]) -> Iterable[str]:
+    for metric, kind, help_text, field in (
+        ("admission_limit", "gauge", "Concurrent requests allowed per admission class", "limit"),
+        ("admission_active", "gauge", "Requests running per admission class", "active"),
+        ("admission_waiting", "gauge", "Requests waiting for a slot per admission class", "waiting"),
+        ("admission_admitted_total", "counter", "Requests admitted per admission class", "admitted"),
+        ("admission_queued_total", "counter", "Requests that had to wait for a slot", "queued"),
+    ):
+        yield f"# HELP {metric} {help_text}"
+        yield f"# TYPE {metric} {kind}"
+        for name, stats in classes.items():
+            yield f"{metric}{_labels(**{'class': name})} {stats[field]}"
+    yield "# HELP admission_rejected_total Requests answered 503, by admission class and reason"
+    yield "# TYPE admission_rejected_total counter"
+    for name, stats in classes.items():
+        for reason, count in sorted(stats["rejected"].items()):
+            yield f"admission_rejected_total{_labels(**{'class': name}, reason=reason)} {count}"
+    yield "# HELP admission_queue_wait_seconds Time queued requests waited for a slot"
+    yield "# TYPE admission_queue_wait_seconds histogram"
+    for name, stats in classes.items():
+        yield from _histogram_lines("admission_queue_wait_seconds", stats["wait"], **{"class": name})
+
+def render(pools: Optional[Dict[str, object]] = None, caches: Optional[Dict[str, dict]] = None,
+           queries: Optional[Dict[Tuple[str, str], tuple]] = None,
+           admission: Optional[Dict[str, dict]] = None) -> str:
+    """Every metric in the Prometheus text exposition format"""
+    lines = [
+        "# HELP http_requests_total Requests by method, route template and status code",
+        "# TYPE http_requests_total counter",
+    ]
+    for (method, route, status_code), count in sorted(requests.counts().items()):
+        lines.append(f"http_requests_total{_labels(method=method, route=route, status=status_code)} {count}")
+
+    latencies = sorted(requests.latencies().items())
+    lines += [
+        "# HELP http_request_duration_seconds Request latency by method and route template",
+        "# TYPE http_request_duration_seconds histogram",
+    ]
+    for (method, route), histogram in latencies:
+        lines += _histogram_lines("http_request_duration_seconds", histogram, method=method, route=route)
+    lines += [
+        "# HELP http_request_duration_quantile_seconds p50/p95/p99 latency estimated from the histogram",
+        "# TYPE http_request_duration_quantile_seconds gauge",
+    ]
+    for (method, route), histogram in latencies:
+        for q in QUANTILES:
+            value = histogram.quantile(q)
+            lines.append(f"http_request_duration_quantile_seconds{_labels(method=method, route=route, quantile=q)} "
+                         f"{_number(round(value, 6))}")
+
+    lines += [
+        "# HELP http_requests_in_flight Requests currently being served",
+        "# TYPE http_requests_in_flight gauge",
+        f"http_requests_in_flight {requests.in_flight}",
+    ]
+    lines += _pool_lines(pools or {})
+    lines += _cache_lines(caches or {})
+    lines += _query_lines(queries or {})
+    lines += _admission_lines(admission or {})
+    return "\n".join(lines) + "\n"
@@ -1,4 +1,5 @@
-from sqlalchemy import Column, Integer, String, Float, Text, DateTime, ForeignKey, JSON
+from sqlalchemy import (BigInteger, CheckConstraint, Column, Integer, String, Float, Text, DateTime, ForeignKey,
+                        JSON, Index)
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from database import Base
@@ -11,6 +12,7 @@ class Product(Base):
     description = Column(Text)  # Product details
     price = Column(Float, nullable=False)
     stock_quantity = Column(Integer, default=0)
+    reserved_quantity = Column(Integer, nullable=False, default=0, server_default="0")  # Held by open reservations
     brand = Column(String(100))  # "Apple", "Samsung", "Dell"
     category_id = Column(Integer, ForeignKey("categories.id"))
     specifications = Column(JSON)  # {"RAM": "8GB", "Storage": "256GB"}
@@ -20,6 +22,98 @@ class Product(Base):
     
     category = relationship("Category", back_populates="products")
 
+    # Keyset pagination walks these in id order within each filter; the price and
+    # created_at ones serve the sorted pages of /products/filter
+    __table_args__ = (
+        Index("ix_products_category_id_id", "category_id", "id"),
+        Index("ix_products_brand_id", "brand", "id"),
+        Index("ix_products_category_price", "category_id", "price", "id"),
+        Index("ix_products_brand_price", "brand", "price", "id"),
+        Index("ix_products_category_created", "category_id", "created_at", "id"),
+        # max(updated_at) for the list ETags
+        Index("ix_products_updated_at", "updated_at"),
+        Index(
+            "ix_products_in_stock_id", "id",
+            postgresql_where=stock_quantity > 0,
+            sqlite_where=stock_quantity > 0,
+        ),
+        # Backstop for crud's checks: stock is never overwritten below what reservations hold
+        CheckConstraint("stock_quantity >= reserved_quantity", name="ck_products_stock_covers_reserved"),
+        # Backstop for the repricing check, which runs before its UPDATE
+        CheckConstraint("price > 0", name="ck_products_price_positive"),
+    )
+
+class ProductSpec(Base):
+    """One indexed specification entry of a product, mirrored from Product.specifications"""
+    __tablename__ = "product_specs"
+
+    product_id = Column(Integer, ForeignKey("products.id", ondelete="CASCADE"), primary_key=True)
+    key = Column(String(100), primary_key=True)  # "RAM"
+    value = Column(String(255), nullable=False)  # "16GB"
+
+    # ?spec.RAM=16GB looks up (key, value) and reads product ids straight from the index
+    __table_args__ = (
+        Index("ix_product_specs_key_value_product", "key", "value", "product_id"),
+    )
+
+class StockReservation(Base):
+    """Quantity of one product held for a checkout until it is confirmed, released or expires"""
+    __tablename__ = "stock_reservations"
+
+    reservation_id = Column(String(32), primary_key=True)  # Shared by every line of one reservation
+    product_id = Column(Integer, ForeignKey("products.id", ondelete="CASCADE"), primary_key=True)
+    quantity = Column(Integer, nullable=False)
+    expires_at = Column(DateTime, nullable=False)
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+
+    __table_args__ = (
+        # The sweeper walks expired holds oldest first
+        Index("ix_stock_reservations_expires_at", "expires_at"),
+        # Re-summing a product's holds reads the index only
+        Index("ix_stock_reservations_product_quantity", "product_id", "quantity"),
+    )
+
+class ProductChange(Base):
+    """One entry of the product change feed, appended by every product write"""
+    __tablename__ = "product_changes"
+
+    seq = Column(Integer, primary_key=True)  # Change sequence: strictly increasing, never reused
+    product_id = Column(Integer, nullable=False)  # No FK: tombstones outlive their product
+    op = Column(String(10), nullable=False)  # "upsert" or "delete"
+    changed_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    # Writing transaction (PostgreSQL txid_current(); 0 on SQLite): the feed is read in (txid, seq) order
+    txid = Column(BigInteger, nullable=False, default=0, server_default="0")
+
+    __table_args__ = (
+        Index("ix_product_changes_changed_at", "changed_at"),
+        Index("ix_product_changes_txid_seq", "txid", "seq"),
+        # Without AUTOINCREMENT, SQLite would reuse the sequence numbers of pruned entries
+        {"sqlite_autoincrement": True},
+    )
+
+class CatalogStat(Base):
+    """Running totals for the whole catalog ("total"), one category or one brand"""
+    __tablename__ = "catalog_stats"
+
+    scope = Column(String(20), primary_key=True)  # "total", "category" or "brand"
+    key = Column(String(100), primary_key=True)  # "" for the total, else the category id or brand
+    product_count = Column(Integer, nullable=False, default=0)
+    stock_units = Column(Integer, nullable=False, default=0)
+    out_of_stock = Column(Integer, nullable=False, default=0)
+    inventory_value = Column(Float, nullable=False, default=0.0)  # sum(price * stock_quantity)
+
+class CatalogStatDelta(Base):
+    """A change to catalog_stats appended by a product write, until stats.compact() folds it in"""
+    __tablename__ = "catalog_stat_deltas"
+
+    id = Column(Integer, primary_key=True)  # Folded oldest first
+    scope = Column(String(20), nullable=False)
+    key = Column(String(100), nullable=False)
+    product_count = Column(Integer, nullable=False, default=0)
+    stock_units = Column(Integer, nullable=False, default=0)
+    out_of_stock = Column(Integer, nullable=False, default=0)
+    inventory_value = Column(Float, nullable=False, default=0.0)
+
 class Category(Base):
     __tablename__ = "categories"
     
@@ -0,0 +1,48 @@
+import base64
+import json
+from typing import List, Optional, Sequence
+
+from sqlalchemy import tuple_
+
+# ==================== Keyset (Cursor) Pagination ====================
+# Cursors are opaque to clients: a urlsafe base64 encoding of the sort key
+# values of the last row on the previous page. Paging by cursor turns
+# "skip N rows" into an index range scan that starts right after that row.
+
+def encode_cursor(values: Sequence) -> str:
+    """Encode the sort key of the last row of a page into an opaque cursor"""
+    raw = json.dumps(list(values), separators=(",", ":"), default=str)
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+def decode_cursor(cursor: str, size: int = 1) -> List:
+    """Decode a cursor produced by encode_cursor. Raises ValueError if it is malformed."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (ValueError, TypeError) as exc:
+        raise ValueError("Invalid cursor") from exc
+    if not isinstance(values, list) or len(values) != size:
+        raise ValueError("Invalid cursor")
+    return values
+
+def paginate(query, order_columns: Sequence, skip: int = 0, limit: int = 100,
+             after: Optional[Sequence] = None, descending: bool = False):
+    """Order a query by a stable key and page it either by offset or by keyset"""
+    if descending:
+        query = query.order_by(*[column.desc() for column in order_columns])
+    else:
+        query = query.order_by(*order_columns)
+    if after is not None:
+        if len(order_columns) == 1:
+            key, bound = order_columns[0], after[0]
+        else:
+            key, bound = tuple_(*order_columns), tuple_(*after)
+        query = query.filter(key < bound if descending else key > bound)
+        return query.limit(limit)
+    return query.offset(skip).limit(limit)
+
+def next_cursor(items: Sequence, limit: int, key) -> Optional[str]:
+    """Cursor for the page after `items`, or None when this was the last page"""
+    if not items or len(items) < limit:
+        return None
+    return encode_cursor(key(items[-1]))
@@ -0,0 +1,132 @@
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from metrics import route_label
+
+# ==================== SQL Profiling ====================
+# Engine events count every statement, and the time it took, against whatever is
+# profiling the current context: the request (ProfilingMiddleware) or a block of
+# test code (count_queries). The totals per route are served at /metrics. With
+# QUERY_DEBUG_HEADERS set, each response also carries its own X-Query-Count and
+# X-Query-Time-Ms. Statements slower than SLOW_QUERY_MS are logged, profiled or not.
+#
+# The listeners are registered on the Engine class, so every engine is covered,
+# including the one behind the async engine and the ones tests create. Outside a
+# profiled context a statement costs one perf_counter pair and a context lookup.
+
+logger = logging.getLogger(__name__)
+
+DEBUG_HEADERS = os.getenv("QUERY_DEBUG_HEADERS", "false").lower() in ("1", "true", "yes")
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "500"))  # 0 turns the slow-query log off
+
+COUNT_HEADER = "X-Query-Count"
+TIME_HEADER = "X-Query-Time-Ms"
+
+class QueryStats:
+    """Statements run while profiling one request or block, and their total time"""
+
+    def __init__(self, record: bool = False):
+        self.count = 0
+        self.seconds = 0.0
+        self.statements: Optional[List[str]] = [] if record else None
+
+    def add(self, statement: str, seconds: float):
+        self.count += 1
+        self.seconds += seconds
+        if self.statements is not None:
+            self.statements.append(statement)
+
+_current: ContextVar[Optional[QueryStats]] = ContextVar("query_stats", default=None)
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    seconds = time.perf_counter() - conn.info["query_started"].pop()
+    stats = _current.get()
+    if stats is not None:
+        stats.add(statement, seconds)
+    if SLOW_QUERY_MS > 0 and seconds * 1000 >= SLOW_QUERY_MS:
+        logger.warning("Slow query (%.1f ms): %s", seconds * 1000, " ".join(statement.split())[:2000])
+
+@contextmanager
+def count_queries(record: bool = True) -> Iterator[QueryStats]:
+    """Profile the statements run in this block (same thread, or tasks and threads started from it)"""
+    stats = QueryStats(record=record)
+    token = _current.set(stats)
+    try:
+        yield stats
+    finally:
+        _current.reset(token)
+
+@contextmanager
+def assert_max_queries(limit: int) -> Iterator[QueryStats]:
+    """Fail if the block runs more than `limit` statements, listing them (N+1 guard for tests)"""
+    with count_queries() as stats:
+        yield stats
+    if stats.count > limit:
+        listing = "\n".join(f"  {index}. {' '.join(statement.split())}"
+                            for index, statement in enumerate(stats.statements, 1))
+        raise AssertionError(f"{stats.count} queries, expected at most {limit}:\n{listing}")
+
+# ==================== Per-Route Totals ====================
+
+class RouteQueries:
+    """Requests, statements and statement time per (method, route template)"""
+
+    def __init__(self):
+        self._totals: Dict[Tuple[str, str], list] = {}
+        self._lock = threading.Lock()
+
+    def record(self, method: str, route: str, stats: QueryStats):
+        with self._lock:
+            totals = self._totals.setdefault((method, route), [0, 0, 0.0])
+            totals[0] += 1
+            totals[1] += stats.count
+            totals[2] += stats.seconds
+
+    def totals(self) -> Dict[Tuple[str, str], tuple]:
+        with self._lock:
+            return {key: tuple(value) for key, value in self._totals.items()}
+
+routes = RouteQueries()
+
+class ProfilingMiddleware:
+    """Pure ASGI middleware profiling each request's statements"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = QueryStats()
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start" and DEBUG_HEADERS:
+                message["headers"] = list(message.get("headers", [])) + [
+                    (COUNT_HEADER.lower().encode(), str(stats.count).encode()),
+                    (TIME_HEADER.lower().encode(), f"{stats.seconds * 1000:.2f}".encode()),
+                ]
+            await send(message)
+
+        # Sync routes and dependencies run in the threadpool with a copy of this context,
+        # so their statements land in the same QueryStats
+        token = _current.set(stats)
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _current.reset(token)
+            routes.record(scope["method"], route_label(scope), stats)
@@ -0,0 +1,135 @@
+import os
+import uuid
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import delete, func, insert, select, tuple_, update
+from sqlalchemy.orm import Session
+
+import models
+
+# ==================== Stock Reservations ====================
+# A checkout reserves its lines for a TTL, then confirms them (the stock is sold)
+# or releases them (payment failed, cart abandoned); holds nobody resolves expire.
+#
+# stock_reservations keeps one row per (reservation, product). Its per-product sum
+# is mirrored in products.reserved_quantity, so available-to-sell is
+# stock_quantity - reserved_quantity and a reservation is one conditional UPDATE
+# per line: the row lock serializes carts racing for a hot SKU only for the length
+# of that statement's transaction, and the WHERE clause makes overselling impossible.
+# Summing the holds on every check instead would not avoid that queue: two carts
+# could both see enough stock unless each locked the product row first anyway.
+# A hold or release leaves updated_at alone, as the product's own fields (and so
+# its ETag and cached response) are unchanged; only a confirmed sale moves them.
+#
+# Whoever DELETEs a hold's row (confirm, release or the sweeper) adjusts the
+# counter, so a hold that is confirmed while it expires is counted exactly once.
+# Product rows are always updated in id order, so transactions cannot deadlock.
+# Stock overwrites (PUT, PATCH .../stock, bulk patches) may not go below the
+# reserved quantity: crud.py rejects them, and a CHECK constraint backs that up.
+
+Product = models.Product
+StockReservation = models.StockReservation
+
+DEFAULT_TTL_SECONDS = int(os.getenv("RESERVATION_TTL_SECONDS", "900"))
+MAX_TTL_SECONDS = 24 * 60 * 60
+SWEEP_INTERVAL_SECONDS = float(os.getenv("RESERVATION_SWEEP_INTERVAL", "5"))
+SWEEP_BATCH_SIZE = 500
+
+class StockBelowReserved(Exception):
+    """A stock overwrite would leave less stock than open reservations hold (the route answers 409)"""
+
+    def __init__(self, product_ids: List[int]):
+        super().__init__(product_ids)
+        self.product_ids = product_ids
+
+def available(product) -> int:
+    """Quantity that can still be sold or reserved"""
+    return max(0, (product.stock_quantity or 0) - product.reserved_quantity)
+
+def totals(lines) -> Dict[int, int]:
+    """{product_id: summed quantity} of (product_id, quantity) lines, in product id order"""
+    summed: Dict[int, int] = defaultdict(int)
+    for product_id, quantity in lines:
+        summed[product_id] += quantity
+    return dict(sorted(summed.items()))
+
+def hold(db: Session, lines: List[Tuple[int, int]], ttl_seconds: int) -> Tuple[Optional[dict], List[int]]:
+    """Reserve every (product_id, quantity) line, without committing.
+    Returns (reservation, []) or (None, failed_product_ids), in which case the caller rolls back."""
+    quantities = totals(lines)
+    failed = []
+    for product_id, quantity in quantities.items():
+        held = db.execute(
+            update(Product)
+            .where(Product.id == product_id, Product.stock_quantity - Product.reserved_quantity >= quantity)
+            .values(reserved_quantity=Product.reserved_quantity + quantity, updated_at=Product.updated_at)
+            .returning(Product.id)
+        ).scalar_one_or_none()
+        if held is None:
+            failed.append(product_id)
+    if failed:
+        return None, failed
+    reservation_id = uuid.uuid4().hex
+    expires_at = datetime.utcnow() + timedelta(seconds=ttl_seconds)
+    db.execute(insert(StockReservation), [
+        {"reservation_id": reservation_id, "product_id": product_id, "quantity": quantity, "expires_at": expires_at}
+        for product_id, quantity in quantities.items()
+    ])
+    return {
+        "reservation_id": reservation_id,
+        "expires_at": expires_at,
+        "items": [{"product_id": product_id, "quantity": quantity} for product_id, quantity in quantities.items()],
+    }, []
+
+def take(db: Session, reservation_id: str, unexpired: bool) -> Dict[int, int]:
+    """Delete a reservation's rows and return what they held, {product_id: quantity}, without committing"""
+    statement = delete(StockReservation).where(StockReservation.reservation_id == reservation_id)
+    if unexpired:
+        statement = statement.where(StockReservation.expires_at > datetime.utcnow())
+    return totals(db.execute(statement.returning(StockReservation.product_id, StockReservation.quantity)))
+
+def take_expired(db: Session, batch_size: int = SWEEP_BATCH_SIZE) -> List[tuple]:
+    """Delete up to `batch_size` expired holds and return their (product_id, quantity), without committing.
+    Concurrent sweepers (one per worker) skip each other's rows on PostgreSQL."""
+    expired = (
+        select(StockReservation.reservation_id, StockReservation.product_id)
+        .where(StockReservation.expires_at <= datetime.utcnow())
+        .order_by(StockReservation.expires_at)
+        .limit(batch_size)
+        .with_for_update(skip_locked=True)
+    )
+    return db.execute(
+        delete(StockReservation)
+        .where(tuple_(StockReservation.reservation_id, StockReservation.product_id).in_(expired))
+        .returning(StockReservation.product_id, StockReservation.quantity)
+    ).all()
+
+def unreserve(db: Session, quantities: Dict[int, int], sell: bool) -> Dict[int, tuple]:
+    """Give held quantities back (sell=False) or turn them into sales (sell=True), without committing.
+    Returns {product_id: (category_id, brand, price, stock_quantity)} after the update, for products that exist."""
+    states = {}
+    for product_id, quantity in sorted(quantities.items()):
+        values = {"reserved_quantity": Product.reserved_quantity - quantity, "updated_at": Product.updated_at}
+        if sell:
+            values.update(stock_quantity=Product.stock_quantity - quantity, updated_at=datetime.utcnow())
+        row = db.execute(
+            update(Product).where(Product.id == product_id).values(**values)
+            .returning(Product.category_id, Product.brand, Product.price, Product.stock_quantity)
+        ).one_or_none()
+        if row is not None:
+            states[product_id] = tuple(row)
+    return states
+
+def resync(db: Session) -> int:
+    """Recompute products.reserved_quantity from the holds (after out-of-band writes); returns rows fixed"""
+    held = (
+        select(func.coalesce(func.sum(StockReservation.quantity), 0))
+        .where(StockReservation.product_id == Product.id)
+        .scalar_subquery()
+    )
+    result = db.execute(update(Product).where(Product.reserved_quantity != held)
+                        .values(reserved_quantity=held, updated_at=Product.updated_at))
+    db.commit()
+    return result.rowcount
@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field
-from typing import Optional
+from typing import List, Optional
 from datetime import datetime
 
 # Category Schemas
@@ -52,3 +52,123 @@ class Product(ProductBase):
     
     class Config:
         from_attributes = True
+
+# Batch lookup (order-service line items, cart hydration)
+MAX_BATCH_IDS = 500
+
+class ProductBatchRequest(BaseModel):
+    ids: List[int] = Field(..., min_length=1, max_length=MAX_BATCH_IDS)
+
+class ProductBatch(BaseModel):
+    products: List[Product]
+    missing: List[int]
+
+# Change feed
+class ProductChange(BaseModel):
+    seq: int
+    product_id: int
+    op: str  # "upsert" or "delete"
+    changed_at: datetime
+    product: Optional[Product] = None  # Current state; None for deletes
+
+class ProductChangeFeed(BaseModel):
+    changes: List[ProductChange]
+    cursor: str  # Pass back as ?since= for the next poll
+    has_more: bool
+
+# Bulk updates
+MAX_BULK_UPDATE_ITEMS = 1000
+
+class ProductPatch(ProductUpdate):
+    id: int
+
+class BulkProductUpdate(BaseModel):
+    items: List[ProductPatch] = Field(..., min_length=1, max_length=MAX_BULK_UPDATE_ITEMS)
+
+class PriceChange(BaseModel):
+    # Which products: at least one category or brand, optionally narrowed to a price range
+    category_ids: List[int] = []
+    brands: List[str] = []
+    min_price: Optional[float] = Field(None, ge=0)
+    max_price: Optional[float] = Field(None, ge=0)
+    # By how much: exactly one of the two
+    percent: Optional[float] = Field(None, gt=-100)  # 10 raises prices by 10%, -15 lowers them by 15%
+    amount: Optional[float] = None  # Added to every price
+
+class BulkUpdateResult(BaseModel):
+    updated: int
+    missing: List[int] = []  # IDs that do not exist
+
+# Typeahead
+class Suggestion(BaseModel):
+    text: str
+    kind: str  # "brand" or "product"
+    product_id: Optional[int] = None  # Products: one with this name, in stock if any is
+    product_count: int  # Products of the brand, or with the name
+
+# Faceted filtering
+class FacetCount(BaseModel):
+    value: str
+    count: int
+
+class CategoryFacet(BaseModel):
+    id: int
+    name: str
+    count: int
+
+class PriceBucket(BaseModel):
+    min: float
+    max: Optional[float] = None  # None for the open-ended top bucket
+    count: int
+
+class ProductFacets(BaseModel):
+    brands: List[FacetCount]
+    categories: List[CategoryFacet]
+    price: List[PriceBucket]
+
+class ProductFilterResult(BaseModel):
+    total: Optional[int] = None  # Omitted (with facets) when facets=false
+    products: List[Product]
+    facets: Optional[ProductFacets] = None
+
+# Catalog statistics
+class StatCounters(BaseModel):
+    product_count: int
+    stock_units: int
+    out_of_stock: int
+    inventory_value: float  # sum(price * stock_quantity)
+
+class CategoryStats(StatCounters):
+    id: int
+    name: Optional[str] = None
+
+class BrandStats(StatCounters):
+    brand: str
+
+class CatalogStats(StatCounters):
+    categories: List[CategoryStats]
+    brands: List[BrandStats]
+
+# Stock Schemas
+class StockLine(BaseModel):
+    product_id: int
+    quantity: int = Field(..., gt=0)
+
+class StockDecreaseBatch(BaseModel):
+    items: List[StockLine] = Field(..., min_length=1)
+
+# Stock reservations
+class ReservationCreate(BaseModel):
+    items: List[StockLine] = Field(..., min_length=1)
+    ttl_seconds: Optional[int] = Field(None, ge=1, le=24 * 60 * 60)  # Defaults to RESERVATION_TTL_SECONDS
+
+class Reservation(BaseModel):
+    reservation_id: str
+    expires_at: datetime
+    items: List[StockLine]
+
+class ProductAvailability(BaseModel):
+    product_id: int
+    stock_quantity: int
+    reserved_quantity: int
+    available: int  # Stock that can still be sold or reserved
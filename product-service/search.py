@@ -0,0 +1,153 @@
+import re
+from typing import List, Optional, Sequence, Tuple
+
+from sqlalchemy import (Column, DDL, Float, Index, Integer, MetaData, Table, Text, cast, event, func, inspect, literal,
+                        literal_column, text, tuple_)
+from sqlalchemy.orm import Session
+
+import models
+
+# ==================== Full-Text Search ====================
+# Postgres: GIN index over a tsvector expression, ranked with ts_rank_cd.
+# SQLite:   FTS5 external-content table kept in sync by triggers, ranked with bm25.
+# Any other backend falls back to the unindexed ILIKE scan.
+#
+# Results are ordered by (score, id) ascending, where a lower score is a better
+# match, so search pages can be walked with the same keyset cursors as listings.
+
+TS_CONFIG = literal_column("'english'")
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+def _document(table):
+    """Text indexed for a product: name, brand and description"""
+    empty, space = literal_column("''"), literal_column("' '")
+    return (
+        func.coalesce(table.c.name, empty).op("||")(space)
+        .op("||")(func.coalesce(table.c.brand, empty)).op("||")(space)
+        .op("||")(func.coalesce(table.c.description, empty))
+    )
+
+SEARCH_VECTOR = func.to_tsvector(TS_CONFIG, _document(models.Product.__table__))
+
+Index(
+    "ix_products_search", SEARCH_VECTOR,
+    postgresql_using="gin", _table=models.Product.__table__,
+).ddl_if(dialect="postgresql")
+
+# Not part of Base.metadata: the virtual table is created by the DDL below
+products_fts = Table(
+    "products_fts", MetaData(),
+    Column("rowid", Integer),
+    Column("products_fts", Text),
+    Column("rank", Text),
+)
+
+_SQLITE_FTS_DDL = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS products_fts USING fts5(
+        name, brand, description, content='products', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2'
+    )""",
+    """CREATE TRIGGER IF NOT EXISTS products_fts_ai AFTER INSERT ON products BEGIN
+        INSERT INTO products_fts(rowid, name, brand, description)
+        VALUES (new.id, new.name, new.brand, new.description);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS products_fts_ad AFTER DELETE ON products BEGIN
+        INSERT INTO products_fts(products_fts, rowid, name, brand, description)
+        VALUES ('delete', old.id, old.name, old.brand, old.description);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS products_fts_au AFTER UPDATE OF name, brand, description ON products BEGIN
+        INSERT INTO products_fts(products_fts, rowid, name, brand, description)
+        VALUES ('delete', old.id, old.name, old.brand, old.description);
+        INSERT INTO products_fts(rowid, name, brand, description)
+        VALUES (new.id, new.name, new.brand, new.description);
+    END""",
+]
+
+for _statement in _SQLITE_FTS_DDL:
+    event.listen(models.Product.__table__, "after_create", DDL(_statement).execute_if(dialect="sqlite"))
+event.listen(
+    models.Product.__table__, "before_drop",
+    DDL("DROP TABLE IF EXISTS products_fts").execute_if(dialect="sqlite"),
+)
+
+def ensure_index(connection) -> List[str]:
+    """Create the SQLite full-text table and its triggers if missing (a database from before full-text
+    search) and index the existing rows. The Postgres GIN index is one of the products table's indexes."""
+    if connection.dialect.name != "sqlite":
+        return []
+    existed = inspect(connection).has_table("products_fts")
+    for statement in _SQLITE_FTS_DDL:
+        connection.execute(text(statement))
+    if existed:
+        return []
+    connection.execute(text("INSERT INTO products_fts(products_fts) VALUES ('rebuild')"))
+    return ["products_fts"]
+
+def tokenize(search_term: str) -> List[str]:
+    """Split a query into lowercase word tokens, dropping operators and punctuation"""
+    return [token.lower() for token in _TOKEN_RE.findall(search_term)]
+
+def _postgres_query(tokens: List[str]) -> str:
+    """Every token must match, each as a prefix: 'mac':* & 'pro':*"""
+    return " & ".join(f"'{token}':*" for token in tokens)
+
+def _sqlite_query(tokens: List[str]) -> str:
+    """Every token must match, each as a prefix: "mac"* "pro"*"""
+    return " ".join(f'"{token}"*' for token in tokens)
+
+def _postgres_score(ts_query):
+    """Lower is better. ts_rank_cd is a float4; as a double it survives the round trip through a cursor
+    exactly, so the keyset comparison neither repeats nor skips rows tied at the page boundary."""
+    return cast(-func.ts_rank_cd(SEARCH_VECTOR, ts_query), Float(53))
+
+def _ranked(query, score, skip: int, limit: int, after: Optional[Sequence]):
+    """Order by (score, id) and page by offset or by keyset"""
+    query = query.order_by(score, models.Product.id)
+    if after is not None:
+        score_after, id_after = after
+        query = query.filter(tuple_(score, models.Product.id) > tuple_(cast(score_after, Float(53)), id_after))
+        return query.limit(limit)
+    return query.offset(skip).limit(limit)
+
+def ilike_search(db: Session, search_term: str, skip: int = 0, limit: int = 100,
+                 after: Optional[Sequence] = None, options: Sequence = ()) -> List[Tuple[models.Product, float]]:
+    """Unindexed substring match on name and description (sequential scan)"""
+    search_pattern = f"%{search_term}%"
+    score = literal(0.0)
+    query = db.query(models.Product, score).options(*options).filter(
+        (models.Product.name.ilike(search_pattern)) |
+        (models.Product.description.ilike(search_pattern))
+    )
+    if after is not None:
+        query = query.filter(models.Product.id > after[1])
+        return query.order_by(models.Product.id).limit(limit).all()
+    return query.order_by(models.Product.id).offset(skip).limit(limit).all()
+
+def search(db: Session, search_term: str, skip: int = 0, limit: int = 100,
+           after: Optional[Sequence] = None, options: Sequence = ()) -> List[Tuple[models.Product, float]]:
+    """Ranked multi-word prefix search. Returns (product, score) pairs, best first."""
+    tokens = tokenize(search_term)
+    dialect = db.get_bind().dialect.name
+    if not tokens or dialect not in ("postgresql", "sqlite"):
+        return ilike_search(db, search_term, skip, limit, after, options)
+
+    if dialect == "postgresql":
+        ts_query = func.to_tsquery(TS_CONFIG, _postgres_query(tokens))
+        score = _postgres_score(ts_query)
+        query = db.query(models.Product, score).options(*options).filter(SEARCH_VECTOR.op("@@")(ts_query))
+    else:
+        score = products_fts.c.rank
+        query = db.query(models.Product, score).options(*options).join(
+            products_fts, products_fts.c.rowid == models.Product.id
+        ).filter(products_fts.c.products_fts.match(_sqlite_query(tokens)))
+    return _ranked(query, score, skip, limit, after).all()
+
+def rebuild_index(db: Session):
+    """Re-index every product (only needed for rows written before the index existed)"""
+    if db.get_bind().dialect.name == "sqlite":
+        db.execute(text("INSERT INTO products_fts(products_fts) VALUES ('rebuild')"))
+        db.commit()
+    elif db.get_bind().dialect.name == "postgresql":
+        db.execute(text("REINDEX INDEX ix_products_search"))
+        db.commit()
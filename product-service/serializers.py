@@ -0,0 +1,91 @@
+import json
+import math
+import re
+from typing import Iterable, List, Optional, Sequence
+
+from fastapi import Response
+
+try:
+    import orjson
+except ImportError:  # optional: the stdlib encoder produces the same bytes, only slower
+    orjson = None
+
+import schemas
+
+# ==================== Fast Response Serialization ====================
+# Product lists are built straight from ORM rows into plain dicts (same keys, same
+# order as schemas.Product) and encoded with orjson, skipping the response_model
+# validation of rows that came from our own database and the stdlib encoder.
+# The bytes are identical to what FastAPI's JSONResponse sends for the same
+# response_model; tests/test_crud.py checks this against the reference path.
+
+PRODUCT_FIELDS = list(schemas.Product.model_fields)
+CATEGORY_FIELDS = list(schemas.Category.model_fields)
+
+# The stdlib writes floats below 1e-4 or from 1e16 up in exponent form (1e-05, 1e+16),
+# which orjson spells differently (0.00001 or 1e-5, 1e16). Payloads that may contain
+# one are rare (no price is that small or large) and are re-encoded by the stdlib.
+_UNSAFE_FLOAT = re.compile(rb"\d[eE][-+]?\d|0\.0000\d")
+
+def _default(value):
+    isoformat = getattr(value, "isoformat", None)
+    if isoformat is None:
+        raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+    return isoformat()
+
+def _finite(value):
+    """Non-finite floats become null like orjson does (JSONResponse would fail on them instead)"""
+    if isinstance(value, float) and not math.isfinite(value):
+        return None
+    if isinstance(value, dict):
+        return {key: _finite(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_finite(item) for item in value]
+    return value
+
+def _stdlib_dumps(content) -> bytes:
+    """Exactly starlette's JSONResponse.render"""
+    return json.dumps(_finite(content), ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":"),
+                      default=_default).encode("utf-8")
+
+def dumps(content) -> bytes:
+    """Compact UTF-8 JSON, byte-identical to JSONResponse"""
+    if orjson is None:
+        return _stdlib_dumps(content)
+    try:
+        body = orjson.dumps(content)
+    except TypeError:
+        # Integers beyond 64 bits, or anything else orjson rejects
+        return _stdlib_dumps(content)
+    if _UNSAFE_FLOAT.search(body):
+        return _stdlib_dumps(content)
+    return body
+
+def category_dict(category) -> Optional[dict]:
+    if category is None:
+        return None
+    return {field: getattr(category, field) for field in CATEGORY_FIELDS}
+
+def product_dict(product, fields: Optional[Sequence[str]] = None) -> dict:
+    """A product row as the dict schemas.Product would serialize to (optionally only `fields`)"""
+    row = {}
+    for field in fields or PRODUCT_FIELDS:
+        if field == "category":
+            row["category"] = category_dict(product.category)
+        else:
+            row[field] = getattr(product, field)
+    return row
+
+def product_dicts(products: Iterable, fields: Optional[Sequence[str]] = None) -> List[dict]:
+    return [product_dict(product, fields) for product in products]
+
+class FastJSONResponse(Response):
+    media_type = "application/json"
+
+    def render(self, content) -> bytes:
+        return dumps(content)
+
+def json_response(content, response: Response) -> FastJSONResponse:
+    """Encode `content` and carry over the headers the route already set (cursor, ETag, caching)"""
+    headers = {name: value for name, value in response.headers.items() if name.lower() != "content-length"}
+    return FastJSONResponse(content, headers=headers)
@@ -0,0 +1,85 @@
+import json
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from sqlalchemy import delete, insert, select
+from sqlalchemy.orm import Session
+
+import models
+
+# ==================== Specification Attributes ====================
+# products.specifications stays the source of truth and is what the API returns.
+# product_specs mirrors it as one (product_id, key, value) row per scalar entry, so
+# ?spec.RAM=16GB becomes an index lookup on (key, value, product_id) instead of
+# parsing every row's JSON. Every write path (crud create/update/delete, the bulk
+# importer) keeps the two in the same transaction; rebuild() backfills.
+
+ProductSpec = models.ProductSpec
+
+MAX_KEY_LENGTH = 100
+MAX_VALUE_LENGTH = 255
+REBUILD_BATCH_SIZE = 1000
+
+def normalize(value) -> Optional[str]:
+    """The string a spec value is indexed (and matched) as; None if it is not filterable"""
+    if value is None or isinstance(value, (dict, list)):
+        return None
+    if isinstance(value, str):
+        return value
+    # true/false and numbers in their JSON spelling: {"Cores": 8} matches ?spec.Cores=8
+    return json.dumps(value)
+
+def spec_rows(product_id: int, specifications: Optional[dict]) -> List[dict]:
+    """product_specs rows for one product (nested or oversized entries are not indexed)"""
+    rows = []
+    for key, value in (specifications or {}).items():
+        value = normalize(value)
+        if value is None or len(key) > MAX_KEY_LENGTH or len(value) > MAX_VALUE_LENGTH:
+            continue
+        rows.append({"product_id": product_id, "key": key, "value": value})
+    return rows
+
+def insert_specs(db: Session, products: Iterable[Tuple[int, Optional[dict]]]):
+    """Index the specifications of newly inserted products, without committing"""
+    rows = [row for product_id, specifications in products for row in spec_rows(product_id, specifications)]
+    if rows:
+        db.execute(insert(ProductSpec), rows)
+
+def sync_specs(db: Session, product_id: int, specifications: Optional[dict]):
+    """Replace a product's indexed specifications, without committing"""
+    delete_specs(db, [product_id])
+    insert_specs(db, [(product_id, specifications)])
+
+def delete_specs(db: Session, product_ids: Sequence[int]):
+    """Drop the indexed specifications of products, without committing"""
+    db.execute(delete(ProductSpec).where(ProductSpec.product_id.in_(product_ids)))
+
+def spec_conditions(filters: Dict[str, List[str]]) -> list:
+    """WHERE clauses for {key: [values]}: every key must match one of its values"""
+    return [
+        models.Product.id.in_(
+            select(ProductSpec.product_id).where(ProductSpec.key == key, ProductSpec.value.in_(values))
+        )
+        for key, values in filters.items()
+    ]
+
+def rebuild(db: Session, batch_size: int = REBUILD_BATCH_SIZE) -> int:
+    """Rebuild product_specs from products.specifications; returns the number of rows indexed"""
+    db.execute(delete(ProductSpec))
+    indexed = 0
+    batch = []
+    rows = db.execute(
+        select(models.Product.id, models.Product.specifications)
+        .order_by(models.Product.id)
+        .execution_options(yield_per=batch_size)
+    )
+    for product_id, specifications in rows:
+        batch.extend(spec_rows(product_id, specifications))
+        if len(batch) >= batch_size:
+            db.execute(insert(ProductSpec), batch)
+            indexed += len(batch)
+            batch = []
+    if batch:
+        db.execute(insert(ProductSpec), batch)
+        indexed += len(batch)
+    db.commit()
+    return indexed
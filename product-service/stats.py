@@ -0,0 +1,188 @@
+import os
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import case, delete, func, insert, select, union_all, update
+from sqlalchemy.orm import Session
+
+import database
+import models
+
+# ==================== Catalog Statistics ====================
+# catalog_stats holds running totals for the whole catalog, each category and each
+# brand: product count, stock units, out-of-stock count and inventory value. Every
+# product write appends its delta (the product's contribution after the write minus
+# before) to catalog_stat_deltas in the same transaction, so GET /stats reads a few
+# small rows instead of scanning products. recompute() rebuilds the table from
+# scratch to fix any drift (out-of-band SQL, float rounding in inventory_value). It
+# locks out writers while it runs, or a delta appended between its scan and its
+# clearing of the deltas would be lost or counted twice.
+#
+# Appending never touches a shared row, so writers to different products never wait
+# for each other here. Updating the totals in place would lock the one "total" row
+# until commit and serialize every write in the catalog. Readers add the pending
+# deltas to the totals. compact() folds the deltas in, in batches, every
+# STATS_COMPACT_INTERVAL seconds. It deletes them with RETURNING, so each delta is
+# folded exactly once, even by two workers at the same time.
+
+CatalogStat = models.CatalogStat
+CatalogStatDelta = models.CatalogStatDelta
+
+TOTAL, CATEGORY, BRAND = "total", "category", "brand"
+COUNTERS = ("product_count", "stock_units", "out_of_stock", "inventory_value")
+
+COMPACT_INTERVAL_SECONDS = float(os.getenv("STATS_COMPACT_INTERVAL", "10"))  # 0 turns the compactor off
+COMPACT_BATCH_SIZE = 5000
+
+# What stats need to know about a product: (category_id, brand, price, stock_quantity)
+State = Tuple[Optional[int], Optional[str], float, int]
+
+def state(product) -> State:
+    return product.category_id, product.brand, product.price, product.stock_quantity or 0
+
+def _contribution(product: State) -> Tuple[int, int, int, float]:
+    _, _, price, stock = product
+    return 1, stock, 1 if stock <= 0 else 0, price * stock
+
+def _scopes(product: State) -> List[Tuple[str, str]]:
+    category_id, brand, _, _ = product
+    scopes = [(TOTAL, "")]
+    if category_id is not None:
+        scopes.append((CATEGORY, str(category_id)))
+    if brand is not None:
+        scopes.append((BRAND, brand))
+    return scopes
+
+def _deltas(transitions: Iterable[Tuple[Optional[State], Optional[State]]]) -> List[dict]:
+    deltas: Dict[Tuple[str, str], list] = defaultdict(lambda: [0, 0, 0, 0.0])
+    for before, after in transitions:
+        for product, sign in ((before, -1), (after, 1)):
+            if product is None:
+                continue
+            contribution = _contribution(product)
+            for scope in _scopes(product):
+                delta = deltas[scope]
+                for index, value in enumerate(contribution):
+                    delta[index] += sign * value
+    return [
+        dict(zip(("scope", "key") + COUNTERS, scope + tuple(delta)))
+        for scope, delta in sorted(deltas.items()) if any(delta)
+    ]
+
+def apply(db: Session, transitions: Iterable[Tuple[Optional[State], Optional[State]]]):
+    """Append the deltas of (before, after) product states, without committing (None: did not exist)"""
+    rows = _deltas(transitions)
+    if rows:
+        db.execute(insert(CatalogStatDelta), rows)
+
+def compact(db: Session, batch_size: int = COMPACT_BATCH_SIZE) -> int:
+    """Fold pending deltas into catalog_stats, one transaction per batch; returns how many were folded"""
+    folded = 0
+    while True:
+        batch = select(CatalogStatDelta.id).order_by(CatalogStatDelta.id).limit(batch_size)
+        taken = db.execute(
+            delete(CatalogStatDelta).where(CatalogStatDelta.id.in_(batch.scalar_subquery()))
+            .returning(CatalogStatDelta.scope, CatalogStatDelta.key,
+                       *[CatalogStatDelta.__table__.c[name] for name in COUNTERS])
+        ).all()
+        sums: Dict[Tuple[str, str], list] = defaultdict(lambda: [0, 0, 0, 0.0])
+        for scope, key, *values in taken:
+            for index, value in enumerate(values):
+                sums[(scope, key)][index] += value
+        rows = [dict(zip(("scope", "key") + COUNTERS, scope + tuple(total)))
+                for scope, total in sorted(sums.items()) if any(total)]
+        if rows:
+            _add(db, rows)
+        db.commit()
+        folded += len(taken)
+        if len(taken) < batch_size:
+            return folded
+
+def _add(db: Session, rows: List[dict]):
+    table = CatalogStat.__table__
+    dialect = db.get_bind().dialect.name
+    if dialect in ("postgresql", "sqlite"):
+        if dialect == "postgresql":
+            from sqlalchemy.dialects.postgresql import insert as upsert
+        else:
+            from sqlalchemy.dialects.sqlite import insert as upsert
+        statement = upsert(table)
+        db.execute(statement.on_conflict_do_update(
+            index_elements=[table.c.scope, table.c.key],
+            set_={name: table.c[name] + statement.excluded[name] for name in COUNTERS},
+        ), rows)
+        return
+    # Other backends: increment, and insert the rows that were not there yet
+    for row in rows:
+        result = db.execute(
+            update(table).where(table.c.scope == row["scope"], table.c.key == row["key"])
+            .values({name: table.c[name] + row[name] for name in COUNTERS})
+        )
+        if result.rowcount == 0:
+            db.execute(insert(table), [row])
+
+def recompute(db: Session) -> int:
+    """Rebuild catalog_stats from the products table; returns the number of rows written"""
+    Product = models.Product
+    counters = [
+        func.count(Product.id),
+        func.coalesce(func.sum(Product.stock_quantity), 0),
+        func.coalesce(func.sum(case((func.coalesce(Product.stock_quantity, 0) <= 0, 1), else_=0)), 0),
+        func.coalesce(func.sum(Product.price * func.coalesce(Product.stock_quantity, 0)), 0.0),
+    ]
+    # Every product write appends a delta, so holding the deltas table stops them (and compaction)
+    database.lock_table(db, CatalogStatDelta.__table__)
+    db.execute(delete(CatalogStatDelta))
+    db.execute(delete(CatalogStat))
+    rows = []
+    for scope, key in ((TOTAL, None), (CATEGORY, Product.category_id), (BRAND, Product.brand)):
+        query = select(*counters)
+        if key is not None:
+            query = select(key, *counters).where(key.isnot(None)).group_by(key)
+        for row in db.execute(query):
+            if key is None:
+                row = ("",) + tuple(row)
+            if row[1]:
+                rows.append(dict(zip(("scope", "key") + COUNTERS, (scope, str(row[0])) + tuple(row[1:]))))
+    if rows:
+        db.execute(insert(CatalogStat), rows)
+    db.commit()
+    return len(rows)
+
+def _counters(row) -> dict:
+    return {
+        "product_count": row.product_count,
+        "stock_units": row.stock_units,
+        "out_of_stock": row.out_of_stock,
+        "inventory_value": round(row.inventory_value, 2),
+    }
+
+def summary(db: Session) -> dict:
+    """Totals, per-category and per-brand stats as GET /stats returns them"""
+    # The folded totals plus the deltas not compacted yet
+    parts = [select(table.c.scope, table.c.key, *[table.c[name] for name in COUNTERS])
+             for table in (CatalogStat.__table__, CatalogStatDelta.__table__)]
+    combined = union_all(*parts).subquery()
+    rows = db.execute(
+        select(combined.c.scope, combined.c.key,
+               *[func.sum(combined.c[name]).label(name) for name in COUNTERS])
+        .group_by(combined.c.scope, combined.c.key)
+        .having(func.sum(combined.c.product_count) > 0)
+    ).all()
+    category_ids = [int(row.key) for row in rows if row.scope == CATEGORY]
+    names = dict(db.execute(
+        select(models.Category.id, models.Category.name).where(models.Category.id.in_(category_ids))
+    ).all()) if category_ids else {}
+    result = {name: 0 for name in COUNTERS}
+    categories, brands = [], []
+    for row in rows:
+        if row.scope == TOTAL:
+            result.update(_counters(row))
+        elif row.scope == CATEGORY:
+            category_id = int(row.key)
+            categories.append(dict(id=category_id, name=names.get(category_id), **_counters(row)))
+        else:
+            brands.append(dict(brand=row.key, **_counters(row)))
+    result["categories"] = sorted(categories, key=lambda entry: entry["id"])
+    result["brands"] = sorted(brands, key=lambda entry: (-entry["product_count"], entry["brand"]))
+    return result
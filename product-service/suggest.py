@@ -0,0 +1,226 @@
+import heapq
+import os
+import re
+import threading
+from bisect import bisect_left, insort
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session, load_only
+
+import changes
+import models
+
+# ==================== Typeahead Suggestions ====================
+# GET /products/suggest answers from a per-worker in-memory index over product
+# names and brands; it never queries the database. Each distinct name is stored
+# as one sorted key per word start ("apple macbook pro" -> "apple macbook pro",
+# "macbook pro", "pro"), so a prefix of any word matches with one binary search
+# and a short scan. Brands get their own sorted list with product counts.
+#
+# The index is built from the products table at startup. Writes in this worker
+# (create, update, delete, import) update it right after they commit. Writes in
+# other workers, and stock changes that move a product in or out of stock, reach
+# it through the change feed, which each worker applies every
+# SUGGEST_REFRESH_INTERVAL seconds.
+
+Product = models.Product
+
+DEFAULT_LIMIT = 10
+MAX_LIMIT = 50
+BRAND_LIMIT = 3
+# Ranking looks at no more than this many matches (alphabetical), so short prefixes stay fast
+SCAN_LIMIT = 1000
+# Answers are memoized until the next change to the index: most lookups are the first few letters
+RESULT_CACHE_SIZE = 10000
+REFRESH_INTERVAL_SECONDS = float(os.getenv("SUGGEST_REFRESH_INTERVAL", "5"))
+
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+_LAST = "\U0010ffff"  # Sorts after any character, so prefix + _LAST bounds the keys starting with prefix
+
+def normalize(text: Optional[str]) -> str:
+    """Lowercase with single spaces, as both keys and prefixes are compared"""
+    return " ".join((text or "").lower().split())
+
+def _word_keys(name: str) -> List[str]:
+    return [name[match.start():] for match in _WORD_RE.finditer(name)]
+
+def _matches(keys: list, low, high) -> slice:
+    """The run of sorted `keys` from low up to high, at most SCAN_LIMIT long"""
+    start = bisect_left(keys, low)
+    return slice(start, bisect_left(keys, high, start, min(len(keys), start + SCAN_LIMIT)))
+
+class SuggestIndex:
+    """Prefix index over product names and brands, safe to share between threads"""
+
+    def __init__(self, result_cache_size: int = RESULT_CACHE_SIZE):
+        self.result_cache_size = result_cache_size
+        self.ready = False
+        self.cursor = (0, 0)  # Change feed position the index is current with
+        self._lock = threading.Lock()
+        self._keys: List[Tuple[str, str]] = []  # (key, normalized name), sorted
+        self._names: Dict[str, list] = {}       # normalized name -> [name, product ids, in-stock product ids]
+        self._products: Dict[int, tuple] = {}   # product_id -> (normalized name, name, brand, in stock)
+        self._brands: Dict[str, list] = {}      # normalized brand -> [brand, product count]
+        self._brand_keys: List[str] = []        # sorted
+        self._results: Dict[Tuple[str, int], List[dict]] = {}
+
+    def __len__(self) -> int:
+        return len(self._products)
+
+    def build(self, rows: Iterable[tuple], cursor: Tuple[int, int]):
+        """Replace the contents with (id, name, brand, stock_quantity) rows, current as of change feed `cursor`"""
+        fresh = SuggestIndex(self.result_cache_size)
+        for product_id, name, brand, stock_quantity in rows:
+            fresh._add(product_id, self._entry(name, brand, stock_quantity), sort=False)
+        fresh._keys.sort()
+        fresh._brand_keys.sort()
+        with self._lock:
+            self._keys, self._names, self._products = fresh._keys, fresh._names, fresh._products
+            self._brands, self._brand_keys = fresh._brands, fresh._brand_keys
+            self._results = {}
+            self.cursor = cursor
+            self.ready = True
+
+    def put(self, product_id: int, name: str, brand: Optional[str], stock_quantity: Optional[int]):
+        """Add a product or replace its entry"""
+        entry = self._entry(name, brand, stock_quantity)
+        with self._lock:
+            if self._products.get(product_id) == entry:
+                return
+            self._remove(product_id)
+            self._add(product_id, entry)
+
+    def remove(self, product_id: int):
+        with self._lock:
+            self._remove(product_id)
+
+    def apply_changes(self, entries: List[tuple], cursor: Tuple[int, int]):
+        """Apply a change feed page, [(change, product or None)], and advance the cursor"""
+        for entry, product in entries:
+            if product is None:
+                self.remove(entry.product_id)
+            else:
+                self.put(product.id, product.name, product.brand, product.stock_quantity)
+        with self._lock:
+            self.cursor = max(self.cursor, cursor)
+
+    def suggest(self, prefix: str, limit: int = DEFAULT_LIMIT) -> List[dict]:
+        """Up to `limit` suggestions: matching brands (most products first), then distinct matching product
+        names (name starts with the prefix before a later word does, in stock first, shortest first).
+        The list is shared with later callers; do not modify it."""
+        prefix = normalize(prefix)
+        if not prefix:
+            return []
+        with self._lock:
+            cached = self._results.get((prefix, limit))
+            if cached is not None:
+                return cached
+            brands = [tuple(self._brands[key]) for key in self._brand_keys[_matches(self._brand_keys, prefix, prefix + _LAST)]]
+            names = self._names
+            # A name matching at several words appears at most twice here (as a name start and as a later word),
+            # so 2 * limit candidates always hold `limit` distinct names
+            ranked = heapq.nsmallest(2 * limit, {
+                (key != normalized, not names[normalized][2], len(normalized), normalized)
+                for key, normalized in self._keys[_matches(self._keys, (prefix,), (prefix + _LAST,))]
+            })
+            brands.sort(key=lambda brand: (-brand[1], brand[0]))
+            suggestions = [
+                {"text": brand, "kind": "brand", "product_id": None, "product_count": count}
+                for brand, count in brands[:min(BRAND_LIMIT, limit)]
+            ]
+            seen = set()
+            for *_, normalized in ranked:
+                if len(suggestions) == limit:
+                    break
+                if normalized in seen:
+                    continue
+                seen.add(normalized)
+                name, product_ids, in_stock = names[normalized]
+                suggestions.append({"text": name, "kind": "product", "product_id": min(in_stock or product_ids),
+                                    "product_count": len(product_ids)})
+            if self.result_cache_size > 0:
+                if len(self._results) >= self.result_cache_size:
+                    self._results.clear()
+                self._results[(prefix, limit)] = suggestions
+        return suggestions
+
+    @staticmethod
+    def _entry(name: str, brand: Optional[str], stock_quantity: Optional[int]) -> tuple:
+        return normalize(name), name, brand or None, (stock_quantity or 0) > 0
+
+    def _add(self, product_id: int, entry: tuple, sort: bool = True):
+        normalized, name, brand, in_stock = entry
+        self._products[product_id] = entry
+        self._results.clear()
+        named = self._names.get(normalized)
+        if named is None:
+            named = self._names[normalized] = [name, set(), set()]
+            for key in _word_keys(normalized):
+                if sort:
+                    insort(self._keys, (key, normalized))
+                else:
+                    self._keys.append((key, normalized))
+        named[1].add(product_id)
+        if in_stock:
+            named[2].add(product_id)
+        if brand:
+            normalized_brand = normalize(brand)
+            if normalized_brand not in self._brands:
+                self._brands[normalized_brand] = [brand, 0]
+                if sort:
+                    insort(self._brand_keys, normalized_brand)
+                else:
+                    self._brand_keys.append(normalized_brand)
+            self._brands[normalized_brand][1] += 1
+
+    def _remove(self, product_id: int):
+        entry = self._products.pop(product_id, None)
+        if entry is None:
+            return
+        self._results.clear()
+        normalized, _, brand, _ = entry
+        named = self._names[normalized]
+        named[1].discard(product_id)
+        named[2].discard(product_id)
+        if not named[1]:
+            del self._names[normalized]
+            for key in _word_keys(normalized):
+                position = bisect_left(self._keys, (key, normalized))
+                if position < len(self._keys) and self._keys[position] == (key, normalized):
+                    del self._keys[position]
+        if brand:
+            normalized_brand = normalize(brand)
+            counted = self._brands[normalized_brand]
+            counted[1] -= 1
+            if counted[1] == 0:
+                del self._brands[normalized_brand]
+                del self._brand_keys[bisect_left(self._brand_keys, normalized_brand)]
+
+index = SuggestIndex()
+
+def load(db: Session, target: SuggestIndex = index):
+    """(Re)build the index from the products table"""
+    # Read the cursor first: anything written during the load is replayed by the next refresh
+    cursor = changes.head(db)
+    rows = db.execute(select(Product.id, Product.name, Product.brand, Product.stock_quantity))
+    target.build(rows, cursor)
+
+def refresh(db: Session, target: SuggestIndex = index, page_size: int = 1000) -> int:
+    """Apply change feed entries written since the index was last current; returns how many products changed"""
+    if not target.ready:
+        load(db, target)
+        return len(target)
+    applied = 0
+    options = (load_only(Product.id, Product.name, Product.brand, Product.stock_quantity),)
+    while True:
+        try:
+            entries, cursor, has_more = changes.changes_since(db, target.cursor, page_size, options)
+        except changes.CursorExpired:
+            load(db, target)
+            return len(target)
+        target.apply_changes(entries, cursor)
+        applied += len(entries)
+        if not has_more:
+            break
+    return applied
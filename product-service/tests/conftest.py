@@ -0,0 +1,30 @@
+import os
+
+import pytest
+
+import database
+import profiling
+
+@pytest.fixture(scope="session")
+def app_database(tmp_path_factory):
+    """Point the app at a fresh SQLite file (or TEST_DATABASE_URL) instead of DATABASE_URL, with its schema"""
+    url = os.getenv("TEST_DATABASE_URL") or f"sqlite:///{tmp_path_factory.mktemp('app') / 'test_main.db'}"
+    with pytest.MonkeyPatch.context() as patch:
+        patch.setattr(database, "DATABASE_URL", url)
+        patch.setattr(database, "ASYNC_DATABASE_URL", database._async_url(url))
+        patch.setattr(database, "READ_DATABASE_URLS", [])
+        database.dispose()
+        database.init_db()
+        yield url
+        database.dispose()
+
+@pytest.fixture
+def max_queries():
+    """Statement budget for a block: `with max_queries(2): ...` fails, listing the statements, if it runs more"""
+    return profiling.assert_max_queries
+
+@pytest.fixture
+def query_count(monkeypatch):
+    """Statements the request behind a TestClient response ran: `assert query_count(response) <= 3`"""
+    monkeypatch.setattr(profiling, "DEBUG_HEADERS", True)
+    return lambda response: int(response.headers[profiling.COUNT_HEADER])
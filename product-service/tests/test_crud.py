@@ -1,10 +1,31 @@
+import asyncio
+import json
 import pytest
-from sqlalchemy import create_engine
+import threading
+from datetime import datetime
+from sqlalchemy import create_engine, event, func, inspect, select, update
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import sessionmaker
+import database
 from database import Base
 import models
 import schemas
+import cache
+import changes
+import coalescer
 import crud
+import exporter
+import filtering
+import importer
+import reservations
+import search
+import specs
+import stats
+import suggest
+import metrics
+import profiling
+import serializers
+import admission
 
 # Create test database
 SQLALCHEMY_DATABASE_URL = "sqlite:///./test.db"
@@ -15,6 +36,7 @@ TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engin
 def db():
     """Create test database and tables"""
     Base.metadata.create_all(bind=engine)
+    cache.clear_all()
     db = TestingSessionLocal()
     yield db
     db.close()
@@ -157,3 +179,944 @@ def test_update_product_stock(db):
     
     updated_product = crud.update_product_stock(db, product.id, 5)
     assert updated_product.stock_quantity == 5
+
+def test_get_products_keyset_pagination(db):
+    """Test paging products by keyset returns every row exactly once"""
+    category = crud.create_category(db, schemas.CategoryCreate(name="Keyset Test", description="Test"))
+    for i in range(5):
+        crud.create_product(db, schemas.ProductCreate(
+            name=f"Keyset Product {i}",
+            price=10.0 + i,
+            stock_quantity=1,
+            category_id=category.id
+        ))
+    
+    first_page = crud.get_products(db, limit=2)
+    second_page = crud.get_products(db, limit=2, after_id=first_page[-1].id)
+    last_page = crud.get_products(db, limit=2, after_id=second_page[-1].id)
+    
+    ids = [p.id for p in first_page + second_page + last_page]
+    assert len(last_page) == 1
+    assert ids == sorted(ids)
+    assert len(set(ids)) == 5
+
+def test_search_products_prefix_and_multi_word(db):
+    """Test that search matches word prefixes and requires every word"""
+    category = crud.create_category(db, schemas.CategoryCreate(name="Search Ranking", description="Test"))
+    crud.create_product(db, schemas.ProductCreate(
+        name="MacBook Pro 16", description="Apple laptop", price=2499.0, brand="Apple", category_id=category.id
+    ))
+    crud.create_product(db, schemas.ProductCreate(
+        name="MacBook Air", description="Thin laptop", price=1199.0, brand="Apple", category_id=category.id
+    ))
+    
+    assert len(crud.search_products(db, "macb")) == 2
+    results = crud.search_products(db, "macbook pro")
+    assert [p.name for p in results] == ["MacBook Pro 16"]
+
+def test_search_index_follows_updates(db):
+    """Test that renamed products are found by their new name only"""
+    category = crud.create_category(db, schemas.CategoryCreate(name="Search Update", description="Test"))
+    product = crud.create_product(db, schemas.ProductCreate(
+        name="Galaxy Tab", price=499.0, brand="Samsung", category_id=category.id
+    ))
+    
+    crud.update_product(db, product.id, schemas.ProductUpdate(name="Pixel Tablet"))
+    assert crud.search_products(db, "galaxy") == []
+    assert [p.id for p in crud.search_products(db, "pixel")] == [product.id]
+
+def test_decrease_product_stock(db):
+    """Test the conditional stock decrement"""
+    category = crud.create_category(db, schemas.CategoryCreate(name="Decrease Test", description="Test"))
+    product = crud.create_product(db, schemas.ProductCreate(
+        name="Decrease Product", price=10.0, stock_quantity=3, category_id=category.id
+    ))
+    
+    assert crud.decrease_product_stock(db, product.id, 2) == 1
+    assert crud.decrease_product_stock(db, product.id, 2) is None
+    assert crud.decrease_product_stock(db, 99999, 1) is None
+    db.expire_all()
+    assert crud.get_product(db, product.id).stock_quantity == 1
+
+def test_decrease_stock_batch_is_all_or_nothing(db):
+    """Test that one short line rolls back the whole order"""
+    category = crud.create_category(db, schemas.CategoryCreate(name="Batch Test", description="Test"))
+    a = crud.create_product(db, schemas.ProductCreate(name="A", price=1.0, stock_quantity=5, category_id=category.id))
+    b = crud.create_product(db, schemas.ProductCreate(name="B", price=1.0, stock_quantity=1, category_id=category.id))
+    
+    new_quantities, failed = crud.decrease_stock_batch(db, [(a.id, 2), (b.id, 2)])
+    assert new_quantities is None
+    assert failed == [b.id]
+    db.expire_all()
+    assert crud.get_product(db, a.id).stock_quantity == 5
+    
+    new_quantities, failed = crud.decrease_stock_batch(db, [(a.id, 2), (b.id, 1), (a.id, 1)])
+    assert failed == []
+    assert new_quantities == {a.id: 2, b.id: 0}
+
+def test_concurrent_decrease_never_oversells(db):
+    """Stress test: parallel decrements sell exactly the available stock"""
+    category = crud.create_category(db, schemas.CategoryCreate(name="Stress Test", description="Test"))
+    product = crud.create_product(db, schemas.ProductCreate(
+        name="Hot Product", price=99.0, stock_quantity=50, category_id=category.id
+    ))
+    successes = []
+    
+    def buyer():
+        session = TestingSessionLocal()
+        try:
+            for _ in range(5):
+                if crud.decrease_product_stock(session, product.id, 3) is not None:
+                    successes.append(3)
+        finally:
+            session.close()
+    
+    threads = [threading.Thread(target=buyer) for _ in range(16)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    
+    db.expire_all()
+    remaining = crud.get_product(db, product.id).stock_quantity
+    assert remaining >= 0
+    assert sum(successes) + remaining == 50
+    assert len(successes) == 16
+
+async def _chunks(payload: bytes, size: int = 7):
+    for start in range(0, len(payload), size):
+        yield payload[start:start + size]
+
+async def _collect(items):
+    return [item async for item in items]
+
+def test_import_ndjson_reports_bad_rows(db):
+    """Test that a streamed NDJSON import inserts valid rows and reports the rest"""
+    category = crud.create_category(db, schemas.CategoryCreate(name="Import Test", description="Test"))
+    payload = "\n".join([
+        json.dumps({"name": "Imported Phone", "price": 199.0, "category_id": category.id,
+                    "specifications": {"RAM": "8GB"}}),
+        json.dumps({"name": "No Price", "category_id": category.id}),
+        "{not json",
+        json.dumps({"name": "Orphan", "price": 5.0, "category_id": 99999}),
+        json.dumps({"name": "Imported Tablet", "price": 299.0, "category_id": category.id}),
+    ]).encode()
+    
+    report = asyncio.run(importer.import_stream(db, _chunks(payload), "ndjson", batch_size=2))
+    
+    assert report.imported == 2
+    assert [error["row"] for error in report.errors] == [2, 3, 4]
+    assert {p.name for p in crud.get_products_by_category(db, category.id)} == {"Imported Phone", "Imported Tablet"}
+
+def test_import_csv_with_multiline_field(db):
+    """Test CSV import, including a quoted description spanning two lines"""
+    category = crud.create_category(db, schemas.CategoryCreate(name="CSV Import", description="Test"))
+    payload = (
+        "name,description,price,stock_quantity,brand,category_id,specifications,image_url\r\n"
+        f'Dell XPS 15,"Laptop\nwith OLED",1999.0,4,Dell,{category.id},"{{""RAM"": ""32GB""}}",\r\n'
+        f"HP Spectre,,-1,2,HP,{category.id},,\r\n"
+    ).encode()
+    
+    report = asyncio.run(importer.import_stream(db, _chunks(payload), "csv"))
+    
+    assert report.imported == 1
+    assert report.failed == 1
+    product = crud.get_products_by_brand(db, "Dell")[0]
+    assert product.description == "Laptop\nwith OLED"
+    assert product.specifications == {"RAM": "32GB"}
+
+def test_import_rejects_overlong_lines(db, monkeypatch):
+    """Test that a line or quoted CSV record over the length limit stops the import after the batches before it"""
+    monkeypatch.setattr(importer, "MAX_LINE_LENGTH", 200)
+    category = crud.create_category(db, schemas.CategoryCreate(name="Long Lines"))
+    rows = [json.dumps({"name": f"Short {i}", "price": 1.0, "category_id": category.id}) for i in range(2)]
+    long_row = json.dumps({"name": "Long", "price": 1.0, "category_id": category.id, "description": "x" * 300})
+    payload = "\n".join(rows + [long_row, rows[0]]).encode()
+    
+    with pytest.raises(importer.LineTooLong) as caught:
+        asyncio.run(importer.import_stream(db, _chunks(payload, 64), "ndjson", batch_size=2))
+    assert caught.value.report.imported == 2
+    # Lines up to the limit are fine, however the chunks split them
+    lines = asyncio.run(_collect(importer.iter_lines(_chunks(("y" * 200 + "\n").encode() * 2, 3))))
+    assert lines == ["y" * 200] * 2
+    
+    payload = (f'name,description,price,category_id\nOpen,"{"z" * 120}\n{"z" * 120}\n').encode()
+    with pytest.raises(importer.LineTooLong):
+        asyncio.run(importer.import_stream(db, _chunks(payload), "csv"))
+
+def test_export_ndjson_matches_product_schema(db):
+    """Test that streamed export rows serialize exactly like schemas.Product"""
+    category = crud.create_category(db, schemas.CategoryCreate(name="Export Test", description="Test"))
+    for i in range(3):
+        crud.create_product(db, schemas.ProductCreate(
+            name=f"Export Product {i}", price=10.5 + i, stock_quantity=i, brand="Sony",
+            category_id=category.id, specifications={"Color": "Black"}
+        ))
+    
+    lines = b"".join(exporter.iter_ndjson(db, batch_size=2)).decode().splitlines()
+    
+    expected = [schemas.Product.model_validate(p).model_dump_json() for p in crud.get_products(db)]
+    assert lines == expected
+
+def test_export_csv_round_trips_through_import(db):
+    """Test that the CSV export can be fed back into the importer"""
+    category = crud.create_category(db, schemas.CategoryCreate(name="Round Trip", description="Test"))
+    crud.create_product(db, schemas.ProductCreate(
+        name="Round Trip Phone", description="Line one\nline two", price=10.0, category_id=category.id,
+        specifications={"RAM": "8GB"}
+    ))
+    payload = b"".join(exporter.iter_csv(db))
+    
+    report = asyncio.run(importer.import_stream(db, _chunks(payload), "csv"))
+    
+    assert report.imported == 1
+    copies = crud.search_products(db, "round trip")
+    assert len(copies) == 2
+    assert copies[1].description == "Line one\nline two"
+    assert copies[1].specifications == {"RAM": "8GB"}
+
+def test_ttl_cache_evicts_least_recently_used():
+    """Test LRU eviction, expiry and hit/miss counters"""
+    lru = cache.TTLCache(maxsize=2, ttl=60)
+    lru.set("a", 1)
+    lru.set("b", 2)
+    assert lru.get("a") == 1
+    lru.set("c", 3)
+    assert lru.get("b") is None
+    assert lru.stats()["hits"] == 1
+    assert lru.stats()["misses"] == 1
+    
+    expired = cache.TTLCache(maxsize=2, ttl=-1)
+    expired.set("a", 1)
+    assert expired.get("a") is None
+
+def test_cached_product_is_invalidated_by_stock_writes(db):
+    """Test that cached product reads never return stale stock"""
+    category = crud.create_category(db, schemas.CategoryCreate(name="Cache Test", description="Test"))
+    product = crud.create_product(db, schemas.ProductCreate(
+        name="Cached Product", price=10.0, stock_quantity=5, category_id=category.id
+    ))
+    
+    assert crud.get_product_cached(db, product.id).stock_quantity == 5
+    hits = cache.product_cache.hits
+    assert crud.get_product_cached(db, product.id).stock_quantity == 5
+    assert cache.product_cache.hits == hits + 1
+    
+    crud.decrease_product_stock(db, product.id, 2)
+    assert crud.get_product_cached(db, product.id).stock_quantity == 3
+    crud.update_product_stock(db, product.id, 9)
+    assert crud.get_product_cached(db, product.id).stock_quantity == 9
+    crud.update_category(db, category.id, schemas.CategoryUpdate(name="Renamed Cache Test"))
+    assert crud.get_product_cached(db, product.id).category.name == "Renamed Cache Test"
+    crud.delete_product(db, product.id)
+    assert crud.get_product_cached(db, product.id) is None
+
+def test_get_products_by_ids(db):
+    """Test fetching several products in one query"""
+    category = crud.create_category(db, schemas.CategoryCreate(name="Batch Get", description="Test"))
+    a = crud.create_product(db, schemas.ProductCreate(name="A", price=1.0, category_id=category.id))
+    b = crud.create_product(db, schemas.ProductCreate(name="B", price=2.0, category_id=category.id))
+    
+    products = crud.get_products_by_ids(db, [b.id, a.id, 99999])
+    assert {p.id for p in products} == {a.id, b.id}
+    assert crud.get_products_by_ids(db, []) == []
+
+def test_product_list_loads_categories_without_n_plus_one(db):
+    """Test that a page of products loads categories with a constant number of queries"""
+    for name in ("Eager A", "Eager B", "Eager C"):
+        category = crud.create_category(db, schemas.CategoryCreate(name=name, description="Test"))
+        crud.create_product(db, schemas.ProductCreate(name=f"{name} Product", price=1.0, category_id=category.id))
+    db.expire_all()
+    statements = []
+    
+    def count(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+    
+    event.listen(engine, "before_cursor_execute", count)
+    try:
+        products = crud.get_products(db)
+        names = [p.category.name for p in products]
+    finally:
+        event.remove(engine, "before_cursor_execute", count)
+    assert len(names) == 3
+    assert len(statements) == 2
+
+def test_product_field_projection_skips_category(db):
+    """Test that a field projection leaves out unrequested columns and the category"""
+    category = crud.create_category(db, schemas.CategoryCreate(name="Projection", description="Test"))
+    crud.create_product(db, schemas.ProductCreate(
+        name="Projected", price=3.0, category_id=category.id, specifications={"RAM": "8GB"}
+    ))
+    db.expire_all()
+    
+    product = crud.get_products(db, fields=["id", "name", "price"])[0]
+    assert "specifications" not in product.__dict__
+    assert product.category is None
+    assert product.name == "Projected"
+
+def test_async_crud_reads_and_decrements(db):
+    """Test the async CRUD path against the same database through aiosqlite"""
+    pytest.importorskip("aiosqlite")
+    from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+    import async_crud
+    
+    category = crud.create_category(db, schemas.CategoryCreate(name="Async Test", description="Test"))
+    product = crud.create_product(db, schemas.ProductCreate(
+        name="Async Product", price=10.0, stock_quantity=4, category_id=category.id
+    ))
+    
+    async def scenario():
+        async_engine = create_async_engine("sqlite+aiosqlite:///./test.db")
+        try:
+            async with async_sessionmaker(async_engine, expire_on_commit=False)() as session:
+                listed = await async_crud.get_products_by_category(session, category.id)
+                assert [p.category.name for p in listed] == ["Async Test"]
+                assert await async_crud.decrease_product_stock(session, product.id, 3) == 1
+                assert await async_crud.decrease_product_stock(session, product.id, 3) is None
+                return (await async_crud.get_product_cached(session, product.id)).stock_quantity
+        finally:
+            await async_engine.dispose()
+    
+    assert asyncio.run(scenario()) == 1
+
+def test_histogram_quantiles():
+    """Test that latency quantiles are interpolated within their bucket"""
+    histogram = metrics.Histogram(buckets=(0.01, 0.1, 1.0))
+    for _ in range(90):
+        histogram.observe(0.005)
+    for _ in range(10):
+        histogram.observe(0.5)
+    assert histogram.count == 100
+    assert histogram.quantile(0.5) == pytest.approx(0.01 * 50 / 90)
+    assert 0.1 < histogram.quantile(0.99) <= 1.0
+    assert metrics.Histogram().quantile(0.5) == 0.0
+
+def test_filter_products_with_disjunctive_facets(db):
+    """Test combined filters, price sort keyset paging and facet counts"""
+    laptops = crud.create_category(db, schemas.CategoryCreate(name="Filter Laptops"))
+    phones = crud.create_category(db, schemas.CategoryCreate(name="Filter Phones"))
+    for name, brand, category, price, stock in [
+        ("Mac A", "Apple", laptops, 1500.0, 3), ("Mac B", "Apple", laptops, 900.0, 0),
+        ("XPS", "Dell", laptops, 1200.0, 5), ("iPhone", "Apple", phones, 800.0, 2),
+        ("Galaxy", "Samsung", phones, 150.0, 1),
+    ]:
+        crud.create_product(db, schemas.ProductCreate(
+            name=name, brand=brand, price=price, stock_quantity=stock, category_id=category.id
+        ))
+    
+    criteria = filtering.ProductFilter(category_ids=[laptops.id], brands=["Apple"], in_stock=True)
+    assert [p.name for p in crud.filter_products(db, criteria)] == ["Mac A"]
+    
+    criteria = filtering.ProductFilter(min_price=500, in_stock=True)
+    first_page = crud.filter_products(db, criteria, sort="price_desc", limit=2)
+    after = filtering.parse_after(json.loads(json.dumps(filtering.sort_key(first_page[-1], "price_desc"))),
+                                  "price_desc")
+    second_page = crud.filter_products(db, criteria, sort="price_desc", limit=2, after=after)
+    assert [p.name for p in first_page + second_page] == ["Mac A", "XPS", "iPhone"]
+    assert crud.count_filtered_products(db, criteria) == 3
+    
+    facets = crud.get_product_facets(db, filtering.ProductFilter(brands=["Apple"]))
+    # The brand facet ignores the brand filter; the others apply it
+    assert facets["brands"][0] == {"value": "Apple", "count": 3}
+    assert {b["value"] for b in facets["brands"]} == {"Apple", "Dell", "Samsung"}
+    assert {c["name"]: c["count"] for c in facets["categories"]} == {"Filter Laptops": 2, "Filter Phones": 1}
+    assert sum(bucket["count"] for bucket in facets["price"]) == 3
+    assert facets["price"][-1] == {"min": 2000.0, "max": None, "count": 0}
+
+def test_spec_filter_follows_writes_and_import(db):
+    """Test that product_specs stays in sync with create, update, delete and import"""
+    category = crud.create_category(db, schemas.CategoryCreate(name="Spec Laptops"))
+    small = crud.create_product(db, schemas.ProductCreate(
+        name="Small", price=500.0, category_id=category.id, specifications={"RAM": "8GB", "Cores": 4}
+    ))
+    big = crud.create_product(db, schemas.ProductCreate(
+        name="Big", price=900.0, category_id=category.id, specifications={"RAM": "16GB", "Storage": "512GB"}
+    ))
+    payload = json.dumps({"name": "Imported", "price": 700.0, "category_id": category.id,
+                          "specifications": {"RAM": "16GB", "Storage": "1TB"}}).encode()
+    asyncio.run(importer.import_stream(db, _chunks(payload, 64), "ndjson"))
+    
+    def names(spec_filter):
+        criteria = filtering.ProductFilter(specs=spec_filter)
+        return sorted(p.name for p in crud.filter_products(db, criteria))
+    
+    assert names({"RAM": ["16GB"]}) == ["Big", "Imported"]
+    assert names({"RAM": ["16GB"], "Storage": ["512GB", "2TB"]}) == ["Big"]
+    assert names({"Cores": ["4"]}) == ["Small"]
+    
+    crud.update_product(db, small.id, schemas.ProductUpdate(specifications={"RAM": "16GB", "Storage": "512GB"}))
+    assert names({"RAM": ["16GB"], "Storage": ["512GB"]}) == ["Big", "Small"]
+    
+    crud.delete_product(db, big.id)
+    assert db.query(models.ProductSpec).filter(models.ProductSpec.product_id == big.id).count() == 0
+    
+    db.query(models.ProductSpec).delete()
+    db.commit()
+    assert names({"RAM": ["16GB"]}) == []
+    assert specs.rebuild(db) == 4
+    assert names({"RAM": ["16GB"]}) == ["Imported", "Small"]
+
+def test_category_update_bumps_product_updated_at(db):
+    """Test that renaming a category marks its products as changed (they embed it)"""
+    category = crud.create_category(db, schemas.CategoryCreate(name="Before Rename"))
+    product = crud.create_product(db, schemas.ProductCreate(name="Renamed", price=5.0, category_id=category.id))
+    before = product.updated_at
+    version = crud.get_products_version(db, filtering.ProductFilter(category_ids=[category.id]))
+    
+    crud.update_category(db, category.id, schemas.CategoryUpdate(name="After Rename"))
+    
+    db.refresh(product)
+    assert product.updated_at > before
+    assert crud.get_products_version(db, filtering.ProductFilter(category_ids=[category.id])) != version
+
+def test_fast_serialization_matches_response_model(db, monkeypatch):
+    """Test that the fast product serializer sends the same bytes as FastAPI's response_model path"""
+    from typing import List
+    from fastapi.responses import JSONResponse
+    from pydantic import TypeAdapter
+    
+    category = crud.create_category(db, schemas.CategoryCreate(name="Säkerhet", description=None))
+    for name, price, specifications in [
+        ("Plain", 19.99, None), ("Ünïcode ✓ \"quoted\"", 0.1, {"RAM": "16GB", "Cores": 8, "Nested": {"a": [1, 2.5]}}),
+        ("Cheap", 0.00001, {}), ("Huge", 1e16, {"Ratio": 1 / 3}),
+    ]:
+        crud.create_product(db, schemas.ProductCreate(
+            name=name, brand="Brand", price=price, category_id=category.id, specifications=specifications
+        ))
+    products = crud.get_products(db)
+    adapter = TypeAdapter(List[schemas.Product])
+    expected = JSONResponse(adapter.dump_python(adapter.validate_python(products, from_attributes=True),
+                                                mode="json")).body
+    
+    assert serializers.dumps(serializers.product_dicts(products)) == expected
+    monkeypatch.setattr(serializers, "orjson", None)
+    assert serializers.dumps(serializers.product_dicts(products)) == expected
+    assert json.loads(serializers.dumps(serializers.product_dicts(products, ["id", "category"])))[0] == {
+        "id": products[0].id, "category": {"name": "Säkerhet", "description": None, "id": category.id}
+    }
+
+def test_change_feed_pages_and_prune(db):
+    """Test change feed paging across every write path, and cursor expiry after pruning"""
+    category = crud.create_category(db, schemas.CategoryCreate(name="Feed"))
+    product = crud.create_product(db, schemas.ProductCreate(name="Fed", price=5.0, stock_quantity=3,
+                                                            category_id=category.id))
+    payload = json.dumps({"name": "Imported Feed", "price": 7.0, "category_id": category.id}).encode()
+    asyncio.run(importer.import_stream(db, _chunks(payload, 64), "ndjson"))
+    crud.decrease_product_stock(db, product.id, 1)
+    crud.decrease_stock_batch(db, [(product.id, 1)])
+    crud.update_category(db, category.id, schemas.CategoryUpdate(name="Feed Renamed"))
+    assert crud.get_changes_head(db) == (0, 6)
+    
+    page, position, has_more = crud.get_product_changes(db, (0, 0), limit=2)
+    assert [entry.product_id for entry, _ in page] == [product.id, product.id + 1]
+    assert (position, has_more) == ((0, 2), True)
+    page, position, has_more = crud.get_product_changes(db, position, limit=10)
+    # Four entries collapse into the latest one per product
+    assert [(entry.seq, entry.product_id) for entry, _ in page] == [(5, product.id), (6, product.id + 1)]
+    assert page[0][1].stock_quantity == 1
+    assert page[0][1].category.name == "Feed Renamed"
+    assert (position, has_more) == ((0, 6), False)
+    
+    db.query(models.ProductChange).update({models.ProductChange.changed_at: datetime(2000, 1, 1)})
+    db.commit()
+    assert changes.prune(db, days=1) == 5
+    with pytest.raises(changes.CursorExpired):
+        crud.get_product_changes(db, (0, 2))
+    with pytest.raises(changes.CursorExpired):
+        crud.get_product_changes(db, (0, 0))
+    assert crud.get_product_changes(db, (0, 6))[0] == []
+
+def test_change_feed_prunes_in_feed_order(db):
+    """Test that pruning never drops an old entry that sorts after a young one, and expires cursors before
+    the oldest entry left"""
+    category = crud.create_category(db, schemas.CategoryCreate(name="Prune Order"))
+    products = [crud.create_product(db, schemas.ProductCreate(name=f"Pruned {i}", price=1.0,
+                                                              category_id=category.id)) for i in range(4)]
+    entries = {entry.product_id: entry for entry in db.query(models.ProductChange)}
+    # The third product's transaction sorts last but logged its entry long ago
+    entries[products[2].id].txid = 9
+    for product in (products[0], products[2]):
+        entries[product.id].changed_at = datetime(2000, 1, 1)
+    db.commit()
+    third = (9, entries[products[2].id].seq)
+    
+    assert changes.prune(db, days=1) == 1
+    assert {entry.product_id for entry in db.query(models.ProductChange)} == {p.id for p in products[1:]}
+    with pytest.raises(changes.CursorExpired):
+        crud.get_product_changes(db, (0, 0))
+    second = (0, entries[products[1].id].seq)
+    page, position, _ = crud.get_product_changes(db, second)
+    assert ([entry.product_id for entry, _ in page], position) == ([products[3].id, products[2].id], third)
+
+def test_change_feed_follows_transaction_order(db):
+    """Test that entries are served in (txid, seq) order, so a transaction that took a lower seq but
+    committed later is not skipped"""
+    category = crud.create_category(db, schemas.CategoryCreate(name="Feed Order"))
+    first = crud.create_product(db, schemas.ProductCreate(name="First", price=1.0, category_id=category.id))
+    start = crud.get_changes_head(db)
+    second = crud.create_product(db, schemas.ProductCreate(name="Second", price=1.0, category_id=category.id))
+    third = crud.create_product(db, schemas.ProductCreate(name="Third", price=1.0, category_id=category.id))
+    # As on PostgreSQL when the second product's transaction started first but committed last
+    db.query(models.ProductChange).filter(models.ProductChange.product_id == second.id).update({"txid": 9})
+    db.query(models.ProductChange).filter(models.ProductChange.product_id == third.id).update({"txid": 7})
+    db.commit()
+    
+    assert crud.get_changes_head(db) == (9, start[1] + 1)
+    page, position, _ = crud.get_product_changes(db, start, limit=1)
+    assert [entry.product_id for entry, _ in page] == [third.id]
+    page, position, has_more = crud.get_product_changes(db, position)
+    assert ([entry.product_id for entry, _ in page], has_more) == ([second.id], False)
+    assert first.id not in [entry.product_id for entry, _ in crud.get_product_changes(db, start)[0]]
+
+def test_catalog_stats_follow_writes(db):
+    """Test that incrementally maintained stats match a full recompute after every kind of write"""
+    laptops = crud.create_category(db, schemas.CategoryCreate(name="Stat Laptops"))
+    phones = crud.create_category(db, schemas.CategoryCreate(name="Stat Phones"))
+    mac = crud.create_product(db, schemas.ProductCreate(name="Mac", brand="Apple", price=1000.0, stock_quantity=2,
+                                                        category_id=laptops.id))
+    phone = crud.create_product(db, schemas.ProductCreate(name="Pixel", brand="Google", price=500.0,
+                                                          stock_quantity=1, category_id=phones.id))
+    payload = json.dumps({"name": "Imported", "brand": "Apple", "price": 20.0, "stock_quantity": 0,
+                          "category_id": phones.id}).encode()
+    asyncio.run(importer.import_stream(db, _chunks(payload, 64), "ndjson"))
+    
+    summary = crud.get_catalog_stats(db)
+    assert (summary["product_count"], summary["stock_units"], summary["out_of_stock"]) == (3, 3, 1)
+    assert summary["inventory_value"] == 2500.0
+    assert summary["brands"][0] == {"brand": "Apple", "product_count": 2, "stock_units": 2, "out_of_stock": 1,
+                                    "inventory_value": 2000.0}
+    
+    crud.decrease_product_stock(db, phone.id, 1)
+    crud.decrease_stock_batch(db, [(mac.id, 1), (mac.id, 1)])
+    crud.update_product_stock(db, phone.id, 4)
+    crud.update_product(db, mac.id, schemas.ProductUpdate(brand="Dell", category_id=phones.id, price=900.0))
+    crud.delete_product(db, phone.id)
+    
+    incremental = crud.get_catalog_stats(db)
+    assert incremental["product_count"] == 2
+    assert incremental["out_of_stock"] == 2
+    assert [c["name"] for c in incremental["categories"]] == ["Stat Phones"]
+    with profiling.count_queries() as queries:
+        stats.recompute(db)
+    # Writers are locked out before the deltas are cleared and the products scanned
+    assert queries.statements[0] == "BEGIN IMMEDIATE"
+    assert crud.get_catalog_stats(db) == incremental
+
+def test_stats_writes_append_and_compact(db):
+    """Test that writes only append stats deltas (no shared row to lock) and compaction folds them in once"""
+    category = crud.create_category(db, schemas.CategoryCreate(name="Compacted"))
+    products = [crud.create_product(db, schemas.ProductCreate(name=f"Compact {i}", brand="Acme", price=10.0,
+                                                              stock_quantity=5, category_id=category.id))
+                for i in range(3)]
+    stats.compact(db)
+    folded = db.query(models.CatalogStat).count()
+    
+    with profiling.count_queries() as queries:
+        for product in products:
+            crud.decrease_product_stock(db, product.id, 2)
+    assert not any("catalog_stats " in statement for statement in queries.statements)
+    assert db.query(models.CatalogStatDelta).count() == 9
+    before = crud.get_catalog_stats(db)
+    assert before["stock_units"] == 9
+    
+    assert stats.compact(db, batch_size=4) == 9
+    assert db.query(models.CatalogStatDelta).count() == 0
+    assert db.query(models.CatalogStat).count() == folded
+    assert crud.get_catalog_stats(db) == before
+    assert stats.compact(db) == 0
+
+def test_stock_reservations_reserve_confirm_release_expire(db):
+    """Test that holds reduce available stock until confirmed, released or expired"""
+    category = crud.create_category(db, schemas.CategoryCreate(name="Reserved"))
+    phone = crud.create_product(db, schemas.ProductCreate(name="Held Phone", price=100.0, stock_quantity=5,
+                                                          category_id=category.id))
+    case = crud.create_product(db, schemas.ProductCreate(name="Held Case", price=10.0, stock_quantity=1,
+                                                         category_id=category.id))
+    
+    reservation, failed = crud.reserve_stock(db, [(phone.id, 2), (case.id, 1), (phone.id, 1)])
+    assert failed == []
+    assert reservation["items"] == [{"product_id": phone.id, "quantity": 3}, {"product_id": case.id, "quantity": 1}]
+    assert crud.get_product_availability(db, phone.id)["available"] == 2
+    # All or nothing: the case is fully held, so the phone is not held either
+    assert crud.reserve_stock(db, [(phone.id, 1), (case.id, 1)]) == (None, [case.id])
+    assert crud.decrease_product_stock(db, case.id, 1) is None
+    
+    assert crud.confirm_reservation(db, reservation["reservation_id"]) == {phone.id: 2, case.id: 0}
+    assert crud.confirm_reservation(db, reservation["reservation_id"]) is None
+    assert crud.get_product_availability(db, phone.id) == {
+        "product_id": phone.id, "stock_quantity": 2, "reserved_quantity": 0, "available": 2
+    }
+    assert crud.get_catalog_stats(db)["stock_units"] == 2
+    
+    stamp = crud.get_product(db, phone.id).updated_at
+    released, _ = crud.reserve_stock(db, [(phone.id, 2)])
+    assert crud.release_reservation(db, released["reservation_id"]) is True
+    assert crud.release_reservation(db, released["reservation_id"]) is False
+    # Holds leave the product (and so its ETag) untouched
+    db.expire_all()
+    assert crud.get_product(db, phone.id).updated_at == stamp
+    
+    expired, _ = crud.reserve_stock(db, [(phone.id, 2)], ttl_seconds=60)
+    db.query(models.StockReservation).update({models.StockReservation.expires_at: datetime(2000, 1, 1)})
+    db.commit()
+    assert crud.expire_reservations(db) == 1
+    assert crud.confirm_reservation(db, expired["reservation_id"]) is None
+    assert crud.get_product_availability(db, phone.id)["available"] == 2
+    assert reservations.resync(db) == 0
+
+def test_concurrent_reservations_never_oversell(db):
+    """Stress test: parallel carts reserving one hot product hold exactly its stock"""
+    category = crud.create_category(db, schemas.CategoryCreate(name="Hot Reservations"))
+    product = crud.create_product(db, schemas.ProductCreate(
+        name="Hot Reserved", price=99.0, stock_quantity=50, category_id=category.id
+    ))
+    held = []
+    
+    def cart():
+        session = TestingSessionLocal()
+        try:
+            for _ in range(5):
+                reservation, _ = crud.reserve_stock(session, [(product.id, 3)])
+                if reservation is not None:
+                    held.append(reservation["reservation_id"])
+        finally:
+            session.close()
+    
+    threads = [threading.Thread(target=cart) for _ in range(16)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    
+    assert len(held) == 16
+    availability = crud.get_product_availability(db, product.id)
+    assert (availability["reserved_quantity"], availability["available"]) == (48, 2)
+    for reservation_id in held[:10]:
+        crud.confirm_reservation(db, reservation_id)
+    db.expire_all()
+    assert crud.get_product_availability(db, product.id)["stock_quantity"] == 20
+
+def test_apply_stock_adjustments_replays_in_order(db):
+    """Test that a coalesced batch gives every adjustment its own result and writes the net stock"""
+    category = crud.create_category(db, schemas.CategoryCreate(name="Coalesced"))
+    product = crud.create_product(db, schemas.ProductCreate(name="Flash Sale", price=10.0, stock_quantity=5,
+                                                            category_id=category.id))
+    crud.reserve_stock(db, [(product.id, 1)])
+    
+    results = crud.apply_stock_adjustments(db, {
+        product.id: [("decrease", 3), ("decrease", 2), ("set", 10), ("decrease", 4)],
+        99999: [("decrease", 1)],
+    })
+    # 5 in stock, 1 reserved: the second decrease would dip into the reservation
+    assert results == {product.id: [2, None, 10, 6], 99999: [None]}
+    assert crud.get_product_availability(db, product.id)["stock_quantity"] == 6
+    assert crud.get_catalog_stats(db)["stock_units"] == 6
+
+def test_coalescer_groups_concurrent_decreases(db):
+    """Stress test: coalesced parallel decrements sell exactly the stock in fewer transactions"""
+    category = crud.create_category(db, schemas.CategoryCreate(name="Coalesced Stress"))
+    product = crud.create_product(db, schemas.ProductCreate(
+        name="Hot Coalesced", price=99.0, stock_quantity=50, category_id=category.id
+    ))
+    stock_coalescer = coalescer.StockCoalescer(TestingSessionLocal, window_ms=20)
+    successes = []
+    
+    def buyer():
+        for _ in range(5):
+            if stock_coalescer.decrease(product.id, 3) is not None:
+                successes.append(3)
+    
+    threads = [threading.Thread(target=buyer) for _ in range(16)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    stock_coalescer.shutdown()
+    
+    assert len(successes) == 16
+    assert crud.get_product_availability(db, product.id)["stock_quantity"] == 2
+    assert stock_coalescer.adjustments == 80
+    assert stock_coalescer.batches < 80
+
+def test_suggest_index_ranks_and_follows_writes(db):
+    """Test that the typeahead index matches word prefixes, ranks them and follows the change feed"""
+    category = crud.create_category(db, schemas.CategoryCreate(name="Typeahead"))
+    def add(name, brand, stock):
+        return crud.create_product(db, schemas.ProductCreate(name=name, price=1.0, stock_quantity=stock,
+                                                             brand=brand, category_id=category.id))
+    pro = add("Zephyr Pro 14", "Zephyrix", 0)
+    air = add("Zephyr Air", "Zephyrix", 5)
+    case = add("Sleeve for Zephyr", "Casey", 5)
+    index = suggest.SuggestIndex()
+    suggest.load(db, index)
+    
+    results = index.suggest("  ZEPH ", limit=4)
+    assert [(entry["kind"], entry["text"]) for entry in results] == [
+        ("brand", "Zephyrix"), ("product", "Zephyr Air"), ("product", "Zephyr Pro 14"),
+        ("product", "Sleeve for Zephyr"),
+    ]
+    assert results[0]["product_count"] >= 2
+    assert [entry["product_id"] for entry in index.suggest("zephyr p")] == [pro.id]
+    
+    crud.update_product(db, case.id, schemas.ProductUpdate(name="Laptop Sleeve"))
+    crud.delete_product(db, air.id)
+    crud.update_product_stock(db, pro.id, 3)
+    suggest.refresh(db, index)
+    assert [entry["text"] for entry in index.suggest("zephyr")] == ["Zephyrix", "Zephyr Pro 14"]
+    assert [entry["product_id"] for entry in index.suggest("sleeve")] == [case.id]
+    assert index.cursor == crud.get_changes_head(db)
+
+def test_reprice_products(db):
+    """Test that repricing updates every matching product in one go and keeps stats in step"""
+    category = crud.create_category(db, schemas.CategoryCreate(name="Repriced"))
+    cheap = crud.create_product(db, schemas.ProductCreate(name="Cable", price=10.0, stock_quantity=4, brand="Wirely",
+                                                          category_id=category.id))
+    dear = crud.create_product(db, schemas.ProductCreate(name="Dock", price=200.0, stock_quantity=1, brand="Wirely",
+                                                         category_id=category.id))
+    other = crud.create_product(db, schemas.ProductCreate(name="Hub", price=50.0, stock_quantity=2, brand="Hubbo",
+                                                          category_id=category.id))
+    head, stamp = crud.get_changes_head(db), dear.updated_at
+    
+    criteria = filtering.ProductFilter(category_ids=[category.id], brands=["Wirely"])
+    with profiling.count_queries() as queries:
+        assert crud.reprice_products(db, criteria, percent=12.5) == (2, [])
+    # One UPDATE over the criteria, not one per chunk of ids
+    updates = [statement for statement in queries.statements if statement.startswith("UPDATE products ")]
+    assert len(updates) == 1 and "products.id IN" not in updates[0]
+    db.expire_all()
+    assert (crud.get_product(db, cheap.id).price, crud.get_product(db, dear.id).price) == (11.25, 225.0)
+    assert crud.get_product(db, other.id).price == 50.0
+    assert crud.get_product(db, dear.id).updated_at > stamp
+    entries, _, _ = crud.get_product_changes(db, head)
+    assert sorted(entry.product_id for entry, _ in entries) == [cheap.id, dear.id]
+    
+    # All or nothing: the cable would go negative, so the dock keeps its price too
+    assert crud.reprice_products(db, criteria, amount=-20) == (None, [cheap.id])
+    db.expire_all()
+    assert crud.get_product(db, dear.id).price == 225.0
+    category_stats = next(entry for entry in crud.get_catalog_stats(db)["categories"] if entry["id"] == category.id)
+    assert category_stats["inventory_value"] == 11.25 * 4 + 225.0 + 50.0 * 2
+    # The CHECK constraint catches a price that reaches zero anyway
+    with pytest.raises(IntegrityError):
+        db.execute(update(models.Product).where(models.Product.id == cheap.id).values(price=0))
+    db.rollback()
+
+def test_update_products_in_bulk(db):
+    """Test batched partial updates, including specs, stats and missing IDs"""
+    category = crud.create_category(db, schemas.CategoryCreate(name="Patched"))
+    first = crud.create_product(db, schemas.ProductCreate(name="Patch One", price=5.0, stock_quantity=1,
+                                                          category_id=category.id, specifications={"RAM": "8GB"}))
+    second = crud.create_product(db, schemas.ProductCreate(name="Patch Two", price=7.0, stock_quantity=0,
+                                                           category_id=category.id))
+    updated, missing = crud.update_products(db, {
+        first.id: {"price": 6.0, "specifications": {"RAM": "16GB"}},
+        second.id: {"stock_quantity": 3, "brand": "Patchy"},
+        99999: {"price": 1.0},
+    })
+    assert (updated, missing) == (2, [99999])
+    db.expire_all()
+    assert crud.get_product(db, first.id).price == 6.0
+    assert crud.get_product(db, first.id).stock_quantity == 1
+    assert (crud.get_product(db, second.id).stock_quantity, crud.get_product(db, second.id).brand) == (3, "Patchy")
+    matches = crud.filter_products(db, filtering.ProductFilter(category_ids=[category.id], specs={"RAM": ["16GB"]}))
+    assert [product.id for product in matches] == [first.id]
+    category_stats = next(entry for entry in crud.get_catalog_stats(db)["categories"] if entry["id"] == category.id)
+    assert (category_stats["stock_units"], category_stats["out_of_stock"]) == (4, 0)
+    assert category_stats["inventory_value"] == 6.0 + 21.0
+
+def test_product_list_query_budget(db, max_queries):
+    """N+1 guard: listing products and reading their categories takes a fixed number of statements"""
+    for index in range(3):
+        category = crud.create_category(db, schemas.CategoryCreate(name=f"Budget {index}"))
+        for _ in range(3):
+            crud.create_product(db, schemas.ProductCreate(name="Budget Item", price=1.0, category_id=category.id))
+    db.expire_all()
+    
+    with max_queries(2) as counted:
+        products = crud.get_products(db, limit=100)
+        names = {product.category.name for product in products}
+    assert len(names) == 3
+    assert len(counted.statements) == counted.count
+    with pytest.raises(AssertionError, match="expected at most 0"):
+        with max_queries(0):
+            crud.get_products_by_ids(db, [product.id for product in products])
+
+def test_slow_queries_are_logged(db, monkeypatch, caplog):
+    """Test that statements over SLOW_QUERY_MS are logged"""
+    monkeypatch.setattr(profiling, "SLOW_QUERY_MS", 1e-9)
+    with caplog.at_level("WARNING", logger="profiling"):
+        crud.get_categories(db)
+    assert any("Slow query" in record.message and "FROM categories" in record.message for record in caplog.records)
+
+def test_routing_session_reads_replica_until_it_writes(tmp_path):
+    """Test read/write splitting against two SQLite files standing in for a primary and a lagging replica"""
+    primary = create_engine(f"sqlite:///{tmp_path / 'primary.db'}")
+    replica = create_engine(f"sqlite:///{tmp_path / 'replica.db'}")
+    for target, name in ((primary, "Fresh"), (replica, "Stale")):
+        Base.metadata.create_all(bind=target)
+        with sessionmaker(bind=target)() as session:
+            session.add(models.Category(id=1, name=name))
+            session.commit()
+    
+    session = database.RoutingSession(bind=primary, replica=replica)
+    assert crud.get_category(session, 1).name == "Stale"
+    # The cache outlives the request, so it is filled from the primary
+    cache.category_cache.invalidate(1)
+    assert crud.get_category_cached(session, 1).name == "Fresh"
+    cache.category_cache.invalidate(1)
+    assert not session.wrote and crud.get_category(session, 1).name == "Stale"
+    assert session.execute(select(models.Category.name).with_for_update()).scalar() == "Fresh"
+    written = crud.create_category(session, schemas.CategoryCreate(name="Written"))
+    assert session.wrote
+    # Read-your-writes: after writing, the session reads from the primary
+    session.expire_all()
+    assert crud.get_category(session, 1).name == "Fresh"
+    assert crud.get_category(session, written.id).name == "Written"
+    session.close()
+    with sessionmaker(bind=replica)() as on_replica:
+        assert crud.get_category_by_name(on_replica, "Written") is None
+    
+    session = database.RoutingSession(bind=primary, replica=replica, read_your_writes=False)
+    session.execute(update(models.Category).where(models.Category.id == 1).values(description="primary"))
+    session.commit()
+    assert crud.get_category(session, 1).description is None
+    session.close()
+
+def test_admission_classifies_routes():
+    """Test that requests are classed by method and path, and health checks are never held back"""
+    assert admission.classify("PATCH", "/products/7/stock/decrease") == "stock"
+    assert admission.classify("POST", "/products/stock/decrease") == "stock"
+    assert admission.classify("POST", "/reservations") == "stock"
+    assert admission.classify("GET", "/products/7/availability") == "stock"
+    assert admission.classify("POST", "/products/") == "write"
+    assert admission.classify("PATCH", "/products/bulk") == "write"
+    assert admission.classify("GET", "/products/7") == "detail"
+    assert admission.classify("POST", "/products/batch") == "detail"
+    assert admission.classify("GET", "/products/suggest") == "detail"
+    assert admission.classify("GET", "/products/search/") == "listing"
+    assert admission.classify("GET", "/products/stock/available") == "listing"
+    assert admission.classify("GET", "/health") is None
+
+def test_admission_sheds_low_priority_first():
+    """Test that freed slots go to stock before listings, and that full queues and long waits are rejected"""
+    classes = {name: admission.RequestClass(name, limit, queue, timeout) for name, limit, queue, timeout in (
+        ("stock", 2, 5, 5.0), ("write", 1, 1, 5.0), ("detail", 2, 2, 5.0), ("listing", 2, 1, 5.0))}
+    controller = admission.AdmissionController(2, classes)
+    order = []
+    
+    async def scenario():
+        assert await controller.acquire("listing") is None
+        assert await controller.acquire("listing") is None
+        # Both slots are taken: one listing may wait, the next is turned away at once
+        waiting_listing = asyncio.create_task(controller.acquire("listing"))
+        await asyncio.sleep(0)
+        assert await controller.acquire("listing") == "queue_full"
+        waiting_stock = asyncio.create_task(controller.acquire("stock"))
+        await asyncio.sleep(0)
+        for task, name in ((waiting_listing, "listing"), (waiting_stock, "stock")):
+            task.add_done_callback(lambda _, name=name: order.append(name))
+        
+        controller.release("listing")
+        assert await waiting_stock is None
+        assert not waiting_listing.done()
+        controller.release("listing")
+        assert await waiting_listing is None
+        
+        classes["detail"].timeout = 0.01
+        assert await controller.acquire("detail") == "timeout"
+        controller.release("stock")
+        controller.release("listing")
+    
+    asyncio.run(scenario())
+    assert order == ["stock", "listing"]
+    assert controller.active == 0
+    stats = controller.stats()
+    assert stats["listing"]["rejected"] == {"queue_full": 1, "timeout": 0}
+    assert stats["detail"]["rejected"] == {"queue_full": 0, "timeout": 1}
+    assert stats["stock"]["queued"] == 1 and stats["stock"]["admitted"] == 1
+    assert "admission_rejected_total" in metrics.render(admission=stats)
+
+BASELINE_SCHEMA = [
+    """CREATE TABLE categories (id INTEGER PRIMARY KEY, name VARCHAR(100) NOT NULL UNIQUE, description TEXT)""",
+    """CREATE TABLE products (
+        id INTEGER PRIMARY KEY, name VARCHAR(255) NOT NULL, description TEXT, price FLOAT NOT NULL,
+        stock_quantity INTEGER, brand VARCHAR(100), category_id INTEGER REFERENCES categories (id),
+        specifications JSON, image_url VARCHAR(500), created_at DATETIME, updated_at DATETIME
+    )""",
+    "CREATE INDEX ix_products_id ON products (id)",
+    "CREATE INDEX ix_categories_id ON categories (id)",
+    "INSERT INTO categories (id, name) VALUES (1, 'Legacy')",
+    """INSERT INTO products (id, name, price, stock_quantity, brand, category_id)
+       VALUES (1, 'Legacy Laptop Pro', 999.0, 3, 'Dell', 1)""",
+]
+
+def _baseline_engine(tmp_path):
+    """A database created by the first release of the service, with one product"""
+    engine = create_engine(f"sqlite:///{tmp_path / 'baseline.db'}")
+    with engine.begin() as connection:
+        for statement in BASELINE_SCHEMA:
+            connection.exec_driver_sql(statement)
+    return engine
+
+def test_upgrade_schema_adds_missing_indexes(tmp_path):
+    """Test that upgrading an existing database adds the new tables, columns and indexes, once"""
+    engine = _baseline_engine(tmp_path)
+    with engine.begin() as connection:
+        created = database.upgrade_schema(connection)
+    assert "product_specs" in created
+    assert "products.reserved_quantity" in created
+    assert "ix_products_category_id_id" in created
+    indexes = {index["name"] for index in inspect(engine).get_indexes("products")}
+    assert {index.name for index in models.Product.__table__.indexes if index.name != "ix_products_search"} <= indexes
+    with engine.begin() as connection:
+        assert database.upgrade_schema(connection) == []
+
+def test_upgraded_database_can_search(tmp_path):
+    """Test that upgrading a database from before full-text search indexes its products and keeps them in sync"""
+    engine = _baseline_engine(tmp_path)
+    with engine.begin() as connection:
+        assert "products_fts" in database.upgrade_schema(connection)
+    db = sessionmaker(bind=engine)()
+    assert [product.name for product in crud.search_products(db, "legacy lap")] == ["Legacy Laptop Pro"]
+    crud.update_product(db, 1, schemas.ProductUpdate(name="Renamed Notebook"))
+    assert crud.search_products(db, "legacy") == []
+    assert [product.id for product in crud.search_products(db, "notebook")] == [1]
+    search.rebuild_index(db)
+    db.close()
+
+def test_postgres_search_pages_on_double_precision_scores():
+    """Test that the PostgreSQL keyset compares the float4 rank as a double on both sides, as the cursor holds it"""
+    from sqlalchemy.dialects import postgresql
+    
+    score = search._postgres_score(func.to_tsquery(search.TS_CONFIG, "'mac':*"))
+    page = search._ranked(select(models.Product.id), score, 0, 10, [-0.1, 5])
+    sql = str(page.compile(dialect=postgresql.dialect()))
+    assert sql.count("AS FLOAT(53))") == 3  # ORDER BY, comparison and the cursor's score
+    assert "ORDER BY CAST(-ts_rank_cd(" in sql
+
+def test_stock_overwrites_respect_reservations(db):
+    """Test that stock cannot be overwritten below the reserved quantity, whichever path sets it"""
+    category = crud.create_category(db, schemas.CategoryCreate(name="Reserved Overwrites"))
+    product = crud.create_product(db, schemas.ProductCreate(name="Held Console", price=500.0, stock_quantity=5,
+                                                            category_id=category.id))
+    reservation, _ = crud.reserve_stock(db, [(product.id, 4)])
+    
+    with pytest.raises(reservations.StockBelowReserved) as raised:
+        crud.update_product(db, product.id, schemas.ProductUpdate(stock_quantity=1))
+    assert raised.value.product_ids == [product.id]
+    with pytest.raises(reservations.StockBelowReserved):
+        crud.update_product_stock(db, product.id, 3)
+    with pytest.raises(reservations.StockBelowReserved):
+        crud.update_products(db, {product.id: {"stock_quantity": 0, "price": 1.0}})
+    assert crud.apply_stock_adjustments(db, {product.id: [("set", 1), ("set", 4)]}) == {product.id: [None, 4]}
+    assert crud.update_product_stock(db, product.id, 6).stock_quantity == 6
+    
+    assert crud.confirm_reservation(db, reservation["reservation_id"]) == {product.id: 2}
+    assert crud.get_product_availability(db, product.id) == {
+        "product_id": product.id, "stock_quantity": 2, "reserved_quantity": 0, "available": 2
+    }
+    # The CHECK constraint catches writes that bypass crud
+    crud.reserve_stock(db, [(product.id, 2)])
+    with pytest.raises(IntegrityError):
+        db.execute(update(models.Product).where(models.Product.id == product.id).values(stock_quantity=1))
+    db.rollback()
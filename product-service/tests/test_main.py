@@ -1,5 +1,11 @@
+import uuid
+import pytest
 from fastapi.testclient import TestClient
 from main import app
+from pagination import encode_cursor
+
+# The app runs against a scratch SQLite database set up in conftest.py
+pytestmark = pytest.mark.usefixtures("app_database")
 
 client = TestClient(app)
 
@@ -121,3 +127,392 @@ def test_pagination():
     assert response.status_code == 200
     products = response.json()
     assert len(products) <= 5
+
+def test_cursor_pagination():
+    """Test following X-Next-Cursor through the product listings"""
+    category_id = client.post("/categories/", json={"name": f"Test Cursor {uuid.uuid4().hex[:8]}"}).json()["id"]
+    ids = [
+        client.post("/products/", json={"name": f"Cursor {i}", "price": 10.0, "category_id": category_id}).json()["id"]
+        for i in range(3)
+    ]
+    
+    first = client.get(f"/products/category/{category_id}?limit=2")
+    assert [product["id"] for product in first.json()] == ids[:2]
+    cursor = first.headers.get("X-Next-Cursor")
+    assert cursor
+    second = client.get(f"/products/category/{category_id}?limit=2&cursor={cursor}")
+    assert second.status_code == 200
+    assert [product["id"] for product in second.json()] == ids[2:]
+    assert "X-Next-Cursor" not in second.headers
+    
+    # The full listing pages the same way, starting after the last id of the previous page
+    first = client.get("/products/?limit=1")
+    assert first.headers.get("X-Next-Cursor")
+    second = client.get(f"/products/?limit=1&cursor={first.headers['X-Next-Cursor']}")
+    assert second.json()[0]["id"] > first.json()[0]["id"]
+
+def test_invalid_cursor():
+    """Test that a malformed cursor is rejected"""
+    response = client.get("/products/?cursor=not-a-cursor")
+    assert response.status_code == 400
+
+def test_decrease_stock_batch():
+    """Test the multi-line order stock decrement"""
+    category_id = client.post("/categories/", json={"name": f"Test Batch Stock {uuid.uuid4().hex[:8]}"}).json()["id"]
+    product_id = client.post(
+        "/products/",
+        json={"name": "Batch Stock Phone", "price": 100.0, "stock_quantity": 4, "category_id": category_id}
+    ).json()["id"]
+    
+    response = client.post("/products/stock/decrease", json={"items": [{"product_id": product_id, "quantity": 3}]})
+    assert response.status_code == 200
+    assert response.json()["items"] == [{"product_id": product_id, "new_quantity": 1}]
+    
+    response = client.post("/products/stock/decrease", json={"items": [{"product_id": product_id, "quantity": 3}]})
+    assert response.status_code == 400
+    assert response.json()["detail"]["product_ids"] == [product_id]
+
+def test_import_products_ndjson():
+    """Test the streaming bulk import endpoint"""
+    category_id = client.post("/categories/", json={"name": f"Test Import {uuid.uuid4().hex[:8]}"}).json()["id"]
+    body = "\n".join([
+        f'{{"name": "Imported Laptop", "price": 999.0, "category_id": {category_id}}}',
+        '{"name": "Broken"}',
+    ])
+    response = client.post(
+        "/products/import", content=body, headers={"Content-Type": "application/x-ndjson"}
+    )
+    assert response.status_code == 200
+    report = response.json()
+    assert report["imported"] == 1
+    assert report["failed"] == 1
+    assert report["errors"][0]["row"] == 2
+
+def test_import_overlong_line_is_rejected(monkeypatch):
+    """Test that a line over the import line limit gets 413"""
+    import importer
+    
+    monkeypatch.setattr(importer, "MAX_LINE_LENGTH", 100)
+    body = '{"name": "' + "x" * 200 + '"}'
+    response = client.post("/products/import", content=body, headers={"Content-Type": "application/x-ndjson"})
+    assert response.status_code == 413
+    assert response.json()["detail"]["imported"] == 0
+
+def test_export_products():
+    """Test streaming the catalog as NDJSON and CSV"""
+    response = client.get("/products/export")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    
+    response = client.get("/products/export?format=csv")
+    assert response.status_code == 200
+    assert response.text.splitlines()[0].startswith("id,name,description")
+
+def test_cache_stats():
+    """Test that repeated product reads are served from the cache"""
+    category_id = client.post("/categories/", json={"name": f"Test Cache {uuid.uuid4().hex[:8]}"}).json()["id"]
+    product_id = client.post(
+        "/products/", json={"name": "Cached Phone", "price": 10.0, "category_id": category_id}
+    ).json()["id"]
+    
+    client.get(f"/products/{product_id}")
+    hits = client.get("/cache/stats").json()["products"]["hits"]
+    client.get(f"/products/{product_id}")
+    assert client.get("/cache/stats").json()["products"]["hits"] == hits + 1
+
+def test_read_products_batch():
+    """Test the batch lookup endpoint in both GET and POST form"""
+    category_id = client.post("/categories/", json={"name": f"Test Batch Get {uuid.uuid4().hex[:8]}"}).json()["id"]
+    ids = [
+        client.post("/products/", json={"name": name, "price": 5.0, "category_id": category_id}).json()["id"]
+        for name in ("Batch A", "Batch B")
+    ]
+    
+    response = client.get(f"/products/batch?ids={ids[1]},{ids[0]},99999")
+    assert response.status_code == 200
+    assert [p["id"] for p in response.json()["products"]] == [ids[1], ids[0]]
+    assert response.json()["missing"] == [99999]
+    
+    response = client.post("/products/batch", json={"ids": ids})
+    assert [p["id"] for p in response.json()["products"]] == ids
+    
+    assert client.get("/products/batch?ids=1,abc").status_code == 400
+
+def test_read_products_field_projection():
+    """Test returning only selected product fields"""
+    response = client.get("/products/?fields=name,price&limit=5")
+    assert response.status_code == 200
+    for product in response.json():
+        assert set(product) == {"id", "name", "price"}
+    
+    assert client.get("/products/?fields=name,password").status_code == 400
+
+def test_metrics():
+    """Test the Prometheus metrics endpoint"""
+    client.get("/products/?limit=5")
+    client.get("/products/999999")
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    body = response.text
+    assert 'http_requests_total{method="GET",route="/products/",status="200"}' in body
+    assert 'http_requests_total{method="GET",route="/products/{product_id}",status="404"}' in body
+    assert 'http_request_duration_quantile_seconds{method="GET",route="/products/",quantile="0.99"}' in body
+    assert 'db_pool_checked_out{engine="sync"}' in body
+    assert "http_requests_in_flight 1" in body
+    # Every metric family is documented
+    typed = [line.split()[2] for line in body.splitlines() if line.startswith("# TYPE ")]
+    helped = {line.split()[2] for line in body.splitlines() if line.startswith("# HELP ")}
+    assert "cache_hits_total" in typed and set(typed) <= helped
+
+def test_filter_products():
+    """Test the faceted filter endpoint"""
+    category_id = client.post("/categories/", json={"name": f"Test Filter {uuid.uuid4().hex[:8]}"}).json()["id"]
+    for price in (300.0, 100.0, 200.0):
+        client.post("/products/", json={"name": "Filter Phone", "price": price, "brand": "FilterBrand",
+                                         "stock_quantity": 1, "category_id": category_id})
+    
+    response = client.get(f"/products/filter?category_id={category_id}&brand=FilterBrand&sort=price_asc&limit=2")
+    assert response.status_code == 200
+    data = response.json()
+    assert data["total"] == 3
+    assert [p["price"] for p in data["products"]] == [100.0, 200.0]
+    assert {"value": "FilterBrand", "count": 3} in data["facets"]["brands"]
+    
+    next_page = client.get(f"/products/filter?category_id={category_id}&sort=price_asc&limit=2&facets=false"
+                           f"&cursor={response.headers['X-Next-Cursor']}")
+    assert [p["price"] for p in next_page.json()["products"]] == [300.0]
+    assert next_page.json()["facets"] is None
+    
+    assert client.get("/products/filter?sort=cheapest").status_code == 400
+
+def test_filter_products_by_specification():
+    """Test filtering on specification attributes"""
+    category_id = client.post("/categories/", json={"name": f"Test Specs {uuid.uuid4().hex[:8]}"}).json()["id"]
+    for ram, storage in (("16GB", "512GB"), ("16GB", "1TB"), ("8GB", "512GB")):
+        client.post("/products/", json={"name": f"Spec Laptop {ram} {storage}", "price": 999.0,
+                                         "category_id": category_id,
+                                         "specifications": {"RAM": ram, "Storage": storage}})
+    
+    response = client.get(f"/products/filter?category_id={category_id}&spec.RAM=16GB&spec.Storage=512GB")
+    assert response.status_code == 200
+    assert [p["name"] for p in response.json()["products"]] == ["Spec Laptop 16GB 512GB"]
+    
+    response = client.get(f"/products/filter?category_id={category_id}&spec.Storage=512GB&spec.Storage=1TB"
+                          f"&spec.RAM=16GB")
+    assert response.json()["total"] == 2
+
+def test_conditional_get_with_etag():
+    """Test ETag / If-None-Match on a product and a product list"""
+    category_id = client.post("/categories/", json={"name": f"Test ETag {uuid.uuid4().hex[:8]}"}).json()["id"]
+    product_id = client.post("/products/", json={"name": "ETag Phone", "price": 10.0,
+                                                 "category_id": category_id}).json()["id"]
+    
+    response = client.get(f"/products/{product_id}")
+    etag = response.headers["ETag"]
+    assert "must-revalidate" in response.headers["Cache-Control"]
+    response = client.get(f"/products/{product_id}", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.content == b""
+    
+    list_etag = client.get(f"/products/category/{category_id}").headers["ETag"]
+    assert client.get(f"/products/category/{category_id}", headers={"If-None-Match": list_etag}).status_code == 304
+    
+    client.put(f"/products/{product_id}", json={"price": 12.0})
+    assert client.get(f"/products/{product_id}", headers={"If-None-Match": etag}).status_code == 200
+    assert client.get(f"/products/category/{category_id}", headers={"If-None-Match": list_etag}).status_code == 200
+
+def test_product_change_feed():
+    """Test that the change feed returns only new changes, with tombstones for deletes"""
+    cursor = client.get("/products/changes").json()["cursor"]
+    category_id = client.post("/categories/", json={"name": f"Test Changes {uuid.uuid4().hex[:8]}"}).json()["id"]
+    kept = client.post("/products/", json={"name": "Feed Kept", "price": 10.0, "category_id": category_id}).json()
+    gone = client.post("/products/", json={"name": "Feed Gone", "price": 10.0, "category_id": category_id}).json()
+    client.put(f"/products/{kept['id']}", json={"price": 11.0})
+    client.delete(f"/products/{gone['id']}")
+    
+    response = client.get(f"/products/changes?since={cursor}")
+    assert response.status_code == 200
+    feed = response.json()
+    # One entry per product, in the order of its latest change
+    assert [(c["product_id"], c["op"]) for c in feed["changes"]] == [(kept["id"], "upsert"), (gone["id"], "delete")]
+    assert feed["changes"][0]["product"]["price"] == 11.0
+    assert feed["changes"][1]["product"] is None
+    assert client.get(f"/products/changes?since={feed['cursor']}").json()["changes"] == []
+    assert client.get("/products/changes?since=not-a-cursor").status_code == 400
+    assert client.get(f"/products/changes?since={encode_cursor([1])}").status_code == 400
+
+def test_catalog_stats():
+    """Test that /stats reflects product writes"""
+    category_id = client.post("/categories/", json={"name": f"Test Stats {uuid.uuid4().hex[:8]}"}).json()["id"]
+    before = client.get("/stats").json()
+    product_id = client.post("/products/", json={"name": "Stat Monitor", "price": 200.0, "stock_quantity": 3,
+                                                 "category_id": category_id}).json()["id"]
+    client.patch(f"/products/{product_id}/stock/decrease?qty=3")
+    
+    response = client.get("/stats")
+    assert response.status_code == 200
+    after = response.json()
+    assert after["product_count"] == before["product_count"] + 1
+    assert after["out_of_stock"] == before["out_of_stock"] + 1
+    assert after["stock_units"] == before["stock_units"]
+    category = next(c for c in after["categories"] if c["id"] == category_id)
+    assert (category["product_count"], category["inventory_value"]) == (1, 0.0)
+
+def test_lifespan_prewarms_pool(monkeypatch):
+    """Test that startup opens DB_POOL_PREWARM connections and shutdown closes them"""
+    import database
+    monkeypatch.setattr(database, "DB_POOL_PREWARM", 2)
+    with TestClient(app) as started:
+        assert database.get_engine().pool.checkedin() >= 2
+        assert started.get("/health").status_code == 200
+    # Shutdown disposed the engine; the next request builds a new one
+    assert client.get("/products/?limit=1").status_code == 200
+
+def test_stock_reservation_flow():
+    """Test reserving, confirming and releasing stock over the API"""
+    category_id = client.post("/categories/", json={"name": f"Test Reserve {uuid.uuid4().hex[:8]}"}).json()["id"]
+    product_id = client.post("/products/", json={"name": "Reserved Tablet", "price": 300.0, "stock_quantity": 3,
+                                                 "category_id": category_id}).json()["id"]
+    
+    response = client.post("/reservations", json={"items": [{"product_id": product_id, "quantity": 2}],
+                                                  "ttl_seconds": 60})
+    assert response.status_code == 201
+    reservation_id = response.json()["reservation_id"]
+    assert client.get(f"/products/{product_id}/availability").json()["available"] == 1
+    response = client.post("/reservations", json={"items": [{"product_id": product_id, "quantity": 2}]})
+    assert response.status_code == 400
+    assert response.json()["detail"]["product_ids"] == [product_id]
+    
+    response = client.post(f"/reservations/{reservation_id}/confirm")
+    assert response.status_code == 200
+    assert response.json()["items"] == [{"product_id": product_id, "new_quantity": 1}]
+    assert client.post(f"/reservations/{reservation_id}/confirm").status_code == 404
+    
+    response = client.post("/reservations", json={"items": [{"product_id": product_id, "quantity": 1}]})
+    reservation_id = response.json()["reservation_id"]
+    assert client.delete(f"/reservations/{reservation_id}").status_code == 204
+    assert client.get(f"/products/{product_id}/availability").json() == {
+        "product_id": product_id, "stock_quantity": 1, "reserved_quantity": 0, "available": 1
+    }
+
+def test_suggest_products():
+    """Test typeahead suggestions for new, renamed and deleted products"""
+    category = client.post("/categories/", json={"name": f"Suggest {uuid.uuid4().hex[:8]}"}).json()
+    word = f"qz{uuid.uuid4().hex[:6]}"
+    product = client.post("/products/", json={"name": f"{word.title()} Speaker", "price": 49.0,
+                                              "stock_quantity": 2, "category_id": category["id"]}).json()
+    response = client.get(f"/products/suggest?prefix={word[:5]}")
+    assert response.status_code == 200
+    assert response.json() == [{"text": f"{word.title()} Speaker", "kind": "product",
+                                "product_id": product["id"], "product_count": 1}]
+    assert client.get("/products/suggest?prefix=speak").status_code == 200
+    
+    client.put(f"/products/{product['id']}", json={"name": "Renamed Speaker"})
+    assert client.get(f"/products/suggest?prefix={word}").json() == []
+    client.delete(f"/products/{product['id']}")
+    assert client.get("/products/suggest?prefix=renamed speaker").json() == []
+    assert client.get("/products/suggest?prefix=").status_code == 422
+
+def test_bulk_update_and_reprice():
+    """Test bulk partial updates and repricing a brand"""
+    category = client.post("/categories/", json={"name": f"Bulk {uuid.uuid4().hex[:8]}"}).json()
+    brand = f"Bulk {uuid.uuid4().hex[:6]}"
+    ids = [client.post("/products/", json={"name": f"Bulk Item {index}", "price": 100.0, "stock_quantity": 1,
+                                           "brand": brand, "category_id": category["id"]}).json()["id"]
+           for index in range(3)]
+    
+    response = client.patch("/products/bulk", json={"items": [{"id": ids[0], "stock_quantity": 9},
+                                                              {"id": ids[1], "name": "Bulk Renamed"},
+                                                              {"id": 99999999, "price": 1.0}]})
+    assert response.status_code == 200
+    assert response.json() == {"updated": 2, "missing": [99999999]}
+    assert client.get(f"/products/{ids[0]}").json()["stock_quantity"] == 9
+    assert client.get(f"/products/{ids[1]}").json()["name"] == "Bulk Renamed"
+    
+    response = client.post("/products/reprice", json={"brands": [brand], "percent": -10})
+    assert response.json() == {"updated": 3, "missing": []}
+    assert [client.get(f"/products/{product_id}").json()["price"] for product_id in ids] == [90.0, 90.0, 90.0]
+    response = client.post("/products/reprice", json={"brands": [brand], "amount": -90})
+    assert response.status_code == 400
+    assert response.json()["detail"]["product_ids"] == ids
+    assert client.post("/products/reprice", json={"percent": 5}).status_code == 400
+    assert client.post("/products/reprice", json={"brands": [brand], "percent": 5, "amount": 1}).status_code == 400
+
+def test_query_budgets(query_count):
+    """Pin the statements the hot routes run, so N+1 regressions fail here"""
+    category = client.post("/categories/", json={"name": f"Budget {uuid.uuid4().hex[:8]}"}).json()
+    ids = [client.post("/products/", json={"name": f"Budget {index}", "price": 10.0, "stock_quantity": 5,
+                                           "category_id": category["id"]}).json()["id"] for index in range(5)]
+    
+    assert query_count(client.get("/products/?limit=100")) <= 3
+    assert query_count(client.get(f"/products/category/{category['id']}")) <= 3
+    assert query_count(client.get("/products/batch?ids=" + ",".join(map(str, ids)))) <= 2
+    assert query_count(client.get(f"/products/filter?category_id={category['id']}")) <= 7
+    assert query_count(client.get(f"/products/{ids[0]}")) <= 1
+    response = client.put(f"/products/{ids[0]}", json={"price": 12.0})
+    assert response.status_code == 200
+    assert query_count(response) <= 5
+    assert float(response.headers["X-Query-Time-Ms"]) >= 0
+
+def test_reads_go_to_replica(monkeypatch, tmp_path):
+    """Test that GET requests read from a replica while writes go to the primary"""
+    import database
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import sessionmaker
+    from models import Category
+    written = client.post("/categories/", json={"name": f"Primary {uuid.uuid4().hex[:8]}"})
+    assert written.status_code == 201
+    primary = written.json()
+    # The replica has the same row under another name, so each response shows where it was read
+    replica = create_engine(f"sqlite:///{tmp_path / 'replica.db'}", connect_args={"check_same_thread": False})
+    database.Base.metadata.create_all(bind=replica)
+    with sessionmaker(bind=replica)() as session:
+        session.add(Category(id=primary["id"], name="Replica Copy"))
+        session.commit()
+    monkeypatch.setattr(database, "_read_engines", [replica])
+    if database.DB_ASYNC:
+        from sqlalchemy.ext.asyncio import create_async_engine
+        monkeypatch.setattr(database, "_async_read_engines",
+                            [create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'replica.db'}")])
+    
+    listing = client.get("/categories/")
+    assert listing.status_code == 200
+    assert [(category["id"], category["name"]) for category in listing.json()] == [(primary["id"], "Replica Copy")]
+    # Detail reads fill the cache, so they come from the primary
+    detail = client.get(f"/categories/{primary['id']}")
+    assert detail.status_code == 200
+    assert detail.json() == primary
+
+def test_overloaded_listing_is_shed(monkeypatch):
+    """Test that a class at its limit answers 503 with Retry-After while other routes keep working"""
+    import admission
+    classes = {name: admission.RequestClass.from_env(name) for name in admission.PRIORITY}
+    classes["listing"] = admission.RequestClass("listing", limit=0, queue=0, timeout=0.1)
+    monkeypatch.setattr(admission, "controller", admission.AdmissionController(40, classes))
+    
+    response = client.get("/products/search/", params={"q": "laptop"})
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == str(admission.RETRY_AFTER_SECONDS)
+    assert client.get("/health").status_code == 200
+    assert client.get("/products/999999").status_code == 404
+    body = client.get("/metrics").text
+    assert 'admission_rejected_total{class="listing",reason="queue_full"} 1' in body
+    assert 'http_requests_total{method="GET",route="admission:listing",status="503"} 1' in body
+
+def test_stock_overwrite_below_reserved_is_rejected():
+    """Test that PUT and PATCH .../stock cannot drop stock below an open reservation"""
+    category_id = client.post("/categories/", json={"name": f"Test Held {uuid.uuid4().hex[:8]}"}).json()["id"]
+    product_id = client.post("/products/", json={"name": "Held Camera", "price": 700.0, "stock_quantity": 5,
+                                                 "category_id": category_id}).json()["id"]
+    reservation_id = client.post("/reservations", json={"items": [{"product_id": product_id, "quantity": 4}]}
+                                 ).json()["reservation_id"]
+    
+    response = client.put(f"/products/{product_id}", json={"stock_quantity": 1})
+    assert response.status_code == 409
+    assert response.json()["detail"]["product_ids"] == [product_id]
+    assert client.patch(f"/products/{product_id}/stock", params={"quantity": 1}).status_code == 409
+    assert client.patch("/products/bulk", json={"items": [{"id": product_id, "stock_quantity": 1}]}
+                        ).status_code == 409
+    assert client.post(f"/reservations/{reservation_id}/confirm").status_code == 200
+    assert client.get(f"/products/{product_id}/availability").json()["stock_quantity"] == 1